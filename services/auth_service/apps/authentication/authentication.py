@@ -0,0 +1,19 @@
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework_simplejwt import authentication
+from apps.users import activity
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """
+    JWT authentication that records the user as seen, see apps/users/activity.py
+    """
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            activity.seen(result[0])
+        return result
+
+class JWTAuthenticationScheme(SimpleJWTScheme):
+    """
+    Document JWTAuthentication as the same `jwtAuth` bearer scheme
+    """
+    target_class = JWTAuthentication
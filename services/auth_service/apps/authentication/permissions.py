@@ -0,0 +1,47 @@
+from rest_framework import permissions
+from apps.users import authorization
+from apps.users.models import User
+
+class TokenClaimPermission(permissions.BasePermission):
+    """
+    Base class for permissions checked against JWT claims, without database queries
+    """
+    message = "Your token does not grant access to this resource."
+
+    def has_permission(self, request, view):
+        claims = getattr(request, 'auth', None)
+        if claims is None or not hasattr(claims, 'get'):
+            return False
+        user_id = claims.get('user_id')
+        if not authorization.is_current(user_id, claims.get('pv')):
+            self.message = "Your permissions have changed, please log in again."
+            return False
+        return self.check_claims(claims, view)
+
+    def check_claims(self, claims, view):
+        raise NotImplementedError
+
+class HasRole(TokenClaimPermission):
+    """
+    Allow tokens whose role claim is one of `roles`
+    """
+    roles = ()
+
+    def check_claims(self, claims, view):
+        return claims.get('role') in self.roles
+
+class IsVendor(HasRole):
+    roles = (User.UserRoleChoice.VENDOR, User.UserRoleChoice.ADMIN)
+
+class IsAdminRole(HasRole):
+    roles = (User.UserRoleChoice.ADMIN,)
+
+class HasTokenPermissions(TokenClaimPermission):
+    """
+    Allow tokens whose perms claim contains every permission listed in the view's `required_permissions`
+    """
+    def check_claims(self, claims, view):
+        granted = set(claims.get('perms') or ())
+        if authorization.ALL_PERMISSIONS in granted:
+            return True
+        return all(perm in granted for perm in getattr(view, 'required_permissions', ()))
@@ -1,9 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
+from apps.users.serializers import CanonicalEmailField
 
 class LoginSerializer(serializers.Serializer):
-    email = serializers.EmailField()
+    email = CanonicalEmailField()
     password = serializers.CharField()
     
     def validate(self, attrs):
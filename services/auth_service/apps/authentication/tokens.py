@@ -0,0 +1,38 @@
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from apps.users import authorization, sharding
+
+class RefreshToken(tokens.RefreshToken):
+    """
+    Refresh token that embeds the user's role, permissions and permission version.
+    The claims are copied to access tokens derived from it. With sharding enabled its
+    blacklist rows are kept on the owner's shard.
+    """
+    @classmethod
+    def for_user(cls, user):
+        with sharding.pin_user(user.pk):
+            token = super().for_user(user)
+        for claim, value in authorization.token_claims(user).items():
+            token[claim] = value
+        return token
+
+    def _owner_id(self):
+        return self.payload.get(api_settings.USER_ID_CLAIM)
+
+    def blacklist(self):
+        # Every refresh token we issue already has an outstanding row, so look it up by jti
+        # instead of loading the user first. Tokens without one go through simplejwt.
+        with sharding.pin_user(self._owner_id()):
+            token = OutstandingToken.objects.filter(jti=self.payload[api_settings.JTI_CLAIM]).first()
+            if token is None:
+                return super().blacklist()
+            return BlacklistedToken.objects.get_or_create(token=token)
+
+    def check_blacklist(self):
+        with sharding.pin_user(self._owner_id()):
+            return super().check_blacklist()
+
+    def outstand(self):
+        with sharding.pin_user(self._owner_id()):
+            return super().outstand()
@@ -1,6 +1,7 @@
 from rest_framework import status, permissions
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import (
     LoginSerializer,
@@ -9,24 +10,36 @@ from .serializers import (
 from rest_framework.generics import GenericAPIView
 from drf_spectacular.utils import extend_schema
 from rest_framework.response import Response
-from apps.users.serializers import UserSerializer
+from apps.users.serializers import user_representation
+from apps.users import activity, archive, audit, funnel
+from apps.users.managers import canonical_email
 from apps.users.models import User
+from apps.core import tracing
+from apps.core.querybudget import query_budget
 from django.conf import settings
-import requests
 
 class LoginView(TokenObtainPairView):
     serializer_class = LoginSerializer
     permission_classes = [permissions.AllowAny]
     
+    # The user with its profile, the archive probe when it is missing, the outstanding
+    # token and, when not cached, the user's permissions
+    @query_budget(5)
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        if not serializer.is_valid():
+            email = request.data.get('email') if isinstance(request.data, dict) else None
+            detail = next(iter(serializer.errors.get('non_field_errors', [])), "invalid input")
+            audit.record(audit.Event.LOGIN_FAILED, request, email=str(email or ''), detail=detail)
+            raise ValidationError(serializer.errors)
         user = serializer.validated_data['user']
+        activity.logged_in(user)
+        audit.record(audit.Event.LOGIN, request, user=user)
         
         refresh = RefreshToken.for_user(user)
         
         return Response({
-            'user': UserSerializer(user).data,
+            'user': user_representation(user),
             'tokens': {
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -38,6 +51,7 @@ class LogoutView(GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = LogoutSerializer
 
+    @query_budget(5)
     @extend_schema(request=LogoutSerializer)
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -45,6 +59,7 @@ class LogoutView(GenericAPIView):
         refresh_token = serializer.validated_data["refresh"]
         token = RefreshToken(refresh_token)
         token.blacklist()
+        audit.record(audit.Event.LOGOUT, request, user=request.user)
         return Response({'message': 'Logout successful'}, status=status.HTTP_200_OK)
 
 class GoogleLoginInitView(APIView):
@@ -54,6 +69,7 @@ class GoogleLoginInitView(APIView):
     
     permission_classes = [permissions.AllowAny]
     
+    @query_budget(0)
     def get(self, request):
         auth_url = (
             f"{settings.GOOGLE_AUTH_URI}"
@@ -70,7 +86,11 @@ class GoogleAuthCallbackView(APIView):
     """
     permission_classes = [permissions.AllowAny]
     
+    @query_budget(6)
     def get(self, request):
+        # Imported lazily: only this view needs an HTTP client (preloaded before fork in preload mode)
+        import requests
+
         code = request.GET.get("code")
         if not code:
             return Response({"error": "No code provided"}, status=400)
@@ -82,7 +102,8 @@ class GoogleAuthCallbackView(APIView):
             "redirect_uri": settings.GOOGLE_REDIRECT_URL,
             "grant_type": "authorization_code",
         }
-        token_resp = requests.post(settings.GOOGLE_TOKEN_URI, data=token_data)
+        with tracing.span('google.token', kind='client', **{'http.url': settings.GOOGLE_TOKEN_URI}):
+            token_resp = requests.post(settings.GOOGLE_TOKEN_URI, data=token_data, headers=tracing.inject_headers())
         token_json = token_resp.json()
 
         if "error" in token_json:
@@ -90,20 +111,26 @@ class GoogleAuthCallbackView(APIView):
 
         access_token = token_json["access_token"]
 
-        userinfo_resp = requests.get(
-            settings.GOOGLE_USERINFO_URI,
-            headers={"Authorization": f"Bearer {access_token}"},
-        )
+        with tracing.span('google.userinfo', kind='client', **{'http.url': settings.GOOGLE_USERINFO_URI}):
+            userinfo_resp = requests.get(
+                settings.GOOGLE_USERINFO_URI,
+                headers=tracing.inject_headers({"Authorization": f"Bearer {access_token}"}),
+            )
         userinfo = userinfo_resp.json()
 
-        email = userinfo.get("email")
+        email = canonical_email(userinfo.get("email"))
         name = userinfo.get("name")
         picture = userinfo.get("picture")
 
         if not email:
             return Response({"error": "No email from Google"}, status=400)
 
-        user, _ = User.objects.get_or_create(email=email, defaults={"username": email, "first_name": name})
+        archive.restore_user(email)
+        user, created = User.objects.get_or_create(email__lower=email, defaults={"email": email, "username": email, "first_name": name})
+        if created:
+            funnel.record(funnel.Step.GOOGLE_REGISTERED)
+        activity.logged_in(user)
+        audit.record(audit.Event.GOOGLE_LOGIN, request, user=user)
 
         refresh = RefreshToken.for_user(user)
         return Response({
@@ -0,0 +1,49 @@
+import json
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from . import models
+
+@admin.register(models.RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for captured request profiles
+    """
+    list_display = ['created_at', 'method', 'view', 'status_code', 'duration_ms', 'sample_count', 'trigger', 'requested_by', 'download_link']
+    list_filter = ['trigger', 'view', 'status_code']
+    search_fields = ['path', 'view']
+    readonly_fields = ['created_at', 'method', 'path', 'view', 'status_code', 'duration_ms', 'sample_count', 'trigger', 'requested_by', 'download_link']
+    exclude = ['speedscope']
+    list_per_page = 50
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path(
+                '<int:pk>/speedscope/',
+                self.admin_site.admin_view(self.download_view),
+                name='core_requestprofile_speedscope',
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def download_view(self, request, pk):
+        profile = get_object_or_404(models.RequestProfile, pk=pk)
+        if not self.has_view_permission(request, profile):
+            raise PermissionDenied
+        response = HttpResponse(json.dumps(profile.speedscope), content_type='application/json')
+        response['Content-Disposition'] = f'attachment; filename="profile-{profile.pk}.speedscope.json"'
+        return response
+
+    def download_link(self, obj):
+        url = reverse('admin:core_requestprofile_speedscope', args=[obj.pk])
+        return format_html('<a href="{}">speedscope.json</a>', url)
+    download_link.short_description = "Profile"
@@ -0,0 +1,131 @@
+"""
+Adaptive concurrency limit shared by all worker processes through the cache.
+
+Each in-flight call holds one of `limit` slot keys, taken with cache.add() and leased for
+`lease_timeout` seconds so a crashed worker cannot leak its slot. Callers wait up to
+`queue_timeout` for a free slot and are rejected with Overloaded after that. The limit
+adapts to call latency: a call slower than `latency_target` cuts it by a quarter (at most
+once per `latency_target`), faster calls raise it by one per `limit` calls on average.
+When the cache is unreachable each process falls back to one call at a time.
+"""
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from django.core.cache import cache
+from . import metrics
+from .cache import CacheUnavailable
+
+logger = logging.getLogger('apps.core')
+
+DECREASE_FACTOR = 0.75
+POLL_INTERVAL = 0.05
+
+class Overloaded(Exception):
+    """
+    Raised when no slot frees up within the queue timeout
+    """
+    def __init__(self, name, retry_after=1):
+        super().__init__(f"{name} is at its concurrency limit")
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class AdaptiveLimiter:
+    def __init__(self, name, min_limit, max_limit, initial_limit, latency_target, queue_timeout, lease_timeout):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.initial_limit = max(min_limit, min(initial_limit, max_limit))
+        self.latency_target = latency_target
+        self.queue_timeout = queue_timeout
+        self.lease_timeout = lease_timeout
+        self.limit_key = f"admission:{name}:limit"
+        self.cooldown_key = f"admission:{name}:cooldown"
+        self._local = threading.BoundedSemaphore(1)
+
+    def slot_key(self, index):
+        return f"admission:{self.name}:slot:{index}"
+
+    def current_limit(self):
+        limit = cache.get(self.limit_key)
+        if limit is None:
+            cache.add(self.limit_key, self.initial_limit, timeout=None)
+            limit = self.initial_limit
+        return max(self.min_limit, min(int(limit), self.max_limit))
+
+    def _try_acquire(self, limit, token):
+        keys = [self.slot_key(index) for index in range(limit)]
+        taken = cache.get_many(keys)
+        metrics.observe_admission_state(self.name, limit, len(taken))
+        free = [key for key in keys if key not in taken]
+        random.shuffle(free)
+        for key in free:
+            if cache.add(key, token, timeout=self.lease_timeout):
+                return key
+        return None
+
+    def _acquire(self, wait):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + wait
+        while True:
+            key = self._try_acquire(self.current_limit(), token)
+            if key is not None:
+                return key
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(POLL_INTERVAL)
+
+    def _adapt(self, latency):
+        try:
+            limit = self.current_limit()
+            if latency > self.latency_target:
+                if cache.add(self.cooldown_key, 1, timeout=max(1, math.ceil(self.latency_target))):
+                    decreased = max(self.min_limit, int(limit * DECREASE_FACTOR))
+                    if decreased < limit:
+                        cache.set(self.limit_key, decreased, timeout=None)
+                        logger.warning(f"{self.name} limit lowered to {decreased} after a {latency:.2f}s call")
+                        limit = decreased
+            elif limit < self.max_limit and random.random() < 1 / limit:
+                limit += 1
+                cache.set(self.limit_key, limit, timeout=None)
+            metrics.observe_admission_state(self.name, limit)
+        except CacheUnavailable:
+            pass
+
+    @contextmanager
+    def slot(self, wait=None):
+        """
+        Hold a slot for the duration of the block, or raise Overloaded after waiting
+        `wait` seconds (default `queue_timeout`)
+        """
+        wait = self.queue_timeout if wait is None else wait
+        started = time.monotonic()
+        try:
+            key = self._acquire(wait)
+        except CacheUnavailable:
+            key = None
+            if not self._local.acquire(timeout=wait):
+                metrics.observe_admission(self.name, 'rejected', time.monotonic() - started)
+                raise Overloaded(self.name, self.latency_target)
+        else:
+            if key is None:
+                metrics.observe_admission(self.name, 'rejected', time.monotonic() - started)
+                raise Overloaded(self.name, self.latency_target)
+        metrics.observe_admission(self.name, 'admitted', time.monotonic() - started)
+
+        call_started = time.monotonic()
+        try:
+            yield
+        finally:
+            latency = time.monotonic() - call_started
+            if key is None:
+                self._local.release()
+            else:
+                try:
+                    cache.delete(key)
+                except CacheUnavailable:
+                    # The lease expires on its own
+                    pass
+                self._adapt(latency)
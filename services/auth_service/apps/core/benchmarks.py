@@ -0,0 +1,146 @@
+import statistics
+import time
+from datetime import date
+from django.contrib.auth import authenticate
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+BENCHMARK_PASSWORD = 'Bench-Passw0rd!'
+
+_registry = {}
+
+def benchmark(name, rounds=1000):
+    """
+    Register a micro-benchmark. The decorated function receives the
+    benchmark context and returns the callable that is timed.
+    """
+    def decorator(func):
+        _registry[name] = (func, rounds)
+        return func
+    return decorator
+
+def get_benchmarks(selected=None):
+    if not selected:
+        return dict(_registry)
+    return {name: case for name, case in _registry.items() if name in selected}
+
+def measure(target, rounds, warmup=10):
+    """
+    Time `target` for the given number of rounds and return summary stats in microseconds
+    """
+    for _ in range(min(warmup, rounds)):
+        target()
+
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter_ns()
+        target()
+        timings.append((time.perf_counter_ns() - started) / 1000)
+
+    median = statistics.median(timings)
+    return {
+        'rounds': rounds,
+        'min_us': round(min(timings), 3),
+        'max_us': round(max(timings), 3),
+        'mean_us': round(statistics.fmean(timings), 3),
+        'median_us': round(median, 3),
+        'stddev_us': round(statistics.pstdev(timings), 3),
+        'ops': round(1_000_000 / median, 1) if median else None,
+    }
+
+@benchmark('serializer.user_render', rounds=2000)
+def user_render(ctx):
+    from apps.users.serializers import UserSerializer
+    renderer = JSONRenderer()
+    user = ctx['user']
+    return lambda: renderer.render(UserSerializer(user).data)
+
+@benchmark('serializer.profile_render', rounds=2000)
+def profile_render(ctx):
+    from apps.users.serializers import ProfileSerializer
+    renderer = JSONRenderer()
+    profile = ctx['user'].profile
+    return lambda: renderer.render(ProfileSerializer(profile).data)
+
+def _me_payloads(ctx):
+    from apps.users.serializers import UserSerializer, user_representation
+    from .renderers import FastJSONRenderer
+
+    user = ctx['user']
+    drf_renderer = JSONRenderer()
+    fast_renderer = FastJSONRenderer()
+
+    def drf():
+        return drf_renderer.render(UserSerializer(user).data)
+
+    def fast():
+        return fast_renderer.render(user_representation(user))
+
+    if drf() != fast():
+        raise AssertionError("user_representation with FastJSONRenderer is not byte-identical to UserSerializer with JSONRenderer")
+    return drf, fast
+
+@benchmark('response.me_drf', rounds=2000)
+def me_drf(ctx):
+    return _me_payloads(ctx)[0]
+
+@benchmark('response.me_fast', rounds=2000)
+def me_fast(ctx):
+    return _me_payloads(ctx)[1]
+
+@benchmark('serializer.complete_profile_validate', rounds=2000)
+def complete_profile_validate(ctx):
+    from apps.users.serializers import CompleteProfileSerializer
+    payload = {
+        'first_name': 'Bench',
+        'last_name': 'Mark',
+        'city': 'Kyiv',
+        'country': 'Ukraine',
+        'date_birth': date(1990, 1, 1).isoformat(),
+    }
+
+    def run():
+        serializer = CompleteProfileSerializer(data=payload)
+        serializer.is_valid(raise_exception=True)
+    return run
+
+@benchmark('tokens.refresh_for_user', rounds=500)
+def refresh_for_user(ctx):
+    from apps.authentication.tokens import RefreshToken
+    user = ctx['user']
+
+    def run():
+        refresh = RefreshToken.for_user(user)
+        str(refresh)
+        str(refresh.access_token)
+    return run
+
+@benchmark('auth.authenticate', rounds=20)
+def authenticate_user(ctx):
+    email = ctx['user'].email
+    return lambda: authenticate(username=email, password=BENCHMARK_PASSWORD)
+
+@benchmark('otp.generate', rounds=10000)
+def otp_generate(ctx):
+    from apps.users.utils import otp_utils
+    return otp_utils.generate_otp
+
+@benchmark('cache.set_get_roundtrip', rounds=2000)
+def cache_roundtrip(ctx):
+    key = f"bench_{ctx['user'].id}"
+    payload = {'id': ctx['user'].id, 'email': ctx['user'].email}
+
+    def run():
+        cache.set(key, payload, timeout=60)
+        cache.get(key)
+    return run
+
+@benchmark('password.breached_lookup', rounds=20000)
+def breached_lookup(ctx):
+    from apps.users.password_validation import BreachedPasswordValidator
+
+    # Measures the common password list when no breached password index is configured
+    validator = BreachedPasswordValidator()
+    if validator.index is None:
+        return lambda: BENCHMARK_PASSWORD.lower().strip() in validator.fallback.passwords
+    return lambda: validator.index.contains_password(BENCHMARK_PASSWORD)
@@ -0,0 +1,52 @@
+import atexit
+import logging
+import os
+import threading
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('apps.core')
+
+class BackgroundFlusher:
+    """
+    Base for in-process write buffers drained by one daemon thread per process.
+    Subclasses implement flush(), call start() when they buffer something and wake()
+    to flush before the next interval; the interval is read from the setting named by
+    `interval_setting`. Whatever is left is flushed when the process exits.
+    """
+    interval_setting = None
+    thread_name = 'flusher'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+
+    def flush(self):
+        raise NotImplementedError
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self):
+        # Started lazily and per process: threads do not survive the fork of a preloaded master
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+        thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(getattr(settings, self.interval_setting))
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception(f"{self.thread_name} flush failed")
+            finally:
+                connections.close_all()
@@ -0,0 +1,339 @@
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from . import metrics, tracing
+
+logger = logging.getLogger('apps.core')
+
+_MISSING = object()
+
+class CacheUnavailable(Exception):
+    """
+    Raised for strongly consistent keys when the shared cache cannot be reached
+    """
+    def __init__(self, retry_after=1):
+        super().__init__("Shared cache is unavailable")
+        self.retry_after = max(1, int(retry_after))
+
+class InstrumentedCacheMixin:
+    """
+    Count cache hits and misses per key family and trace cache calls
+    """
+    def get(self, key, default=None, version=None, **kwargs):
+        with tracing.span('cache.get', kind='client', **{'cache.key_family': metrics.key_family(key)}) as span:
+            value = super().get(key, _MISSING, version=version, **kwargs)
+            hit = value is not _MISSING
+            span.set_attribute('cache.hit', hit)
+        metrics.observe_cache(key, hit)
+        return value if hit else default
+
+    def get_many(self, keys, version=None, **kwargs):
+        keys = list(keys)
+        with tracing.span('cache.get_many', kind='client', **{'cache.keys': len(keys)}):
+            found = super().get_many(keys, version=version, **kwargs)
+        for key in keys:
+            metrics.observe_cache(key, key in found)
+        return found
+
+    def set_many(self, data, *args, **kwargs):
+        with tracing.span('cache.set_many', kind='client', **{'cache.keys': len(data)}):
+            return super().set_many(data, *args, **kwargs)
+
+    def set(self, key, *args, **kwargs):
+        with tracing.span('cache.set', kind='client', **{'cache.key_family': metrics.key_family(key)}):
+            return super().set(key, *args, **kwargs)
+
+    def add(self, key, *args, **kwargs):
+        with tracing.span('cache.add', kind='client', **{'cache.key_family': metrics.key_family(key)}):
+            return super().add(key, *args, **kwargs)
+
+    def delete(self, key, *args, **kwargs):
+        with tracing.span('cache.delete', kind='client', **{'cache.key_family': metrics.key_family(key)}):
+            return super().delete(key, *args, **kwargs)
+
+    def incr(self, key, *args, **kwargs):
+        with tracing.span('cache.incr', kind='client', **{'cache.key_family': metrics.key_family(key)}):
+            return super().incr(key, *args, **kwargs)
+
+class CircuitBreaker:
+    """
+    Fail fast after repeated errors, letting a single trial call through every `reset_timeout` seconds
+    """
+    def __init__(self, name, failure_threshold=3, reset_timeout=10):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        with self._lock:
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: let this caller probe while everyone else keeps failing fast
+                self.opened_at = time.monotonic()
+                return True
+        return False
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 1
+        return self.reset_timeout - (time.monotonic() - self.opened_at)
+
+    def record_success(self):
+        if self.failures or self.opened_at is not None:
+            with self._lock:
+                if self.opened_at is not None:
+                    logger.info(f"Circuit {self.name} closed")
+                self.failures = 0
+                self.opened_at = None
+                metrics.observe_breaker(self.name, False)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Circuit {self.name} opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+                metrics.observe_breaker(self.name, True)
+
+class LocalLRU:
+    """
+    Bounded in-process LRU with per-entry TTLs. Values are pickled so callers never share mutable state.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            expires_at, payload = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+        return pickle.loads(payload)
+
+    def set(self, key, value, ttl):
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (expires_at, payload)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class TwoTierBackend(BaseCache):
+    """
+    In-process LRU (L1) in front of a shared cache (L2, normally Redis) guarded by a circuit breaker.
+
+    Each key family has a policy, matched by longest key prefix:
+      - "strong": L2 only; raises CacheUnavailable when L2 is down (OTPs, verification flags).
+      - "cached": read through L1, write both tiers; serves from L1 alone while L2 is down.
+      - "local":  L1 only, never touches L2.
+    """
+    STRONG = 'strong'
+    CACHED = 'cached'
+    LOCAL = 'local'
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options.get('L2', 'redis')
+        self._l1 = LocalLRU(options.get('L1_MAX_ENTRIES', 10000))
+        self._l1_timeout = options.get('L1_TIMEOUT', 5)
+        self._policies = sorted(options.get('KEY_POLICIES', {}).items(), key=lambda item: -len(item[0]))
+        self._default_policy = options.get('DEFAULT_POLICY', self.CACHED)
+        self._breaker = CircuitBreaker(
+            self._l2_alias,
+            failure_threshold=options.get('BREAKER_FAILURES', 3),
+            reset_timeout=options.get('BREAKER_RESET_TIMEOUT', 10),
+        )
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def policy(self, key):
+        key = str(key)
+        for prefix, policy in self._policies:
+            if key.startswith(prefix):
+                return policy
+        return self._default_policy
+
+    def _call_l2(self, method, *args, **kwargs):
+        if not self._breaker.allow():
+            raise CacheUnavailable(self._breaker.retry_after())
+        try:
+            result = getattr(self.l2, method)(*args, **kwargs)
+        except ValueError:
+            # Missing key on incr, not an availability problem
+            self._breaker.record_success()
+            raise
+        except Exception as e:
+            self._breaker.record_failure()
+            logger.warning(f"L2 cache {method} failed: {e}")
+            raise CacheUnavailable(self._breaker.retry_after()) from e
+        self._breaker.record_success()
+        return result
+
+    def _l2_or_degrade(self, policy, method, *args, **kwargs):
+        try:
+            return self._call_l2(method, *args, **kwargs)
+        except CacheUnavailable:
+            if policy == self.STRONG:
+                raise
+            return _MISSING
+
+    def _l1_ttl(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return self._l1_timeout
+        return max(0, min(timeout - time.time(), self._l1_timeout))
+
+    def get(self, key, default=None, version=None):
+        policy = self.policy(key)
+        l1_key = self.make_and_validate_key(key, version=version)
+
+        if policy != self.STRONG:
+            value = self._l1.get(l1_key)
+            metrics.observe_cache_tier('l1', value is not _MISSING)
+            if value is not _MISSING or policy == self.LOCAL:
+                return default if value is _MISSING else value
+
+        value = self._l2_or_degrade(policy, 'get', key, _MISSING, version=version)
+        metrics.observe_cache_tier('l2', value is not _MISSING)
+        if value is _MISSING:
+            return default
+        if policy == self.CACHED:
+            self._l1.set(l1_key, value, self._l1_timeout)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remote = []
+        for key in keys:
+            policy = self.policy(key)
+            if policy == self.STRONG:
+                remote.append(key)
+                continue
+            value = self._l1.get(self.make_and_validate_key(key, version=version))
+            metrics.observe_cache_tier('l1', value is not _MISSING)
+            if value is not _MISSING:
+                found[key] = value
+            elif policy == self.CACHED:
+                remote.append(key)
+
+        if remote:
+            strong = any(self.policy(key) == self.STRONG for key in remote)
+            values = self._l2_or_degrade(self.STRONG if strong else self.CACHED, 'get_many', remote, version=version)
+            if values is not _MISSING:
+                for key in remote:
+                    metrics.observe_cache_tier('l2', key in values)
+                for key, value in values.items():
+                    found[key] = value
+                    if self.policy(key) == self.CACHED:
+                        self._l1.set(self.make_and_validate_key(key, version=version), value, self._l1_timeout)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        policy = self.policy(key)
+        if policy != self.LOCAL:
+            self._l2_or_degrade(policy, 'set', key, value, timeout=timeout, version=version)
+        if policy != self.STRONG:
+            self._l1.set(self.make_and_validate_key(key, version=version), value, self._l1_ttl(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        remote = {key: value for key, value in data.items() if self.policy(key) != self.LOCAL}
+        if remote:
+            strong = any(self.policy(key) == self.STRONG for key in remote)
+            self._l2_or_degrade(self.STRONG if strong else self.CACHED, 'set_many', remote, timeout=timeout, version=version)
+        ttl = self._l1_ttl(timeout)
+        for key, value in data.items():
+            if self.policy(key) != self.STRONG:
+                self._l1.set(self.make_and_validate_key(key, version=version), value, ttl)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        policy = self.policy(key)
+        l1_key = self.make_and_validate_key(key, version=version)
+        if policy != self.LOCAL:
+            added = self._l2_or_degrade(policy, 'add', key, value, timeout=timeout, version=version)
+            if added is not _MISSING:
+                if added and policy == self.CACHED:
+                    self._l1.set(l1_key, value, self._l1_ttl(timeout))
+                return added
+        if self._l1.get(l1_key) is not _MISSING:
+            return False
+        self._l1.set(l1_key, value, self._l1_ttl(timeout))
+        return True
+
+    def delete(self, key, version=None):
+        policy = self.policy(key)
+        deleted = self._l1.delete(self.make_and_validate_key(key, version=version))
+        if policy != self.LOCAL:
+            result = self._l2_or_degrade(policy, 'delete', key, version=version)
+            if result is not _MISSING:
+                deleted = bool(result) or deleted
+        return deleted
+
+    def incr(self, key, delta=1, version=None):
+        policy = self.policy(key)
+        if policy != self.LOCAL:
+            try:
+                value = self._call_l2('incr', key, delta, version=version)
+            except CacheUnavailable:
+                if policy == self.STRONG:
+                    raise
+            else:
+                if policy == self.CACHED:
+                    self._l1.set(self.make_and_validate_key(key, version=version), value, self._l1_timeout)
+                return value
+
+        l1_key = self.make_and_validate_key(key, version=version)
+        value = self._l1.get(l1_key)
+        if value is _MISSING:
+            raise ValueError(f"Key '{key}' not found")
+        value += delta
+        self._l1.set(l1_key, value, self._l1_timeout)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        policy = self.policy(key)
+        if policy == self.LOCAL:
+            return self._l1.get(self.make_and_validate_key(key, version=version)) is not _MISSING
+        result = self._l2_or_degrade(policy, 'touch', key, timeout=timeout, version=version)
+        return False if result is _MISSING else result
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def clear(self):
+        self._l1.clear()
+        self._l2_or_degrade(self.CACHED, 'clear')
+
+class TwoTierCache(InstrumentedCacheMixin, TwoTierBackend):
+    pass
@@ -0,0 +1,14 @@
+from django.contrib.auth import hashers
+from . import tracing
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    Django's default PBKDF2 hasher with tracing spans around hashing and verification
+    """
+    def encode(self, password, salt, iterations=None):
+        with tracing.span('password.hash', **{'hasher.algorithm': self.algorithm}):
+            return super().encode(password, salt, iterations)
+
+    def verify(self, password, encoded):
+        with tracing.span('password.verify', **{'hasher.algorithm': self.algorithm}):
+            return super().verify(password, encoded)
@@ -0,0 +1,145 @@
+"""
+Idempotency-Key support for write endpoints.
+
+A request carrying an `Idempotency-Key` header takes a short lock on the key, runs the
+view and, if the response is a success, stores it for IDEMPOTENCY_TTL seconds. Later
+requests with the same key get the stored response back with `Idempotent-Replayed: true`
+instead of running the view again. While the first request is still running, duplicates
+get a 409. Reusing a key with a different payload is a 422. Error responses are not
+stored, so a client can fix the problem and retry with the same key.
+
+Keys are scoped to the endpoint and the authenticated user. If the cache is unreachable,
+requests run without idempotency. Secrets in a response, such as issued tokens, are not
+stored: the view names them in `reissue` and they are made afresh for every replay.
+"""
+import functools
+import hashlib
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import UploadedFile
+from django.utils.crypto import salted_hmac
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import status
+from rest_framework.response import Response
+from .cache import CacheUnavailable
+
+logger = logging.getLogger('apps.core')
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+LOCK_TIMEOUT = 60
+REPLAYED_HEADERS = ('Location', 'Retry-After')
+
+IDEMPOTENCY_KEY_PARAMETER = OpenApiParameter(
+    HEADER,
+    str,
+    OpenApiParameter.HEADER,
+    description="Client-generated key; retries with the same key replay the first successful response",
+)
+
+def fingerprint(request):
+    """
+    Keyed hash of the method, path and payload, with uploaded files reduced to name and size
+    """
+    parts = [request.method, request.path]
+    data = request.data
+    items = data.lists() if hasattr(data, 'lists') else data.items() if isinstance(data, dict) else [('', data)]
+    for name, value in sorted(items, key=lambda item: item[0]):
+        values = value if isinstance(value, list) else [value]
+        for item in values:
+            if isinstance(item, UploadedFile):
+                item = f"file:{item.name}:{item.size}"
+            parts.append(f"{name}={item!r}")
+    return salted_hmac('apps.core.idempotency', '\n'.join(parts)).hexdigest()
+
+def storage_key(request, key, scope):
+    user_id = request.user.pk if request.user and request.user.is_authenticated else 'anon'
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f"idempotency:{scope}:{user_id}:{digest}"
+
+def _replay(stored, request, reissue):
+    data = stored['data']
+    if reissue:
+        data = dict(data)
+        for field, make in reissue.items():
+            value = make(data, request)
+            if value is not None:
+                data[field] = value
+    response = Response(data, status=stored['status'], headers=stored['headers'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+def idempotent(scope, reissue=None):
+    """
+    Make a DRF view method honour the Idempotency-Key header. Apply it outside
+    @transaction.atomic so a response is only stored once its transaction has committed.
+    `reissue` maps response fields that must not be stored to a function of (stored
+    data, request) returning a fresh value for a replay, or None to leave it out.
+    """
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return view_method(self, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            cache_key = storage_key(request, key, scope)
+            lock_key = f"{cache_key}:lock"
+            request_fingerprint = fingerprint(request)
+            try:
+                stored = cache.get(cache_key)
+                if stored is None:
+                    locked = cache.add(lock_key, request_fingerprint, timeout=LOCK_TIMEOUT)
+                    # Whether or not the lock was taken, the first request may have stored its
+                    # response and released the lock since the read above
+                    stored = cache.get(cache_key)
+                    if stored is not None and locked:
+                        cache.delete(lock_key)
+                    elif stored is None and not locked:
+                        return Response(
+                            {"error": f"A request with this {HEADER} is still being processed"},
+                            status=status.HTTP_409_CONFLICT,
+                            headers={'Retry-After': '1'},
+                        )
+            except CacheUnavailable as cache_error:
+                logger.warning(f"Cache unavailable, running {scope} without idempotency: {cache_error}")
+                return view_method(self, request, *args, **kwargs)
+
+            if stored is not None:
+                if stored['fingerprint'] != request_fingerprint:
+                    return Response(
+                        {"error": f"{HEADER} was already used with a different request"},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    )
+                return _replay(stored, request, reissue)
+
+            try:
+                response = view_method(self, request, *args, **kwargs)
+                if status.is_success(response.status_code):
+                    try:
+                        data = response.data
+                        if reissue and isinstance(data, dict):
+                            data = {field: value for field, value in data.items() if field not in reissue}
+                        cache.set(cache_key, {
+                            'fingerprint': request_fingerprint,
+                            'status': response.status_code,
+                            'data': data,
+                            'headers': {name: response[name] for name in REPLAYED_HEADERS if response.has_header(name)},
+                        }, timeout=settings.IDEMPOTENCY_TTL)
+                    except CacheUnavailable as cache_error:
+                        logger.warning(f"Could not store idempotent response for {scope}: {cache_error}")
+                return response
+            finally:
+                try:
+                    cache.delete(lock_key)
+                except CacheUnavailable:
+                    # The lock expires on its own
+                    pass
+        return wrapper
+    return decorator
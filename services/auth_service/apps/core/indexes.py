@@ -0,0 +1,250 @@
+"""
+Index audit against the live PostgreSQL catalogs.
+
+`audit()` reads every index on the tables of the project's models, with its size, scan
+count and the write traffic of its table, and classifies it:
+
+    duplicate  a valid b-tree whose key columns are a prefix of another index with the
+               same predicate, so the other index serves every query it could serve
+    unused     not scanned since the statistics were last reset
+    missing    declared by a model but absent or invalid, or a foreign key column
+               that no index leads with (deletes of the referenced row scan the table)
+
+Indexes that back a primary key or a unique constraint, and unique indexes, are never
+reported as droppable. Every insert and every non-HOT update writes to each index of the
+table, so an index costs its table's insert + non-HOT update count in b-tree writes.
+Partitioned tables and indexes are reported with the totals of their partitions.
+
+`removal_migrations()` turns the droppable indexes into migrations: RemoveIndex for
+indexes declared in Meta.indexes, which must also be deleted from the model, and
+RunSQL for indexes no model knows about. Field-level indexes (db_index=True) need the
+field changed instead and are returned as manual steps.
+"""
+from collections import namedtuple
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, migrations, models, router
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+IndexInfo = namedtuple('IndexInfo', [
+    'table', 'name', 'method', 'keys', 'include', 'predicate', 'is_unique', 'is_primary',
+    'backs_constraint', 'is_valid', 'size', 'scans', 'definition',
+])
+TableInfo = namedtuple('TableInfo', ['name', 'inserts', 'updates', 'hot_updates', 'deletes', 'seq_scans', 'index_scans'])
+Finding = namedtuple('Finding', ['kind', 'table', 'index', 'detail'])
+
+# Partitions are folded into their parent through pg_partition_tree (PostgreSQL 12+)
+INDEXES_SQL = """
+    SELECT
+        t.relname,
+        i.relname,
+        am.amname,
+        ARRAY(
+            SELECT pg_get_indexdef(ix.indexrelid, k, true) || ' ' || ix.indclass[k - 1]
+                || ' ' || ix.indcollation[k - 1] || ' ' || ix.indoption[k - 1]
+            FROM generate_series(1, ix.indnkeyatts) AS k ORDER BY k
+        ),
+        ARRAY(
+            SELECT pg_get_indexdef(ix.indexrelid, k, true)
+            FROM generate_series(ix.indnkeyatts + 1, ix.indnatts) AS k ORDER BY k
+        ),
+        pg_get_expr(ix.indpred, ix.indrelid),
+        ix.indisunique,
+        ix.indisprimary,
+        EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.oid AND c.contype IN ('p', 'u', 'x')),
+        ix.indisvalid,
+        (SELECT coalesce(sum(pg_relation_size(p.relid)), 0)::bigint FROM pg_partition_tree(i.oid) p),
+        (
+            SELECT coalesce(sum(s.idx_scan), 0)::bigint FROM pg_partition_tree(i.oid) p
+            JOIN pg_stat_user_indexes s ON s.indexrelid = p.relid
+        ),
+        pg_get_indexdef(i.oid)
+    FROM pg_index ix
+    JOIN pg_class i ON i.oid = ix.indexrelid
+    JOIN pg_class t ON t.oid = ix.indrelid
+    JOIN pg_am am ON am.oid = i.relam
+    WHERE t.relnamespace = current_schema()::regnamespace AND t.relname = ANY(%s)
+    ORDER BY t.relname, i.relname
+"""
+
+TABLES_SQL = """
+    SELECT
+        t.relname,
+        coalesce(sum(s.n_tup_ins), 0)::bigint,
+        coalesce(sum(s.n_tup_upd), 0)::bigint,
+        coalesce(sum(s.n_tup_hot_upd), 0)::bigint,
+        coalesce(sum(s.n_tup_del), 0)::bigint,
+        coalesce(sum(s.seq_scan), 0)::bigint,
+        coalesce(sum(s.idx_scan), 0)::bigint
+    FROM pg_class t
+    CROSS JOIN LATERAL pg_partition_tree(t.oid) p
+    LEFT JOIN pg_stat_user_tables s ON s.relid = p.relid
+    WHERE t.relnamespace = current_schema()::regnamespace AND t.relname = ANY(%s)
+    GROUP BY t.relname
+"""
+
+def model_tables(using):
+    """
+    {db_table: model} for the concrete models stored on `using`
+    """
+    return {
+        model._meta.db_table: model
+        for model in apps.get_models()
+        if model._meta.managed and not model._meta.proxy and router.allow_migrate_model(using, model)
+    }
+
+def stats_reset(using):
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT stats_reset FROM pg_stat_database WHERE datname = current_database()")
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+def load(using, tables):
+    """
+    Read the indexes and table statistics of `tables` on `using`
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(INDEXES_SQL, [list(tables)])
+        indexes = [IndexInfo(*row) for row in cursor.fetchall()]
+        cursor.execute(TABLES_SQL, [list(tables)])
+        table_stats = {row[0]: TableInfo(*row) for row in cursor.fetchall()}
+    return indexes, table_stats
+
+def index_writes(table):
+    """
+    B-tree writes each index of `table` has absorbed: one per insert and per non-HOT update
+    """
+    return table.inserts + table.updates - table.hot_updates
+
+def _droppable(index):
+    return not (index.is_primary or index.backs_constraint or index.is_unique)
+
+def _covers(index, other):
+    """
+    Whether `other` serves every query `index` can serve
+    """
+    if other.name == index.name or other.table != index.table or not other.is_valid:
+        return False
+    if index.method != 'btree' or other.method != 'btree' or index.predicate != other.predicate:
+        return False
+    return list(other.keys[:len(index.keys)]) == list(index.keys)
+
+def duplicates(indexes):
+    """
+    {droppable index name: name of an index covering it}. Of two identical indexes
+    the one with fewer scans is reported, so one of them always stays.
+    """
+    found = {}
+    for index in indexes:
+        if not index.is_valid or not _droppable(index):
+            continue
+        for other in indexes:
+            if not _covers(index, other) or other.name in found:
+                continue
+            if other.keys == index.keys and _droppable(other) and (other.scans, index.name) < (index.scans, other.name):
+                continue
+            found[index.name] = other.name
+            break
+    return found
+
+def _leading_column(index):
+    # keys hold "<column or expression> <opclass> <collation> <options>"
+    return index.keys[0].rsplit(' ', 3)[0].strip('"') if index.keys else None
+
+def declared_names(model):
+    return {index.name for index in model._meta.indexes} | {
+        constraint.name for constraint in model._meta.constraints
+        if isinstance(constraint, models.UniqueConstraint)
+    }
+
+def missing(model, indexes):
+    """
+    Findings for indexes `model` declares that are absent or invalid, and for its
+    foreign keys that no valid index leads with
+    """
+    table = model._meta.db_table
+    present = {index.name: index for index in indexes}
+    found = []
+    for name in sorted(declared_names(model)):
+        if name not in present:
+            found.append(Finding('missing', table, name, "declared by the model but not in the database"))
+    for index in indexes:
+        if not index.is_valid:
+            found.append(Finding('missing', table, index.name, "invalid, probably a failed CREATE INDEX CONCURRENTLY: drop and recreate it"))
+    leading = {_leading_column(index) for index in indexes if index.is_valid and index.predicate is None}
+    for field in model._meta.local_concrete_fields:
+        if field.is_relation and field.column not in leading:
+            found.append(Finding('missing', table, None, f"foreign key {field.column} has no index leading with it"))
+    return found
+
+def audit(using='default', max_scans=0):
+    """
+    Inspect `using` and return (findings, indexes, table statistics). An index counts as
+    unused with at most `max_scans` scans.
+    """
+    tables = model_tables(using)
+    indexes, table_stats = load(using, tables)
+    by_table = {}
+    for index in indexes:
+        by_table.setdefault(index.table, []).append(index)
+
+    findings = []
+    duplicate_of = duplicates(indexes)
+    for index in indexes:
+        if index.name in duplicate_of:
+            findings.append(Finding('duplicate', index.table, index.name, f"covered by {duplicate_of[index.name]}"))
+        elif index.is_valid and _droppable(index) and index.scans <= max_scans:
+            findings.append(Finding('unused', index.table, index.name, "no queries use it"))
+    for table, model in sorted(tables.items()):
+        findings += missing(model, by_table.get(table, []))
+    return findings, indexes, table_stats
+
+def _field_index(model, index):
+    # A single plain column created from a field's db_index=True
+    if len(index.keys) != 1 or index.include or index.predicate is not None:
+        return None
+    column = _leading_column(index)
+    for field in model._meta.local_concrete_fields:
+        if field.column == column and field.db_index and not field.unique:
+            return field
+    return None
+
+def removal_migrations(using, names):
+    """
+    Build migrations dropping the indexes called `names`. Returns ({app label:
+    (path, source)}, [manual steps]) for the apps whose migrations live in this project.
+    """
+    tables = model_tables(using)
+    indexes, _ = load(using, tables)
+    operations = {}
+    manual = []
+    for index in indexes:
+        if index.name not in names:
+            continue
+        model = tables[index.table]
+        app_config = model._meta.app_config
+        if index.name in {declared.name for declared in model._meta.indexes}:
+            operation = migrations.RemoveIndex(model_name=model._meta.model_name, name=index.name)
+            manual.append(f"Delete {index.name} from {model.__name__}.Meta.indexes")
+        elif (field := _field_index(model, index)) is not None:
+            manual.append(f"Set db_index=False on {model.__name__}.{field.name} to drop {index.name}")
+            continue
+        else:
+            quote = connections[using].ops.quote_name
+            operation = migrations.RunSQL(f"DROP INDEX IF EXISTS {quote(index.name)}", reverse_sql=index.definition)
+        if not app_config.path.startswith(str(settings.BASE_DIR)) or 'site-packages' in app_config.path:
+            manual.append(f"{index.name} belongs to {app_config.label}, which is not part of this project")
+            continue
+        operations.setdefault(app_config.label, []).append(operation)
+
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    written = {}
+    for app_label, app_operations in operations.items():
+        leaf = loader.graph.leaf_nodes(app_label)[0]
+        migration = migrations.Migration(f"{int(leaf[1][:4]) + 1:04d}_remove_redundant_indexes", app_label)
+        migration.dependencies = [leaf]
+        migration.operations = app_operations
+        writer = MigrationWriter(migration)
+        written[app_label] = (writer.path, writer.as_string())
+    return written, manual
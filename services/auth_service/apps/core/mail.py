@@ -0,0 +1,32 @@
+import time
+from django.conf import settings
+from django.core.mail.backends.smtp import EmailBackend as BaseSMTPBackend
+from . import admission, metrics, tracing
+
+# Leases outlive the SMTP timeout so a slot is only reclaimed from a worker that died mid-send
+email_limiter = admission.AdaptiveLimiter(
+    'email',
+    min_limit=settings.EMAIL_CONCURRENCY_MIN,
+    max_limit=settings.EMAIL_CONCURRENCY_MAX,
+    initial_limit=settings.EMAIL_CONCURRENCY_INITIAL,
+    latency_target=settings.EMAIL_LATENCY_TARGET,
+    queue_timeout=settings.EMAIL_QUEUE_TIMEOUT,
+    lease_timeout=(settings.EMAIL_TIMEOUT or 30) + 10,
+)
+
+class SMTPEmailBackend(BaseSMTPBackend):
+    """
+    SMTP backend that records and traces send time
+    """
+    def send_messages(self, email_messages):
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            with tracing.span('smtp.send', kind='client', **{'smtp.host': self.host, 'smtp.messages': len(email_messages)}):
+                for message in email_messages:
+                    message.extra_headers = tracing.inject_headers(message.extra_headers)
+                sent = super().send_messages(email_messages)
+            outcome = 'sent' if sent else 'failed'
+            return sent
+        finally:
+            metrics.observe_email(time.perf_counter() - started, outcome)
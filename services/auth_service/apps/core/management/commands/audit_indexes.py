@@ -0,0 +1,94 @@
+import json
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from apps.core import indexes
+
+def _mib(size):
+    return f"{size / 1048576:.1f} MiB"
+
+class Command(BaseCommand):
+    """
+    Report duplicate, unused and missing indexes from the live PostgreSQL catalogs
+    """
+    help = (
+        "Compare the indexes in PostgreSQL with the models and their usage statistics. Lists duplicate, "
+        "unused and missing indexes with their size and the b-tree writes they cost, and with "
+        "--write-migrations generates the migrations dropping the droppable ones. Scan counts are "
+        "per server: check the replicas serving reads before dropping an unused index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--max-scans', type=int, default=0, help="Report indexes with at most this many scans as unused")
+        parser.add_argument('--write-migrations', action='store_true', help="Write migrations dropping the duplicate indexes")
+        parser.add_argument('--include-unused', action='store_true', help="With --write-migrations, drop the unused indexes too")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if connections[using].vendor != 'postgresql':
+            raise CommandError("audit_indexes reads PostgreSQL catalogs and statistics")
+
+        findings, all_indexes, tables = indexes.audit(using, options['max_scans'])
+        by_name = {index.name: index for index in all_indexes}
+        since = indexes.stats_reset(using)
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'stats_since': since.isoformat() if since else None,
+                'findings': [finding._asdict() for finding in findings],
+                'indexes': [index._asdict() for index in all_indexes],
+                'tables': [table._asdict() for table in tables.values()],
+            }, indent=2, default=str))
+        else:
+            self.report(findings, by_name, tables, since)
+
+        if options['write_migrations']:
+            kinds = ('duplicate', 'unused') if options['include_unused'] else ('duplicate',)
+            names = {finding.index for finding in findings if finding.kind in kinds}
+            self.write_migrations(using, names)
+
+    def report(self, findings, by_name, tables, since):
+        self.stdout.write(f"Statistics since {since or 'the server started'}")
+        self.stdout.write(f"{'table':<32} {'inserts':>12} {'updates':>12} {'HOT':>6} {'indexes':>8} {'index writes':>14}")
+        counts = {}
+        for index in by_name.values():
+            counts[index.table] = counts.get(index.table, 0) + 1
+        for name, table in sorted(tables.items()):
+            writes = indexes.index_writes(table)
+            hot = table.hot_updates / table.updates if table.updates else 0
+            self.stdout.write(
+                f"{name:<32} {table.inserts:>12} {table.updates:>12} {hot:>6.0%} "
+                f"{counts.get(name, 0):>8} {writes * counts.get(name, 0):>14}"
+            )
+
+        if not findings:
+            self.stdout.write(self.style.SUCCESS("No duplicate, unused or missing indexes"))
+            return
+        saved_size = saved_writes = 0
+        for finding in findings:
+            index = by_name.get(finding.index)
+            if finding.kind == 'missing' or index is None:
+                label = f"{finding.index} on {finding.table}" if finding.index else finding.table
+                self.stdout.write(self.style.WARNING(f"missing    {label}: {finding.detail}"))
+                continue
+            writes = indexes.index_writes(tables[index.table]) if index.table in tables else 0
+            saved_size += index.size
+            saved_writes += writes
+            self.stdout.write(
+                f"{finding.kind:<10} {index.name} on {index.table}: {finding.detail}, "
+                f"{_mib(index.size)}, {index.scans} scans, {writes} writes"
+            )
+        self.stdout.write(f"Dropping the duplicate and unused indexes frees {_mib(saved_size)} and saves {saved_writes} b-tree writes")
+
+    def write_migrations(self, using, names):
+        if not names:
+            self.stdout.write("No indexes to drop, no migration written")
+            return
+        written, manual = indexes.removal_migrations(using, names)
+        for app_label, (path, source) in written.items():
+            Path(path).write_text(source)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {path}"))
+        for step in manual:
+            self.stdout.write(self.style.WARNING(step))
@@ -0,0 +1,112 @@
+import json
+import platform
+from datetime import date
+from pathlib import Path
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from apps.core import benchmarks
+from apps.users.models import User
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+class Command(BaseCommand):
+    """
+    Run micro-benchmarks for hot components and save or compare JSON baselines
+    """
+    help = "Run micro-benchmarks for serializers, hashing, token minting, OTP and cache paths"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='*', help="Run only the named benchmarks")
+        parser.add_argument('--rounds', type=int, help="Override the number of rounds for every benchmark")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help="Path of the baseline JSON file")
+        parser.add_argument('--save', action='store_true', help="Write the results as the new baseline")
+        parser.add_argument('--compare', action='store_true', help="Compare against the baseline and fail on regressions")
+        parser.add_argument('--threshold', type=float, default=0.30, help="Allowed median slowdown before failing (0.30 = 30%%)")
+        parser.add_argument('--output', help="Also write the results JSON to this path")
+
+    def handle(self, *args, **options):
+        cases = benchmarks.get_benchmarks(options['only'])
+        if not cases:
+            raise CommandError("No benchmarks selected")
+
+        results = self.run_cases(cases, options['rounds'])
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'password_hasher': settings.PASSWORD_HASHERS[0],
+            'results': results,
+        }
+
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:<40} median {stats['median_us']:>12.2f}us  "
+                f"min {stats['min_us']:>12.2f}us  ops/s {stats['ops']}"
+            )
+
+        if options['output']:
+            self.write_json(Path(options['output']), report)
+
+        if options['compare']:
+            self.compare(Path(options['baseline']), results, options['threshold'])
+
+        if options['save']:
+            self.write_json(Path(options['baseline']), report)
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {options['baseline']}"))
+
+    def run_cases(self, cases, rounds_override):
+        results = {}
+        with transaction.atomic():
+            ctx = {'user': self.create_fixture_user()}
+            try:
+                for name, (factory, rounds) in cases.items():
+                    target = factory(ctx)
+                    results[name] = benchmarks.measure(target, rounds_override or rounds)
+            finally:
+                cache.delete(f"bench_{ctx['user'].id}")
+                transaction.set_rollback(True)
+        return results
+
+    def create_fixture_user(self):
+        user = User.objects.create_user(
+            email='benchmark@example.com',
+            username='benchmark',
+            password=benchmarks.BENCHMARK_PASSWORD,
+            first_name='Bench',
+            last_name='Mark',
+        )
+        profile = user.profile
+        profile.city = 'Kyiv'
+        profile.country = 'Ukraine'
+        profile.date_birth = date(1990, 1, 1)
+        profile.save()
+        return user
+
+    def compare(self, path, results, threshold):
+        if not path.exists():
+            raise CommandError(f"Baseline file {path} does not exist, run with --save first")
+
+        baseline = json.loads(path.read_text()).get('results', {})
+        regressions = []
+        for name, stats in results.items():
+            previous = baseline.get(name)
+            if not previous:
+                self.stdout.write(f"{name}: no baseline, skipped")
+                continue
+            change = stats['median_us'] / previous['median_us'] - 1
+            line = f"{name}: {previous['median_us']:.2f}us -> {stats['median_us']:.2f}us ({change:+.1%})"
+            if change > threshold:
+                regressions.append(line)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f"{len(regressions)} benchmark(s) regressed by more than {threshold:.0%}")
+
+    def write_json(self, path, report):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2, sort_keys=True) + '\n')
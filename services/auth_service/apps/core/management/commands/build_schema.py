@@ -0,0 +1,31 @@
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.core import schema
+
+class Command(BaseCommand):
+    """
+    Generate the OpenAPI schema artifact served at api/schema/
+    """
+    help = "Write the OpenAPI schema to OPENAPI_SCHEMA_PATH, or fail with --check if it is out of date"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Fail if the committed schema differs from the code")
+        parser.add_argument('--path', default=str(settings.OPENAPI_SCHEMA_PATH))
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        content = schema.generate_schema()
+
+        if options['check']:
+            if not path.exists() or path.read_bytes() != content:
+                raise CommandError(f"{path} is out of date, run `manage.py build_schema` and commit the result")
+            self.stdout.write(self.style.SUCCESS(f"{path} is up to date"))
+            return
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists() and path.read_bytes() == content:
+            self.stdout.write(f"{path} unchanged")
+            return
+        path.write_bytes(content)
+        self.stdout.write(self.style.SUCCESS(f"Schema written to {path}"))
@@ -0,0 +1,89 @@
+import json
+import os
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SMAPS_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+def read_smaps_rollup(pid):
+    """
+    Return memory counters in KiB for a process, USS being its private (unshared) pages
+    """
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as fh:
+        for line in fh:
+            name, _, rest = line.partition(':')
+            if name in SMAPS_FIELDS:
+                values[name] = int(rest.split()[0])
+    values['Uss'] = values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+    return values
+
+def child_pids(master):
+    children = []
+    for entry in Path('/proc').iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / 'stat').read_text()
+        except OSError:
+            continue
+        # The command name may contain spaces, fields after it are space separated
+        fields = stat.rsplit(')', 1)[1].split()
+        if int(fields[1]) == master:
+            children.append(int(entry.name))
+    return sorted(children)
+
+class Command(BaseCommand):
+    """
+    Report preload import times and per-worker memory (RSS, PSS, USS)
+    """
+    help = "Show preload timings and unique set size per worker process (Linux only)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--master', type=int, help="PID of the pre-forking master, its children are reported as workers")
+        parser.add_argument('--pids', type=int, nargs='*', default=[], help="Explicit PIDs to report")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        if not Path('/proc/self/smaps_rollup').exists():
+            raise CommandError("memory_report needs /proc/<pid>/smaps_rollup (Linux 4.14+)")
+
+        pids = list(options['pids'])
+        if options['master']:
+            pids = [options['master']] + child_pids(options['master']) + pids
+        if not pids:
+            pids = [os.getpid()]
+
+        processes = {}
+        for pid in pids:
+            try:
+                processes[pid] = read_smaps_rollup(pid)
+            except OSError as e:
+                self.stderr.write(f"Skipping {pid}: {e}")
+
+        preload = None
+        report_path = Path(settings.PRELOAD_REPORT_PATH)
+        if report_path.exists():
+            preload = json.loads(report_path.read_text())
+
+        if options['json']:
+            self.stdout.write(json.dumps({'preload': preload, 'processes': processes}, indent=2))
+            return
+
+        if preload:
+            self.stdout.write(f"Preload in master {preload['pid']}: {preload['total_ms']} ms, {preload['frozen_objects']} objects frozen")
+            for module, ms in sorted(preload['imports'].items(), key=lambda item: -item[1]):
+                self.stdout.write(f"  import {module:<45} {ms:>9.2f} ms")
+            for step, result in preload['steps'].items():
+                self.stdout.write(f"  step   {step:<45} {result.get('ms', result.get('error'))}")
+        else:
+            self.stdout.write("No preload report found, is PRELOAD_ENABLED set?")
+
+        self.stdout.write(f"{'pid':>8} {'rss MiB':>10} {'pss MiB':>10} {'uss MiB':>10} {'shared MiB':>11}")
+        for pid, values in processes.items():
+            shared = values.get('Shared_Clean', 0) + values.get('Shared_Dirty', 0)
+            self.stdout.write(
+                f"{pid:>8} {values.get('Rss', 0) / 1024:>10.1f} {values.get('Pss', 0) / 1024:>10.1f} "
+                f"{values['Uss'] / 1024:>10.1f} {shared / 1024:>11.1f}"
+            )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.core import profiling
+from apps.users.managers import canonical_email
+from apps.users.models import User
+
+class Command(BaseCommand):
+    """
+    Issue a signed X-Profile-Token for a staff user
+    """
+    help = "Print a signed X-Profile-Token header value for a staff user"
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help="Email of the staff user")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email__lower=canonical_email(options['email']), is_staff=True, is_active=True).first()
+        if user is None:
+            raise CommandError(f"No active staff user with email {options['email']}")
+        self.stdout.write(profiling.make_profile_token(user))
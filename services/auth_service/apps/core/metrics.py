@@ -0,0 +1,221 @@
+import os
+import logging
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:
+    prometheus_client = None
+
+logger = logging.getLogger('apps.core')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+CACHE_KEY_FAMILIES = ('otp_attempts', 'otp', 'verified', 'user', 'throttle', 'funnel', 'admission', 'idempotency', 'vendor_directory')
+
+if prometheus_client is not None:
+    REQUEST_LATENCY = Histogram(
+        'auth_http_request_duration_seconds',
+        'Request latency per view, method and status',
+        ['view', 'method', 'status'],
+        buckets=LATENCY_BUCKETS,
+    )
+    REQUEST_DB_QUERIES = Histogram(
+        'auth_http_request_db_queries',
+        'SQL queries issued per request',
+        ['view', 'status'],
+        buckets=QUERY_COUNT_BUCKETS,
+    )
+    REQUEST_DB_SECONDS = Counter(
+        'auth_http_request_db_seconds',
+        'Time spent in SQL per view and status',
+        ['view', 'status'],
+    )
+    CACHE_REQUESTS = Counter(
+        'auth_cache_requests',
+        'Cache lookups by key family and result',
+        ['family', 'result'],
+    )
+    CACHE_TIER_REQUESTS = Counter(
+        'auth_cache_tier_requests',
+        'Two-tier cache lookups by tier and result',
+        ['tier', 'result'],
+    )
+    CACHE_BREAKER_OPEN = Gauge(
+        'auth_cache_breaker_open',
+        'Whether the circuit breaker in front of a cache is open',
+        ['cache'],
+        multiprocess_mode='max',
+    )
+    EMAIL_SEND_SECONDS = Histogram(
+        'auth_email_send_seconds',
+        'SMTP send time',
+        ['outcome'],
+        buckets=LATENCY_BUCKETS,
+    )
+    TABLE_SIZE_BYTES = Gauge(
+        'auth_table_size_bytes',
+        'On-disk size of hot tables, split into heap and indexes',
+        ['table', 'part'],
+        multiprocess_mode='mostrecent',
+    )
+    INDEX_SIZE_BYTES = Gauge(
+        'auth_index_size_bytes',
+        'On-disk size of each index on the hot tables',
+        ['table', 'index'],
+        multiprocess_mode='mostrecent',
+    )
+    USER_ARCHIVE_MOVES = Counter(
+        'auth_user_archive_moves',
+        'Users moved into or restored from the archive',
+        ['direction', 'reason'],
+    )
+
+    ADMISSION_LIMIT = Gauge(
+        'auth_admission_limit',
+        'Current adaptive concurrency limit',
+        ['limiter'],
+        multiprocess_mode='mostrecent',
+    )
+    ADMISSION_IN_FLIGHT = Gauge(
+        'auth_admission_in_flight',
+        'Calls holding a slot, as last seen by a worker waiting for one',
+        ['limiter'],
+        multiprocess_mode='mostrecent',
+    )
+    ADMISSION_REQUESTS = Counter(
+        'auth_admission_requests',
+        'Calls admitted or rejected by a concurrency limiter',
+        ['limiter', 'outcome'],
+    )
+    ADMISSION_QUEUE_SECONDS = Histogram(
+        'auth_admission_queue_seconds',
+        'Time spent waiting for a concurrency limiter slot',
+        ['limiter', 'outcome'],
+        buckets=LATENCY_BUCKETS,
+    )
+
+    ACTIVITY_FLUSH_LAG = Gauge(
+        'auth_activity_flush_lag_seconds',
+        'Age of the oldest buffered last_seen/last_login timestamp at the last flush',
+        multiprocess_mode='max',
+    )
+    ACTIVITY_FLUSHED = Counter(
+        'auth_activity_flushed',
+        'Buffered activity timestamps written to the database',
+        ['field'],
+    )
+    QUERY_BUDGET_EXCEEDED = Counter(
+        'auth_query_budget_exceeded',
+        'Requests that issued more SQL queries than their view allows',
+        ['view'],
+    )
+    AUDIT_EVENTS = Counter(
+        'auth_audit_events',
+        'Authentication audit events written to or dropped from the buffer',
+        ['outcome'],
+    )
+
+def enabled():
+    from django.conf import settings
+    return prometheus_client is not None and getattr(settings, 'METRICS_ENABLED', True)
+
+def key_family(key):
+    """
+    Map a cache key such as `otp_foo@x.com` or `user_42` to a low-cardinality family label
+    """
+    key = str(key)
+    for family in CACHE_KEY_FAMILIES:
+        if key.startswith(f"{family}_") or key.startswith(f"{family}:"):
+            return family
+    return 'other'
+
+def observe_request(view, method, status, duration, queries, db_seconds):
+    if not enabled():
+        return
+    status = str(status)
+    REQUEST_LATENCY.labels(view, method, status).observe(duration)
+    REQUEST_DB_QUERIES.labels(view, status).observe(queries)
+    REQUEST_DB_SECONDS.labels(view, status).inc(db_seconds)
+
+def observe_cache(key, hit, count=1):
+    if not enabled() or not count:
+        return
+    CACHE_REQUESTS.labels(key_family(key), 'hit' if hit else 'miss').inc(count)
+
+def observe_cache_tier(tier, hit):
+    if not enabled():
+        return
+    CACHE_TIER_REQUESTS.labels(tier, 'hit' if hit else 'miss').inc()
+
+def observe_breaker(name, is_open):
+    if not enabled():
+        return
+    CACHE_BREAKER_OPEN.labels(name).set(1 if is_open else 0)
+
+def observe_email(duration, outcome):
+    if not enabled():
+        return
+    EMAIL_SEND_SECONDS.labels(outcome).observe(duration)
+
+def observe_table_sizes(sizes):
+    if not enabled():
+        return
+    for table, size in sizes['tables'].items():
+        for part in ('heap', 'indexes', 'total'):
+            TABLE_SIZE_BYTES.labels(table, part).set(size[part])
+    for index, size in sizes['indexes'].items():
+        INDEX_SIZE_BYTES.labels(size['table'], index).set(size['bytes'])
+
+def observe_archive(direction, reason, count=1):
+    if not enabled() or not count:
+        return
+    USER_ARCHIVE_MOVES.labels(direction, reason).inc(count)
+
+def observe_admission(limiter, outcome, wait):
+    if not enabled():
+        return
+    ADMISSION_REQUESTS.labels(limiter, outcome).inc()
+    ADMISSION_QUEUE_SECONDS.labels(limiter, outcome).observe(wait)
+
+def observe_admission_state(limiter, limit, in_flight=None):
+    if not enabled():
+        return
+    ADMISSION_LIMIT.labels(limiter).set(limit)
+    if in_flight is not None:
+        ADMISSION_IN_FLIGHT.labels(limiter).set(in_flight)
+
+def observe_activity_lag(seconds):
+    if not enabled():
+        return
+    ACTIVITY_FLUSH_LAG.set(seconds)
+
+def observe_activity_flush(field, count):
+    if not enabled() or not count:
+        return
+    ACTIVITY_FLUSHED.labels(field).inc(count)
+
+def observe_query_budget(view):
+    if not enabled():
+        return
+    QUERY_BUDGET_EXCEEDED.labels(view).inc()
+
+def observe_audit(outcome, count=1):
+    if not enabled() or not count:
+        return
+    AUDIT_EVENTS.labels(outcome).inc(count)
+
+def render_latest():
+    """
+    Render all metrics in the Prometheus text format, aggregating across worker
+    processes when PROMETHEUS_MULTIPROC_DIR is set
+    """
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, REGISTRY, generate_latest, multiprocess
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,157 @@
+import logging
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from . import metrics, profiling, querybudget, tracing
+
+logger = logging.getLogger('apps.core')
+
+class QueryCounter:
+    """
+    Database execute wrapper that counts queries and the time spent in them
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+def trace_query(execute, sql, params, many, context):
+    attributes = {
+        'db.system': context['connection'].vendor,
+        'db.statement': sql[:1000],
+    }
+    with tracing.span('db.query', kind='client', **attributes):
+        return execute(sql, params, many, context)
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name or match._func_path
+
+class MetricsMiddleware:
+    """
+    Record latency, SQL query count and SQL time for every request, labelled by view and status
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not metrics.enabled():
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+
+        metrics.observe_request(
+            view_label(request),
+            request.method,
+            response.status_code,
+            time.perf_counter() - started,
+            counter.count,
+            counter.duration,
+        )
+        return response
+
+class TracingMiddleware:
+    """
+    Open a server span per request, continuing the caller's W3C traceparent, and trace SQL queries
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.TRACING_ENABLED:
+            return self.get_response(request)
+
+        root, token = tracing.start_span(
+            f"{request.method} {request.path}",
+            request.headers.get('traceparent'),
+            **{'http.method': request.method, 'http.target': request.path},
+        )
+        response = None
+        try:
+            with ExitStack() as stack:
+                if root.sampled:
+                    for connection in connections.all():
+                        stack.enter_context(connection.execute_wrapper(trace_query))
+                response = self.get_response(request)
+        finally:
+            root.name = f"{request.method} {view_label(request)}"
+            if response is not None:
+                root.set_attribute('http.status_code', response.status_code)
+            tracing.end_span(root, token)
+
+        response['traceparent'] = root.traceparent
+        return response
+
+class QueryBudgetMiddleware:
+    """
+    Hold each request to its view's SQL query budget, see apps/core/querybudget.py
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = settings.QUERY_BUDGET_MODE
+        if mode == 'off':
+            return self.get_response(request)
+
+        recorder = querybudget.QueryRecorder(with_stacks=mode == 'raise')
+        with recorder.record():
+            response = self.get_response(request)
+
+        limit = querybudget.budget_for(request)
+        if limit is None or len(recorder) <= limit:
+            return response
+        label = f"{request.method} {view_label(request)}"
+        metrics.observe_query_budget(view_label(request))
+        if mode == 'raise':
+            raise querybudget.QueryBudgetExceeded(recorder.report(label, limit))
+        logger.warning(recorder.report(label, limit))
+        return response
+
+class ProfilingMiddleware:
+    """
+    Profile requests flagged by staff, plus a random sample of requests whose slowest runs are kept per view
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.PROFILING_ENABLED:
+            return self.get_response(request)
+
+        requested_by = profiling.requested_by_staff(request)
+        if requested_by is None and not profiling.sample_automatically():
+            return self.get_response(request)
+
+        profiler = profiling.SamplingProfiler()
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+
+        trigger = 'manual' if requested_by is not None else 'auto'
+        try:
+            profile = profiling.store_profile(request, response, profiler, view_label(request), trigger, requested_by)
+        except Exception as e:
+            logger.warning(f"Failed to store request profile: {e}")
+            profile = None
+
+        if profile is not None and requested_by is not None:
+            response['X-Profile-Id'] = str(profile.pk)
+        return response
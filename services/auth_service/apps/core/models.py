@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.db import models
+
+class RequestProfile(models.Model):
+    """
+    Sampling profile captured for a single request
+    """
+    class Trigger(models.TextChoices):
+        MANUAL = "manual", "Manual"
+        AUTO = "auto", "Automatic"
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view = models.CharField(max_length=200)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    sample_count = models.PositiveIntegerField(default=0)
+    trigger = models.CharField(max_length=10, choices=Trigger, default=Trigger.MANUAL)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+    )
+    speedscope = models.JSONField()
+
+    def __str__(self):
+        return f"{self.method} {self.view} ({self.duration_ms:.0f} ms)"
+
+    class Meta:
+        db_table = 'core_request_profile'
+        verbose_name = 'request profile'
+        verbose_name_plural = 'request profiles'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['view', 'trigger', '-duration_ms']),
+        ]
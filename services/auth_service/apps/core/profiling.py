@@ -0,0 +1,156 @@
+import logging
+import random
+import sys
+import threading
+import time
+from django.conf import settings
+from django.core import signing
+
+logger = logging.getLogger('apps.core')
+
+PROFILE_TOKEN_SALT = 'apps.core.profiling'
+
+class SamplingProfiler:
+    """
+    Sample the call stack of the current thread from a background thread
+    """
+    def __init__(self, interval=None, max_samples=None):
+        self.interval = interval or settings.PROFILING_INTERVAL
+        self.max_samples = max_samples or settings.PROFILING_MAX_SAMPLES
+        self.samples = []
+        self.started_at = None
+        self.stopped_at = None
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self.started_at = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.stopped_at = time.perf_counter()
+
+    def _run(self):
+        while not self._stop.wait(self.interval) and len(self.samples) < self.max_samples:
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append((time.perf_counter(), tuple(stack)))
+
+    def to_speedscope(self, name):
+        """
+        Export the samples in the speedscope file format
+        """
+        frames = []
+        frame_index = {}
+        samples = []
+        weights = []
+        previous = self.started_at
+        for timestamp, stack in self.samples:
+            indexes = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+                indexes.append(frame_index[frame])
+            samples.append(indexes)
+            weights.append(round((timestamp - previous) * 1000, 3))
+            previous = timestamp
+
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'auth_service',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': round((self.stopped_at - self.started_at) * 1000, 3),
+                'samples': samples,
+                'weights': weights,
+            }],
+        }
+
+def make_profile_token(user):
+    """
+    Signed token a staff user sends in the X-Profile-Token header to profile a request
+    """
+    return signing.TimestampSigner(salt=PROFILE_TOKEN_SALT).sign(str(user.pk))
+
+def staff_from_token(token):
+    from apps.users.models import User
+
+    try:
+        user_id = signing.TimestampSigner(salt=PROFILE_TOKEN_SALT).unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return User.objects.filter(pk=user_id, is_staff=True, is_active=True).first()
+
+def requested_by_staff(request):
+    """
+    Return the staff user who asked for this request to be profiled, if any
+    """
+    token = request.headers.get('X-Profile-Token')
+    if token:
+        return staff_from_token(token)
+    if request.GET.get('_profile') == '1':
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated and user.is_staff:
+            return user
+    return None
+
+def sample_automatically():
+    return settings.PROFILING_AUTO_SAMPLE_RATE > 0 and random.random() < settings.PROFILING_AUTO_SAMPLE_RATE
+
+def store_profile(request, response, profiler, view, trigger, requested_by=None):
+    """
+    Persist a captured profile. Automatic captures only keep the slowest requests per view.
+    """
+    from .models import RequestProfile
+
+    duration_ms = (profiler.stopped_at - profiler.started_at) * 1000
+
+    if trigger == RequestProfile.Trigger.AUTO:
+        if duration_ms < settings.PROFILING_AUTO_MIN_MS:
+            return None
+        kept = list(
+            RequestProfile.objects
+            .filter(view=view, trigger=RequestProfile.Trigger.AUTO)
+            .order_by('-duration_ms')
+            .values_list('id', 'duration_ms')
+        )
+        per_view = settings.PROFILING_AUTO_KEEP_PER_VIEW
+        if len(kept) >= per_view and duration_ms <= kept[per_view - 1][1]:
+            return None
+        stale = [pk for pk, _ in kept[per_view - 1:]]
+        if stale:
+            RequestProfile.objects.filter(id__in=stale).delete()
+
+    profile = RequestProfile.objects.create(
+        method=request.method,
+        path=request.get_full_path()[:500],
+        view=view,
+        status_code=response.status_code,
+        duration_ms=round(duration_ms, 3),
+        sample_count=len(profiler.samples),
+        trigger=trigger,
+        requested_by=requested_by,
+        speedscope=profiler.to_speedscope(f"{request.method} {view}"),
+    )
+
+    stale = RequestProfile.objects.order_by('-created_at').values_list('id', flat=True)[settings.PROFILING_KEEP:]
+    RequestProfile.objects.filter(id__in=list(stale)).delete()
+    return profile
@@ -0,0 +1,146 @@
+"""
+Per-view SQL query budgets.
+
+A view declares how many queries one request may issue, per handler with
+`@query_budget(n)` or for all of its handlers with a `query_budget = n` class attribute.
+QueryBudgetMiddleware counts every query of the request, authentication included.
+Transaction control (BEGIN, COMMIT, SAVEPOINT...) is not counted, and neither is code
+run under `exempt()`: one-off work such as a per-process warm-up or an archive restore.
+QUERY_BUDGET_MODE decides what happens when a view goes over:
+
+    off    nothing is counted
+    warn   log a warning with the SQL, for staging
+    raise  raise QueryBudgetExceeded listing the SQL and the code that issued each query
+
+QueryBudgetTestRunner runs the test suite in `raise` mode, and `max_queries()` applies a
+budget to any block of code in a test.
+"""
+import re
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+STACK_DEPTH = 6
+TRANSACTION_CONTROL = re.compile(r'\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b', re.IGNORECASE)
+
+_exempt = ContextVar('query_budget_exempt', default=False)
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+def query_budget(limit):
+    """
+    Declare the maximum number of SQL queries one request to the decorated handler may issue
+    """
+    def decorator(handler):
+        handler.query_budget = limit
+        return handler
+    return decorator
+
+@contextmanager
+def exempt():
+    """
+    Leave the queries of the block out of the request's budget
+    """
+    token = _exempt.set(True)
+    try:
+        yield
+    finally:
+        _exempt.reset(token)
+
+def budget_for(request):
+    """
+    The budget declared by the view that handled `request`, or None
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    view = match.func
+    view_class = getattr(view, 'cls', None) or getattr(view, 'view_class', None)
+    if view_class is None:
+        return getattr(view, 'query_budget', None)
+    actions = getattr(view, 'actions', None)
+    name = actions.get(request.method.lower()) if actions else request.method.lower()
+    handler = getattr(view_class, name, None) if name else None
+    budget = getattr(handler, 'query_budget', None)
+    return budget if budget is not None else getattr(view_class, 'query_budget', None)
+
+def _caller(stack):
+    # Keep the project's own frames: they say which line of our code issued the query
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in stack
+        if frame.filename.startswith(base_dir) and 'site-packages' not in frame.filename and frame.filename != __file__
+    ]
+    return traceback.format_list(frames[-STACK_DEPTH:])
+
+class QueryRecorder:
+    """
+    Database execute wrapper that keeps each query's SQL, duration and, optionally, the calling code
+    """
+    def __init__(self, with_stacks=False):
+        self.with_stacks = with_stacks
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if _exempt.get() or TRANSACTION_CONTROL.match(sql):
+            return execute(sql, params, many, context)
+        stack = traceback.extract_stack()[:-1] if self.with_stacks else None
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'duration': time.perf_counter() - started,
+                'stack': _caller(stack) if stack is not None else None,
+            })
+
+    def __len__(self):
+        return len(self.queries)
+
+    @contextmanager
+    def record(self, aliases=None):
+        with ExitStack() as stack:
+            for connection in connections.all() if aliases is None else (connections[alias] for alias in aliases):
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def report(self, label, limit):
+        lines = [f"{label} issued {len(self.queries)} queries, its budget is {limit}:"]
+        for number, query in enumerate(self.queries, 1):
+            lines.append(f"{number}. [{query['alias']}, {query['duration'] * 1000:.1f}ms] {query['sql']}")
+            if query['stack']:
+                lines.extend(f"     {line.rstrip()}" for line in ''.join(query['stack']).splitlines())
+        return '\n'.join(lines)
+
+@contextmanager
+def max_queries(limit, using=None):
+    """
+    Fail with the offending SQL if the block issues more than `limit` queries,
+    on the `using` aliases or on every database
+    """
+    recorder = QueryRecorder(with_stacks=True)
+    with recorder.record(using):
+        yield recorder
+    if len(recorder) > limit:
+        raise QueryBudgetExceeded(recorder.report('The block', limit))
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    """
+    Test runner that fails any request exceeding its view's query budget
+    """
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._query_budget_settings = override_settings(QUERY_BUDGET_MODE='raise')
+        self._query_budget_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._query_budget_settings.disable()
+        super().teardown_test_environment(**kwargs)
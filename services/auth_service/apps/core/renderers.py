@@ -0,0 +1,34 @@
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson is not None else 0
+
+_encoder = JSONEncoder()
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed and otherwise behaves exactly
+    like DRF's. Datetimes, Decimals, lazy strings and other non-native types are passed to
+    DRF's encoder so the output matches the stdlib renderer's compact form byte for byte.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except (orjson.JSONEncodeError, TypeError):
+            # Out-of-range integers and other values orjson refuses
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping as JSONRenderer, for embedding the output in <script> tags
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,47 @@
+import gzip
+import hashlib
+import logging
+import threading
+from django.conf import settings
+
+logger = logging.getLogger('apps.core')
+
+_artifact = None
+_lock = threading.Lock()
+
+class SchemaArtifact:
+    """
+    Prebuilt OpenAPI document with its precompressed body and ETag
+    """
+    def __init__(self, content):
+        self.content = content
+        self.gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+        self.etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+def generate_schema():
+    """
+    Introspect every view and serializer and render the schema as JSON bytes
+    """
+    from drf_spectacular.generators import SchemaGenerator
+    from drf_spectacular.renderers import OpenApiJsonRenderer
+
+    generator = SchemaGenerator()
+    schema = generator.get_schema(request=None, public=True)
+    return OpenApiJsonRenderer().render(schema, renderer_context={'indent': 2}) + b'\n'
+
+def get_artifact():
+    """
+    Load the committed schema once per process, generating it only if the file is missing
+    """
+    global _artifact
+    if _artifact is None:
+        with _lock:
+            if _artifact is None:
+                path = settings.OPENAPI_SCHEMA_PATH
+                try:
+                    content = path.read_bytes()
+                except FileNotFoundError:
+                    logger.warning(f"OpenAPI schema {path} not found, generating it in-process")
+                    content = generate_schema()
+                _artifact = SchemaArtifact(content)
+    return _artifact
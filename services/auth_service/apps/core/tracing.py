@@ -0,0 +1,263 @@
+import contextvars
+import json
+import logging
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+logger = logging.getLogger('apps.core')
+
+TRACEPARENT_RE = re.compile(r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+SPAN_KINDS = {'internal': 1, 'server': 2, 'client': 3, 'producer': 4, 'consumer': 5}
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    """
+    A single timed operation inside a trace
+    """
+    __slots__ = ('name', 'kind', 'trace_id', 'span_id', 'parent_id', 'sampled', 'attributes', 'start_ns', 'end_ns', 'error')
+
+    def __init__(self, name, trace_id, parent_id=None, sampled=True, kind='internal', attributes=None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self, error=None):
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        if self.sampled:
+            exporter = get_exporter()
+            if exporter is not None:
+                exporter.submit(self)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start_ns': self.start_ns,
+            'end_ns': self.end_ns,
+            'duration_ms': round((self.end_ns - self.start_ns) / 1_000_000, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+            'service': settings.TRACING_SERVICE_NAME,
+        }
+
+class _NoopSpan:
+    sampled = False
+
+    def set_attribute(self, key, value):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+def parse_traceparent(header):
+    """
+    Parse a W3C traceparent header into (trace_id, parent_id, sampled), or None if invalid
+    """
+    match = TRACEPARENT_RE.match((header or '').strip().lower())
+    if not match:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == 'ff' or trace_id == '0' * 32 or parent_id == '0' * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 0x01)
+
+def current_span():
+    return _current_span.get()
+
+def start_span(name, traceparent=None, kind='server', **attributes):
+    """
+    Start the root span of a request, continuing the caller's trace when a valid traceparent is given.
+    Returns the span and the context token needed by `end_span`.
+    """
+    parent = parse_traceparent(traceparent)
+    if parent:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+        sampled = random.random() < settings.TRACING_SAMPLE_RATE
+    root = Span(name, trace_id, parent_id, sampled=sampled, kind=kind, attributes=attributes)
+    return root, _current_span.set(root)
+
+def end_span(root, token, error=None):
+    _current_span.reset(token)
+    root.finish(error)
+
+@contextmanager
+def span(name, kind='internal', **attributes):
+    """
+    Trace a block as a child of the current span. Does nothing outside a sampled trace.
+    """
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        yield NOOP_SPAN
+        return
+
+    child = Span(name, parent.trace_id, parent.span_id, kind=kind, attributes=attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        _current_span.reset(token)
+        child.finish(exc)
+        raise
+    _current_span.reset(token)
+    child.finish()
+
+def inject_headers(headers=None):
+    """
+    Add the current traceparent to outgoing request headers
+    """
+    headers = dict(headers or {})
+    current = _current_span.get()
+    if current is not None:
+        headers['traceparent'] = current.traceparent
+    return headers
+
+class FileExporter:
+    """
+    Append finished spans as JSON lines to a local file
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        with open(self.path, 'a', encoding='utf-8') as fh:
+            for item in spans:
+                fh.write(json.dumps(item.to_dict(), default=str) + '\n')
+
+class OTLPHttpExporter:
+    """
+    Send finished spans to an OTLP/HTTP collector using the JSON encoding
+    """
+    def __init__(self, endpoint, timeout=2):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, spans):
+        import requests
+
+        payload = {
+            'resourceSpans': [{
+                'resource': {'attributes': [_otlp_attribute('service.name', settings.TRACING_SERVICE_NAME)]},
+                'scopeSpans': [{
+                    'scope': {'name': 'apps.core.tracing'},
+                    'spans': [_otlp_span(item) for item in spans],
+                }],
+            }],
+        }
+        requests.post(self.endpoint, json=payload, timeout=self.timeout)
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+def _otlp_span(item):
+    data = {
+        'traceId': item.trace_id,
+        'spanId': item.span_id,
+        'name': item.name,
+        'kind': SPAN_KINDS.get(item.kind, 1),
+        'startTimeUnixNano': str(item.start_ns),
+        'endTimeUnixNano': str(item.end_ns),
+        'attributes': [_otlp_attribute(key, value) for key, value in item.attributes.items()],
+        'status': {'code': 2, 'message': item.error} if item.error else {'code': 1},
+    }
+    if item.parent_id:
+        data['parentSpanId'] = item.parent_id
+    return data
+
+class BatchExporter:
+    """
+    Buffer finished spans and hand them to the backend exporter from a background thread
+    """
+    def __init__(self, backend, max_batch=512, interval=2.0, max_queue=10000):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.interval = interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        self._ensure_worker()
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_worker(self):
+        # Started lazily so forked workers each get their own thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.backend.export(batch)
+            except Exception as e:
+                logger.warning(f"Failed to export {len(batch)} spans: {e}")
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+def get_exporter():
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = _build_exporter()
+    return _exporter or None
+
+def _build_exporter():
+    kind = settings.TRACING_EXPORTER
+    if kind == 'file':
+        return BatchExporter(FileExporter(settings.TRACING_FILE_PATH))
+    if kind == 'otlp':
+        return BatchExporter(OTLPHttpExporter(settings.TRACING_OTLP_ENDPOINT))
+    return False
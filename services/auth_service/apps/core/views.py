@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from . import metrics, schema
+
+@require_GET
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Requires METRICS_AUTH_TOKEN as a bearer token, except with DEBUG on.
+    """
+    if not metrics.enabled():
+        return HttpResponse("Metrics are disabled", status=503, content_type='text/plain')
+
+    token = getattr(settings, 'METRICS_AUTH_TOKEN', '')
+    if token:
+        header = request.headers.get('Authorization', '')
+        if not constant_time_compare(header, f"Bearer {token}"):
+            return HttpResponse("Unauthorized", status=401, content_type='text/plain')
+    elif not settings.DEBUG:
+        return HttpResponse("Set METRICS_AUTH_TOKEN to enable scraping", status=403, content_type='text/plain')
+
+    body, content_type = metrics.render_latest()
+    return HttpResponse(body, content_type=content_type)
+
+@require_GET
+def schema_view(request):
+    """
+    Serve the prebuilt OpenAPI schema with ETag and Cache-Control instead of generating it per request
+    """
+    artifact = schema.get_artifact()
+    if artifact.etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = HttpResponse(artifact.gzipped, content_type='application/vnd.oai.openapi+json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(artifact.content, content_type='application/vnd.oai.openapi+json')
+    response['ETag'] = artifact.etag
+    response['Cache-Control'] = f"public, max-age={settings.OPENAPI_SCHEMA_MAX_AGE}"
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
@@ -0,0 +1,21 @@
+from django.contrib import admin
+from . import models
+
+@admin.register(models.Country)
+class CountryAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for Country model
+    """
+    list_display = ['code', 'alpha3', 'name']
+    search_fields = ['code', 'alpha3', 'name']
+
+@admin.register(models.City)
+class CityAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for City model
+    """
+    list_display = ['name', 'country', 'population']
+    list_filter = ['country']
+    search_fields = ['name']
+    list_select_related = ['country']
+    raw_id_fields = ['country']
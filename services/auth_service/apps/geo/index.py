@@ -0,0 +1,189 @@
+"""
+In-memory index over the country and city reference tables.
+
+It resolves free-text country and city names to reference rows and serves prefix
+autocomplete from sorted key lists with bisect, without touching the database per
+request. Each process builds it once; `load_geo` bumps a version in the cache and
+processes rebuild after seeing the new version.
+"""
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import namedtuple
+from django.core.cache import cache
+from apps.core import querybudget
+from apps.core.cache import CacheUnavailable
+
+VERSION_KEY = 'geo_index_version'
+VERSION_CHECK_INTERVAL = 60
+MAX_PREFIX_SCAN = 5000
+
+CountryEntry = namedtuple('CountryEntry', ['code', 'name'])
+CityEntry = namedtuple('CityEntry', ['id', 'name', 'country', 'population'])
+
+# Common spellings that are neither ISO names nor codes
+COUNTRY_ALIASES = {
+    'uk': 'GB',
+    'great britain': 'GB',
+    'britain': 'GB',
+    'england': 'GB',
+    'scotland': 'GB',
+    'wales': 'GB',
+    'america': 'US',
+    'united states of america': 'US',
+    'russia': 'RU',
+    'south korea': 'KR',
+    'north korea': 'KP',
+    'czech republic': 'CZ',
+    'holland': 'NL',
+    'deutschland': 'DE',
+    'ukraina': 'UA',
+    'україна': 'UA',
+    'россия': 'RU',
+    'polska': 'PL',
+    'espana': 'ES',
+    'italia': 'IT',
+    'turkey': 'TR',
+}
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+def normalize(text):
+    """
+    Case-fold, strip accents and punctuation and collapse whitespace
+    """
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _NON_WORD.sub(' ', text).strip()
+
+class GeoIndex:
+    def __init__(self, countries, cities):
+        self.countries = {}
+        self.country_keys = {}
+        for code, alpha3, name, official_name in countries:
+            self.countries[code] = CountryEntry(code, name)
+            for key in (code, alpha3, name, official_name):
+                if key:
+                    self.country_keys[normalize(key)] = code
+        for alias, code in COUNTRY_ALIASES.items():
+            if code in self.countries:
+                self.country_keys.setdefault(normalize(alias), code)
+        self.country_names = sorted((normalize(entry.name), code) for code, entry in self.countries.items())
+
+        self.cities = {}
+        self.city_by_name = {}
+        keys = []
+        for city_id, name, country, population, search_name in cities:
+            self.cities[city_id] = CityEntry(city_id, name, country, population)
+            keys.append((search_name, -population, city_id))
+        keys.sort()
+        # keys are sorted largest city first within a name, so setdefault keeps the largest
+        for search_name, _, city_id in keys:
+            self.city_by_name.setdefault((self.cities[city_id].country, search_name), city_id)
+            self.city_by_name.setdefault((None, search_name), city_id)
+        self.city_keys = keys
+        self.city_keys_by_country = {}
+        for key in keys:
+            self.city_keys_by_country.setdefault(self.cities[key[2]].country, []).append(key)
+
+    def resolve_country(self, text):
+        if not text:
+            return None
+        return self.country_keys.get(normalize(text))
+
+    def resolve_city(self, text, country=None):
+        if not text:
+            return None
+        return self.city_by_name.get((country, normalize(text)))
+
+    def autocomplete_cities(self, prefix, country=None, limit=10):
+        """
+        Largest cities whose name starts with `prefix`
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        keys = self.city_keys_by_country.get(country, []) if country else self.city_keys
+        start = bisect_left(keys, (prefix,))
+        matches = []
+        for key in keys[start:start + MAX_PREFIX_SCAN]:
+            if not key[0].startswith(prefix):
+                break
+            matches.append(key)
+        return [self.cities[city_id] for _, _, city_id in heapq.nsmallest(limit, matches, key=lambda key: key[1])]
+
+    def autocomplete_countries(self, prefix, limit=10):
+        prefix = normalize(prefix)
+        start = bisect_left(self.country_names, (prefix,))
+        results = []
+        for name, code in self.country_names[start:]:
+            if not name.startswith(prefix) or len(results) >= limit:
+                break
+            results.append(self.countries[code])
+        return results
+
+def build_index(using='default'):
+    from .models import City, Country
+
+    countries = Country.objects.using(using).values_list('code', 'alpha3', 'name', 'official_name')
+    cities = City.objects.using(using).order_by().values_list('id', 'name', 'country_id', 'population', 'search_name')
+    return GeoIndex(list(countries), list(cities))
+
+_index = None
+_index_version = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+def get_index():
+    """
+    Return this process's index, rebuilding it when `load_geo` has published a new version
+    """
+    global _index, _index_version, _checked_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < VERSION_CHECK_INTERVAL:
+        return _index
+
+    with _lock:
+        try:
+            version = cache.get(VERSION_KEY, 0)
+        except CacheUnavailable:
+            version = _index_version
+        if _index is None or version != _index_version:
+            # A once-per-process load, not part of the request that happens to trigger it
+            with querybudget.exempt():
+                _index = build_index()
+            _index_version = version
+        _checked_at = now
+    return _index
+
+def publish_new_version():
+    try:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+    except CacheUnavailable:
+        pass
+
+def normalize_profile(profile):
+    """
+    Point a profile's country and city at reference rows and use their canonical names.
+    Unknown names keep their text and get no reference. The country is only taken from the
+    city when none was given: a city is not looked up outside a country the user named.
+    Returns the fields to save.
+    """
+    index = get_index()
+    country = index.resolve_country(profile.country)
+    city = None
+    if country is not None or not profile.country:
+        city = index.resolve_city(profile.city, country)
+    if city is not None and country is None:
+        country = index.cities[city].country
+
+    profile.country_ref_id = country
+    profile.city_ref_id = city
+    if country is not None:
+        profile.country = index.countries[country].name
+    if city is not None:
+        profile.city = index.cities[city].name
+    return ['country', 'city', 'country_ref', 'city_ref']
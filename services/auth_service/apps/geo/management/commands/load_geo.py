@@ -0,0 +1,84 @@
+import csv
+import gzip
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from apps.geo import index, models
+from apps.users import sharding
+
+DATA_DIR = Path(__file__).resolve().parents[2] / 'data'
+
+def _open(path):
+    path = Path(path)
+    if not path.exists():
+        raise CommandError(f"{path} does not exist")
+    if path.suffix == '.gz':
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+def _rows(path):
+    with _open(path) as fh:
+        for row in csv.reader(fh, delimiter='\t', quoting=csv.QUOTE_NONE):
+            if row and not row[0].startswith('#'):
+                yield row
+
+class Command(BaseCommand):
+    """
+    Load the bundled ISO countries and GeoNames cities, or a full GeoNames dump, into the reference tables
+    """
+    help = "Load country and city reference data from offline files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--countries', default=DATA_DIR / 'countries.tsv')
+        parser.add_argument('--cities', default=DATA_DIR / 'cities.tsv', help="Bundled cities file or a GeoNames dump such as cities15000.txt")
+        parser.add_argument('--min-population', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        countries = [
+            models.Country(code=code, alpha3=alpha3, name=name, official_name=official_name)
+            for code, alpha3, name, official_name in _rows(options['countries'])
+        ]
+        known = {country.code for country in countries}
+        cities = [city for city in self.read_cities(options['cities'], options['min_population']) if city.country_id in known]
+
+        # Reference data is replicated to every shard so profile foreign keys stay local
+        databases = sharding.shards() if sharding.enabled() else ['default']
+        for using in databases:
+            with transaction.atomic(using=using):
+                models.Country.objects.using(using).bulk_create(
+                    countries,
+                    batch_size=options['batch_size'],
+                    update_conflicts=True,
+                    unique_fields=['code'],
+                    update_fields=['alpha3', 'name', 'official_name'],
+                )
+                models.City.objects.using(using).bulk_create(
+                    cities,
+                    batch_size=options['batch_size'],
+                    update_conflicts=True,
+                    unique_fields=['id'],
+                    update_fields=['country', 'name', 'search_name', 'population'],
+                )
+            self.stdout.write(f"{using}: loaded {len(countries)} countries and {len(cities)} cities")
+
+        index.publish_new_version()
+
+    def read_cities(self, path, min_population):
+        for row in _rows(path):
+            if len(row) >= 19:
+                # GeoNames dump: geonameid, name, asciiname, alternatenames, lat, lng, feature class,
+                # feature code, country code, cc2, admin1-4, population, ...
+                city_id, name, country, population = row[0], row[1], row[8], row[14]
+            else:
+                city_id, name, country, population = row[:4]
+            population = int(population or 0)
+            if population < min_population:
+                continue
+            yield models.City(
+                id=int(city_id),
+                country_id=country,
+                name=name,
+                search_name=index.normalize(name),
+                population=population,
+            )
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Country',
+            fields=[
+                ('code', models.CharField(max_length=2, primary_key=True, serialize=False)),
+                ('alpha3', models.CharField(max_length=3, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('official_name', models.CharField(blank=True, default='', max_length=150)),
+            ],
+            options={
+                'verbose_name': 'country',
+                'verbose_name_plural': 'countries',
+                'db_table': 'geo_country',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('search_name', models.CharField(max_length=200)),
+                ('population', models.PositiveBigIntegerField(default=0)),
+                ('country', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='cities', to='geo.country')),
+            ],
+            options={
+                'verbose_name': 'city',
+                'verbose_name_plural': 'cities',
+                'db_table': 'geo_city',
+                'ordering': ['-population'],
+                'indexes': [models.Index(fields=['country', 'search_name'], name='geo_city_country_name_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import models
+
+class Country(models.Model):
+    """
+    ISO 3166-1 country
+    """
+    code = models.CharField(max_length=2, primary_key=True)
+    alpha3 = models.CharField(max_length=3, unique=True)
+    name = models.CharField(max_length=100)
+    official_name = models.CharField(max_length=150, blank=True, default='')
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        db_table = 'geo_country'
+        verbose_name = 'country'
+        verbose_name_plural = 'countries'
+        ordering = ['name']
+
+class City(models.Model):
+    """
+    City from the GeoNames dump, keyed by its GeoNames id
+    """
+    id = models.PositiveIntegerField(primary_key=True)
+    country = models.ForeignKey(Country, on_delete=models.CASCADE, related_name='cities', db_index=False)
+    name = models.CharField(max_length=200)
+    search_name = models.CharField(max_length=200)
+    population = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}, {self.country_id}"
+
+    class Meta:
+        db_table = 'geo_city'
+        verbose_name = 'city'
+        verbose_name_plural = 'cities'
+        ordering = ['-population']
+        indexes = [
+            models.Index(fields=['country', 'search_name'], name='geo_city_country_name_idx'),
+        ]
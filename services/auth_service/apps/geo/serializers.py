@@ -0,0 +1,25 @@
+from rest_framework import serializers
+
+class CountrySerializer(serializers.Serializer):
+    """
+    Country entry from the in-memory index
+    """
+    code = serializers.CharField()
+    name = serializers.CharField()
+
+class CitySerializer(serializers.Serializer):
+    """
+    City entry from the in-memory index
+    """
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    country = serializers.CharField()
+    population = serializers.IntegerField()
+
+class CountryStatsSerializer(serializers.Serializer):
+    """
+    Number of profiles per country
+    """
+    code = serializers.CharField()
+    name = serializers.CharField()
+    profiles = serializers.IntegerField()
@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('countries/', views.CountryAutocompleteView.as_view(), name='geo-countries'),
+    path('cities/', views.CityAutocompleteView.as_view(), name='geo-cities'),
+    path('stats/', views.CountryStatsView.as_view(), name='geo-stats'),
+]
@@ -0,0 +1,127 @@
+import logging
+from django.core.cache import cache
+from django.db.models import Count
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from apps.authentication.permissions import IsAdminRole
+from apps.core.cache import CacheUnavailable
+from apps.core.querybudget import query_budget
+from apps.users import models as user_models, sharding
+from . import index, serializers
+
+logger = logging.getLogger('apps.geo')
+
+MAX_LIMIT = 50
+STATS_TIMEOUT = 300
+
+def _limit(request, default=10):
+    return max(1, min(int(request.query_params.get('limit', default)), MAX_LIMIT))
+
+class CountryAutocompleteView(APIView):
+    """
+    Countries whose name starts with `q`, or all countries without it
+    """
+    permission_classes = [permissions.AllowAny]
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('q', str, description="Name prefix"),
+            OpenApiParameter('limit', int, description=f"Maximum number of results, at most {MAX_LIMIT}"),
+        ],
+        responses=serializers.CountrySerializer(many=True),
+    )
+    @query_budget(0)
+    def get(self, request):
+        geo_index = index.get_index()
+        prefix = request.query_params.get('q', '')
+        if prefix:
+            try:
+                limit = _limit(request)
+            except ValueError:
+                return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+            results = geo_index.autocomplete_countries(prefix, limit)
+        else:
+            results = sorted(geo_index.countries.values(), key=lambda entry: entry.name)
+        response = Response([entry._asdict() for entry in results])
+        response['Cache-Control'] = 'public, max-age=300'
+        return response
+
+class CityAutocompleteView(APIView):
+    """
+    Largest cities whose name starts with `q`, optionally within one country
+    """
+    permission_classes = [permissions.AllowAny]
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('q', str, required=True, description="Name prefix"),
+            OpenApiParameter('country', str, description="ISO 3166-1 alpha-2 country code"),
+            OpenApiParameter('limit', int, description=f"Maximum number of results, at most {MAX_LIMIT}"),
+        ],
+        responses=serializers.CitySerializer(many=True),
+    )
+    @query_budget(0)
+    def get(self, request):
+        prefix = request.query_params.get('q', '')
+        if not prefix.strip():
+            return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = _limit(request)
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        country = request.query_params.get('country', '').upper() or None
+        results = index.get_index().autocomplete_cities(prefix, country, limit)
+        response = Response([entry._asdict() for entry in results])
+        response['Cache-Control'] = 'public, max-age=300'
+        return response
+
+class CountryStatsView(APIView):
+    """
+    Profile counts per country, optionally for one user role
+    """
+    permission_classes = [IsAdminRole]
+
+    # Not budgeted: a cache miss runs one count per shard
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('role', str, enum=user_models.User.UserRoleChoice.values, description="Only count users with this role"),
+        ],
+        responses=serializers.CountryStatsSerializer(many=True),
+    )
+    def get(self, request):
+        role = request.query_params.get('role')
+        if role and role not in user_models.User.UserRoleChoice.values:
+            return Response({"error": "Unknown role"}, status=status.HTTP_400_BAD_REQUEST)
+
+        key = f"geo_country_stats_{role or 'all'}"
+        try:
+            stats = cache.get(key)
+        except CacheUnavailable:
+            stats = None
+        if stats is None:
+            stats = self.country_counts(role)
+            try:
+                cache.set(key, stats, timeout=STATS_TIMEOUT)
+            except CacheUnavailable as cache_error:
+                logger.warning(f"Cache unavailable storing country stats: {cache_error}")
+        return Response(stats)
+
+    def country_counts(self, role):
+        counts = {}
+        databases = sharding.shards() if sharding.enabled() else ['default']
+        for using in databases:
+            # Grouping by country_ref alone is served by user_profile_country_city_idx
+            queryset = user_models.Profile.objects.using(using).filter(country_ref__isnull=False)
+            if role:
+                queryset = queryset.filter(user__role=role)
+            for code, profiles in queryset.values_list('country_ref').annotate(profiles=Count('*')).order_by():
+                counts[code] = counts.get(code, 0) + profiles
+
+        countries = index.get_index().countries
+        return [
+            {'code': code, 'name': countries[code].name if code in countries else code, 'profiles': profiles}
+            for code, profiles in sorted(counts.items(), key=lambda item: -item[1])
+        ]
@@ -0,0 +1,150 @@
+"""
+Buffered last_login / last_seen tracking.
+
+Authenticated requests and logins record the user in an in-process buffer instead of
+writing auth_user. Timestamps are rounded down to ACTIVITY_GRANULARITY seconds and a user
+whose loaded row is already in the current slot is skipped, so a busy user costs one
+dict write per slot at most. A daemon thread per worker flushes the buffer every
+ACTIVITY_FLUSH_INTERVAL seconds (sooner once it holds ACTIVITY_BUFFER_SIZE users) as one
+batched `UPDATE ... FROM (VALUES ...)` per database and field. Timestamps only move
+forward, so flushes from different workers can land in any order.
+
+A worker that dies without exiting cleanly loses at most one interval of activity; the
+age of the oldest unflushed timestamp is exported as auth_activity_flush_lag_seconds.
+"""
+import logging
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+from apps.core import metrics
+from apps.core.buffering import BackgroundFlusher
+from . import models, sharding
+
+logger = logging.getLogger('apps.users')
+
+FIELDS = ('last_login', 'last_seen')
+UPDATE_BATCH_SIZE = 1000
+
+def truncate(moment):
+    """
+    Round `moment` down to the ACTIVITY_GRANULARITY grid
+    """
+    granularity = settings.ACTIVITY_GRANULARITY
+    seconds = int(moment.timestamp())
+    return datetime.fromtimestamp(seconds - seconds % granularity, tz=dt_timezone.utc)
+
+def _database(user_id):
+    return sharding.shard_for_id(user_id) if sharding.enabled() else 'default'
+
+def update_sql(connection, field, rows):
+    """
+    One UPDATE setting `field` from `rows` of (user id, timestamp), skipping rows whose
+    stored value is already newer
+    """
+    quote = connection.ops.quote_name
+    table = quote(models.User._meta.db_table)
+    pk = quote(models.User._meta.pk.column)
+    column = quote(models.User._meta.get_field(field).column)
+    values = ', '.join(['(%s, %s)'] * len(rows))
+    # VALUES columns are column1, column2 on both PostgreSQL and SQLite
+    sql = (
+        f"UPDATE {table} SET {column} = v.column2 FROM (VALUES {values}) AS v "
+        f"WHERE {table}.{pk} = v.column1 AND ({table}.{column} IS NULL OR {table}.{column} < v.column2)"
+    )
+    params = []
+    for user_id, moment in rows:
+        params += [user_id, connection.ops.adapt_datetimefield_value(moment)]
+    return sql, params
+
+class ActivityBuffer(BackgroundFlusher):
+    interval_setting = 'ACTIVITY_FLUSH_INTERVAL'
+    thread_name = 'activity-flusher'
+
+    def __init__(self):
+        super().__init__()
+        self._pending = {field: {} for field in FIELDS}
+        self._oldest = None
+
+    def record(self, user, fields):
+        """
+        Buffer the current slot for `fields` of `user`, unless the loaded row already has it
+        """
+        moment = truncate(timezone.now())
+        stale = [field for field in fields if getattr(user, field) is None or getattr(user, field) < moment]
+        if not stale:
+            return
+        self.start()
+        with self._lock:
+            for field in stale:
+                pending = self._pending[field]
+                if pending.get(user.pk, moment) <= moment:
+                    pending[user.pk] = moment
+            if self._oldest is None:
+                self._oldest = timezone.now()
+            full = max(len(users) for users in self._pending.values()) >= settings.ACTIVITY_BUFFER_SIZE
+        if full:
+            self.wake()
+
+    def lag(self):
+        """
+        Seconds since the oldest unflushed activity was recorded, 0 when the buffer is empty
+        """
+        oldest = self._oldest
+        return (timezone.now() - oldest).total_seconds() if oldest is not None else 0.0
+
+    def flush(self):
+        """
+        Write the buffer out, one UPDATE per database, field and UPDATE_BATCH_SIZE users.
+        Entries that fail to write go back into the buffer. Returns the number of rows updated.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {field: {} for field in FIELDS}
+            oldest, self._oldest = self._oldest, None
+        if oldest is None:
+            metrics.observe_activity_lag(0.0)
+            return 0
+        metrics.observe_activity_lag((timezone.now() - oldest).total_seconds())
+
+        updated = 0
+        for field, moments in pending.items():
+            by_database = {}
+            for user_id, moment in moments.items():
+                by_database.setdefault(_database(user_id), []).append((user_id, moment))
+            for using, rows in by_database.items():
+                connection = connections[using]
+                for start in range(0, len(rows), UPDATE_BATCH_SIZE):
+                    batch = rows[start:start + UPDATE_BATCH_SIZE]
+                    try:
+                        with connection.cursor() as cursor:
+                            cursor.execute(*update_sql(connection, field, batch))
+                            updated += cursor.rowcount
+                    except DatabaseError as e:
+                        logger.error(f"Could not write {field} for {len(batch)} users on {using}: {e}")
+                        self._requeue(field, batch, oldest)
+                    else:
+                        metrics.observe_activity_flush(field, len(batch))
+        return updated
+
+    def _requeue(self, field, rows, oldest):
+        with self._lock:
+            pending = self._pending[field]
+            for user_id, moment in rows:
+                if pending.get(user_id, moment) <= moment:
+                    pending[user_id] = moment
+            if self._oldest is None or oldest < self._oldest:
+                self._oldest = oldest
+
+buffer = ActivityBuffer()
+
+def seen(user):
+    """
+    Record an authenticated request by `user`
+    """
+    buffer.record(user, ('last_seen',))
+
+def logged_in(user):
+    """
+    Record a login by `user`, which also counts as being seen
+    """
+    buffer.record(user, FIELDS)
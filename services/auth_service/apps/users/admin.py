@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import format_html
-from . import models
+from apps.geo import index as geo_index
+from . import archive, models
 
 @admin.register(models.User)
 class UserAdmin(BaseUserAdmin):
@@ -17,7 +18,7 @@ class UserAdmin(BaseUserAdmin):
         (None, {'fields': ('email', 'password')}),
         ('Personal info', {'fields': ('username', 'first_name', 'last_name')}),
         ('Permissions', {'fields': ('is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions')}),
-        ('Important dates', {'fields': ('last_login', 'date_joined')}),
+        ('Important dates', {'fields': ('last_login', 'last_seen', 'date_joined')}),
     )
     
     add_fieldsets = (
@@ -27,7 +28,7 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
     
-    readonly_fields = ['date_joined', 'last_login']
+    readonly_fields = ['date_joined', 'last_login', 'last_seen']
 
 @admin.register(models.Profile)
 class ProfileAdmin(admin.ModelAdmin):
@@ -35,9 +36,14 @@ class ProfileAdmin(admin.ModelAdmin):
     Admin configuration for Profile model
     """
     list_display = ['user', 'city', 'country', 'date_birth', 'avatar_preview']
-    list_filter = ['city', 'country', 'date_birth']
+    list_filter = ['country_ref', 'date_birth']
     search_fields = ['user__email', 'user__username', 'city', 'country']
     raw_id_fields = ['user']
+    readonly_fields = ['country_ref', 'city_ref']
+    
+    def save_model(self, request, obj, form, change):
+        geo_index.normalize_profile(obj)
+        super().save_model(request, obj, form, change)
     
     def avatar_preview(self, obj):
         if obj.avatar:
@@ -48,5 +54,29 @@ class ProfileAdmin(admin.ModelAdmin):
     fieldsets = (
         ('User', {'fields': ('user',)}),
         ('Personal Info', {'fields': ('city', 'country', 'date_birth')}),
+        ('Reference data', {'fields': ('country_ref', 'city_ref')}),
         ('Avatar', {'fields': ('avatar',)}),
-    )
\ No newline at end of file
+    )
+@admin.register(models.ArchivedUser)
+class ArchivedUserAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for ArchivedUser model
+    """
+    list_display = ['email', 'username', 'reason', 'last_login', 'archived_at']
+    list_filter = ['reason', 'archived_at']
+    search_fields = ['email', 'username']
+    ordering = ['-archived_at']
+    exclude = ['payload']
+    readonly_fields = ['id', 'email', 'username', 'reason', 'last_login', 'archived_at']
+    actions = ['restore']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description="Restore selected users")
+    def restore(self, request, queryset):
+        restored = sum(1 for archived in queryset if archive.restore_user(archived.email) is not None)
+        self.message_user(request, f"Restored {restored} users")
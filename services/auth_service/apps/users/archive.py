@@ -0,0 +1,215 @@
+"""
+Archive dormant users out of the hot tables and restore them on demand.
+
+A user is archived as one ArchivedUser row holding its user, profile and group and
+permission links as zlib-compressed JSON, on the same database as the user. Its
+outstanding and blacklisted refresh tokens are deleted with it. Archived users are
+restored when they log in or request an OTP, with their original id.
+"""
+import json
+import logging
+import zlib
+from datetime import timedelta
+from django.contrib.auth.hashers import check_password
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from apps.core import metrics, querybudget
+from apps.core.cache import CacheUnavailable
+from . import managers, models, sharding
+
+logger = logging.getLogger('apps.users')
+
+HOT_TABLES = (
+    'auth_user',
+    'user_profile',
+    'auth_user_groups',
+    'auth_user_user_permissions',
+    'token_blacklist_outstandingtoken',
+    'token_blacklist_blacklistedtoken',
+    'user_archive',
+)
+
+def databases():
+    return sharding.shards() if sharding.enabled() else ['default']
+
+def dormant_users(using, months, include_inactive=True):
+    """
+    Users not seen in `months` months. Migration 0011 backfilled last_seen from refresh
+    tokens and last_login, so it is NULL only for users with no recorded activity, who are
+    judged by their sign-up date.
+    """
+    cutoff = timezone.now() - timedelta(days=30 * months)
+    dormant = Q(last_seen__lt=cutoff) | Q(
+        Q(last_login__lt=cutoff) | Q(last_login__isnull=True, date_joined__lt=cutoff),
+        last_seen__isnull=True,
+    )
+    if include_inactive:
+        dormant |= Q(is_active=False)
+    return models.User.objects.using(using).filter(dormant, is_staff=False, is_superuser=False)
+
+def _dump(obj):
+    data = {}
+    for field in obj._meta.concrete_fields:
+        value = field.value_from_object(obj)
+        data[field.attname] = (value.name or None) if isinstance(value, FieldFile) else value
+    return data
+
+def _load(model, data):
+    values = {}
+    for field in model._meta.concrete_fields:
+        if field.attname in data:
+            value = data[field.attname]
+            values[field.attname] = None if value is None else field.to_python(value)
+    return model(**values)
+
+def _compress(data):
+    return zlib.compress(json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode(), 6)
+
+def _decompress(payload):
+    return json.loads(zlib.decompress(bytes(payload)))
+
+def archive_batch(queryset, using, batch_size):
+    """
+    Archive one batch of users from `queryset` in a short transaction.
+    Rows locked by other transactions are skipped and picked up by a later run.
+    """
+    with transaction.atomic(using=using):
+        users = list(queryset.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+        if not users:
+            return 0
+
+        ids = [user.id for user in users]
+        profiles = {profile.user_id: profile for profile in models.Profile.objects.using(using).filter(user_id__in=ids)}
+        groups = {}
+        for user_id, group_id in models.User.groups.through.objects.using(using).filter(user_id__in=ids).values_list('user_id', 'group_id'):
+            groups.setdefault(user_id, []).append(group_id)
+        permissions = {}
+        for user_id, permission_id in models.User.user_permissions.through.objects.using(using).filter(user_id__in=ids).values_list('user_id', 'permission_id'):
+            permissions.setdefault(user_id, []).append(permission_id)
+
+        archived = []
+        for user in users:
+            profile = profiles.get(user.id)
+            archived.append(models.ArchivedUser(
+                id=user.id,
+                email=user.email,
+                username=user.username,
+                reason=models.ArchivedUser.Reason.DORMANT if user.is_active else models.ArchivedUser.Reason.INACTIVE,
+                last_login=user.last_login,
+                payload=_compress({
+                    'user': _dump(user),
+                    'profile': _dump(profile) if profile else None,
+                    'groups': groups.get(user.id, []),
+                    'permissions': permissions.get(user.id, []),
+                }),
+            ))
+        models.ArchivedUser.objects.using(using).bulk_create(archived)
+        # Outstanding tokens outlive their user (SET_NULL), so delete them explicitly
+        BlacklistedToken.objects.using(using).filter(token__user_id__in=ids).delete()
+        OutstandingToken.objects.using(using).filter(user_id__in=ids).delete()
+        models.User.objects.using(using).filter(id__in=ids).delete()
+
+    try:
+        cache.delete_many([f"user_{user_id}" for user_id in ids])
+    except CacheUnavailable:
+        pass
+    for reason in models.ArchivedUser.Reason.values:
+        metrics.observe_archive('archived', reason, sum(1 for row in archived if row.reason == reason))
+    return len(ids)
+
+def restore_user(email, password=None):
+    """
+    Move an archived user back into the hot tables and return it. With a password,
+    the user is only restored if it matches, so failed logins cannot restore accounts.
+    """
+    email = managers.canonical_email(email)
+    if not email:
+        return None
+    using = sharding.shard_for_email(email) if sharding.enabled() else 'default'
+    if not models.ArchivedUser.objects.using(using).filter(email=email).exists():
+        return None
+    return restore_archived(using, email=email, password=password)
+
+def restore_archived(using, password=None, **lookup):
+    """
+    Restore the archived user matching `lookup` on `using`, see restore_user().
+    A restore happens once per user, so its queries do not count against the view's budget.
+    """
+    with querybudget.exempt():
+        return _restore_archived(using, password, lookup)
+
+def _restore_archived(using, password, lookup):
+    with transaction.atomic(using=using):
+        archived = models.ArchivedUser.objects.using(using).select_for_update().filter(**lookup).first()
+        if archived is None:
+            return None
+        data = _decompress(archived.payload)
+        if password is not None and not check_password(password, data['user']['password']):
+            return None
+
+        # bulk_create skips save signals: a restored user is not a new registration
+        user = _load(models.User, data['user'])
+        date_joined = user.date_joined
+        models.User.objects.using(using).bulk_create([user])
+        # date_joined is auto_now_add, so bulk_create stamped it with the current time
+        models.User.objects.using(using).filter(id=user.id).update(date_joined=date_joined)
+        if data['profile']:
+            profile = _load(models.Profile, data['profile'])
+            profile.pk = None
+            models.Profile.objects.using(using).bulk_create([profile])
+        models.User.groups.through.objects.using(using).bulk_create([
+            models.User.groups.through(user_id=user.id, group_id=group_id) for group_id in data['groups']
+        ])
+        models.User.user_permissions.through.objects.using(using).bulk_create([
+            models.User.user_permissions.through(user_id=user.id, permission_id=permission_id) for permission_id in data['permissions']
+        ])
+        archived.delete()
+
+    metrics.observe_archive('restored', archived.reason)
+    logger.info(f"Restored archived user {user.id}")
+    return models.User.objects.using(using).get(id=user.id)
+
+def is_archived_username(username):
+    # Usernames carry no shard key, so every shard is asked
+    return any(models.ArchivedUser.objects.using(using).filter(username=username).exists() for using in databases())
+
+def table_sizes(using='default'):
+    """
+    Heap and index sizes of the hot tables from the PostgreSQL catalogs, or None on other backends
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname, pg_relation_size(c.oid), pg_indexes_size(c.oid), pg_total_relation_size(c.oid), c.reltuples::bigint
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relname = ANY(%s) AND c.relkind = 'r' AND n.nspname = current_schema()
+            """,
+            [list(HOT_TABLES)],
+        )
+        tables = {
+            name: {'heap': heap, 'indexes': indexes, 'total': total, 'rows': rows}
+            for name, heap, indexes, total, rows in cursor.fetchall()
+        }
+        cursor.execute(
+            """
+            SELECT t.relname, i.relname, pg_relation_size(i.oid)
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            JOIN pg_class t ON t.oid = x.indrelid
+            JOIN pg_namespace n ON n.oid = t.relnamespace
+            WHERE t.relname = ANY(%s) AND n.nspname = current_schema()
+            """,
+            [list(HOT_TABLES)],
+        )
+        indexes = {index: {'table': table, 'bytes': size} for table, index, size in cursor.fetchall()}
+    return {'tables': tables, 'indexes': indexes}
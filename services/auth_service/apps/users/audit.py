@@ -0,0 +1,223 @@
+"""
+Authentication audit trail.
+
+Views call `record()`, which appends the raw event to an in-process buffer; nothing is
+validated or written on the request path. A daemon thread per worker inserts the
+buffer every AUDIT_FLUSH_INTERVAL seconds, or as soon as AUDIT_BATCH_SIZE events are
+waiting, with one multi-row INSERT per AUDIT_BATCH_SIZE events. If the database is down
+the buffer keeps at most AUDIT_BUFFER_SIZE events and drops the oldest beyond that.
+
+On PostgreSQL user_auth_audit is range-partitioned by day. `manage.py audit_partitions`
+creates partitions ahead of time and drops the ones past AUDIT_RETENTION_DAYS, so
+retention never deletes rows one by one. The flusher creates a missing partition itself
+rather than lose events if the command has not run.
+"""
+import ipaddress
+import logging
+from collections import deque
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import DataError, DatabaseError, IntegrityError, connections
+from django.utils import timezone
+from rest_framework.throttling import BaseThrottle
+from apps.core import metrics
+from apps.core.buffering import BackgroundFlusher
+from . import managers, models
+
+logger = logging.getLogger('apps.users')
+
+Event = models.AuthAuditEvent.Event
+TABLE = models.AuthAuditEvent._meta.db_table
+PARTITION_PREFIX = f"{TABLE}_p"
+
+# The client address as throttling sees it: REMOTE_ADDR, or X-Forwarded-For as set by the
+# REST_FRAMEWORK['NUM_PROXIES'] trusted proxies
+_ident = BaseThrottle().get_ident
+
+def _ip(value):
+    try:
+        return str(ipaddress.ip_address(value))
+    except ValueError:
+        return None
+
+def _clean(value, length):
+    # PostgreSQL rejects NUL characters in text, which would fail the whole batch
+    return value.replace('\x00', '')[:length]
+
+def record(event, request, user=None, email='', detail=''):
+    """
+    Buffer an audit event for `request`. `user` may be None for failed logins and OTP
+    requests, in which case `email` identifies the account. Only the raw values are
+    kept here; validation and model instances are left to the flusher.
+    """
+    buffer.add((
+        timezone.now(),
+        event,
+        user.pk if user is not None else None,
+        user.email if user is not None else email,
+        _ident(request),
+        request.META.get('HTTP_USER_AGENT', ''),
+        str(detail),
+    ))
+
+def build(entry):
+    created_at, event, user_id, email, ip, user_agent, detail = entry
+    return models.AuthAuditEvent(
+        created_at=created_at,
+        event=event,
+        user_id=user_id,
+        email=_clean(managers.canonical_email(email), 254),
+        ip=_ip(ip),
+        user_agent=_clean(user_agent, 255),
+        detail=_clean(detail, 255),
+    )
+
+class AuditBuffer(BackgroundFlusher):
+    interval_setting = 'AUDIT_FLUSH_INTERVAL'
+    thread_name = 'audit-flusher'
+
+    def __init__(self):
+        super().__init__()
+        self._pending = deque()
+        self._partitions = set()
+
+    def add(self, entry):
+        self.start()
+        with self._lock:
+            dropped = len(self._pending) >= settings.AUDIT_BUFFER_SIZE
+            if dropped:
+                self._pending.popleft()
+            self._pending.append(entry)
+            full = len(self._pending) >= settings.AUDIT_BATCH_SIZE
+        if dropped:
+            metrics.observe_audit('dropped')
+        if full:
+            self.wake()
+
+    def flush(self):
+        """
+        Insert the buffered events. A batch that fails goes back to the front of the
+        buffer for the next flush. Returns the number of events written.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, deque()
+        written = 0
+        batch_size = settings.AUDIT_BATCH_SIZE
+        while pending:
+            batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+            try:
+                self._ensure_partitions({entry[0].astimezone(dt_timezone.utc).date() for entry in batch})
+                models.AuthAuditEvent.objects.bulk_create([build(entry) for entry in batch])
+            except (DataError, IntegrityError) as e:
+                # Retrying would fail the same way
+                logger.error(f"Dropped {len(batch)} audit events the database rejected: {e}")
+                metrics.observe_audit('dropped', len(batch))
+                continue
+            except DatabaseError as e:
+                logger.error(f"Could not write {len(batch) + len(pending)} audit events: {e}")
+                self._requeue(batch + list(pending))
+                break
+            written += len(batch)
+        metrics.observe_audit('written', written)
+        return written
+
+    def _requeue(self, entries):
+        with self._lock:
+            room = settings.AUDIT_BUFFER_SIZE - len(self._pending)
+            kept = entries[-room:] if room > 0 else []
+            self._pending.extendleft(reversed(kept))
+        metrics.observe_audit('dropped', len(entries) - len(kept))
+
+    def _ensure_partitions(self, days):
+        missing = days - self._partitions
+        if missing:
+            create_partitions(sorted(missing))
+            self._partitions |= missing
+
+buffer = AuditBuffer()
+
+def partition_name(day):
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+def _day_start(day):
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+def is_partitioned(using='default'):
+    return connections[using].vendor == 'postgresql'
+
+def create_partitions(days, using='default'):
+    """
+    Create the daily partitions for `days` that do not exist yet, returning their names.
+    A no-op on databases without partitioning.
+    """
+    if not is_partitioned(using):
+        return []
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    created = []
+    with connection.cursor() as cursor:
+        for day in days:
+            name = partition_name(day)
+            cursor.execute("SELECT to_regclass(%s)", [name])
+            if cursor.fetchone()[0] is not None:
+                continue
+            start, end = _day_start(day), _day_start(day + timedelta(days=1))
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {quote(name)} PARTITION OF {quote(TABLE)} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+            created.append(name)
+    if created:
+        logger.info(f"Created audit partitions {', '.join(created)}")
+    return created
+
+def partitions(using='default'):
+    """
+    Existing daily partitions as {day: name}
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = %s
+            """,
+            [TABLE],
+        )
+        names = [name for (name,) in cursor.fetchall()]
+    found = {}
+    for name in names:
+        try:
+            found[datetime.strptime(name[len(PARTITION_PREFIX):], '%Y%m%d').date()] = name
+        except ValueError:
+            logger.warning(f"Ignoring audit partition with an unexpected name: {name}")
+    return found
+
+def drop_expired(retention_days, using='default', dry_run=False, batch_size=10000):
+    """
+    Remove events older than `retention_days` whole days. Partitions are dropped whole;
+    without partitioning rows are deleted in batches. Returns the dropped partition
+    names, or the number of deleted rows.
+    """
+    cutoff = timezone.now().astimezone(dt_timezone.utc).date() - timedelta(days=retention_days)
+    if not is_partitioned(using):
+        queryset = models.AuthAuditEvent.objects.using(using).filter(created_at__lt=_day_start(cutoff))
+        if dry_run:
+            return queryset.count()
+        deleted = 0
+        while True:
+            ids = list(queryset.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            deleted += models.AuthAuditEvent.objects.using(using).filter(id__in=ids).delete()[0]
+
+    expired = [name for day, name in sorted(partitions(using).items()) if day < cutoff]
+    if not dry_run:
+        quote = connections[using].ops.quote_name
+        with connections[using].cursor() as cursor:
+            for name in expired:
+                cursor.execute(f"DROP TABLE {quote(name)}")
+                logger.info(f"Dropped audit partition {name}")
+    return expired
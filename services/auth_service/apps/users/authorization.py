@@ -0,0 +1,101 @@
+import logging
+from django.core.cache import cache
+from django.db.models import F
+from apps.core.cache import CacheUnavailable
+from . import models, sharding
+
+logger = logging.getLogger('apps.users')
+
+ALL_PERMISSIONS = '*'
+
+def version_key(user_id):
+    return f"perms_version_{user_id}"
+
+def resolve_permissions(user):
+    """
+    Compile a user's role and effective permissions into a compact, cached structure
+    """
+    key = f"perms_{user.pk}_v{user.permissions_version}"
+    try:
+        resolved = cache.get(key)
+    except CacheUnavailable:
+        resolved = None
+    if resolved is not None:
+        return resolved
+
+    if not user.is_active:
+        perms = []
+    elif user.is_superuser:
+        perms = [ALL_PERMISSIONS]
+    else:
+        perms = sorted(user.get_all_permissions())
+
+    resolved = {'role': str(user.role), 'perms': perms, 'version': user.permissions_version}
+    try:
+        cache.set(key, resolved, timeout=3600)
+        cache.set(version_key(user.pk), user.permissions_version, timeout=None)
+    except CacheUnavailable as cache_error:
+        logger.warning(f"Cache unavailable storing permissions for user {user.pk}: {cache_error}")
+    return resolved
+
+def token_claims(user):
+    resolved = resolve_permissions(user)
+    return {'role': resolved['role'], 'perms': resolved['perms'], 'pv': resolved['version']}
+
+def _by_database(user_ids):
+    """
+    {alias: user ids stored there}. A legacy id found on several shards is listed under each.
+    """
+    if not sharding.enabled():
+        return {'default': user_ids}
+    databases = {}
+    for user_id in user_ids:
+        try:
+            aliases = [sharding.shard_for_id(user_id)]
+        except models.User.DoesNotExist:
+            aliases = sharding.shards()
+        for alias in aliases:
+            databases.setdefault(alias, []).append(user_id)
+    return databases
+
+def bump_version(user_ids):
+    """
+    Invalidate compiled permissions and the tokens that embed them for the given users
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    versions = {}
+    for using, ids in _by_database(user_ids).items():
+        users = models.User.objects.using(using).filter(id__in=ids)
+        users.update(permissions_version=F('permissions_version') + 1)
+        versions.update(users.values_list('id', 'permissions_version'))
+    try:
+        cache.set_many({version_key(user_id): version for user_id, version in versions.items()}, timeout=None)
+    except CacheUnavailable as cache_error:
+        logger.warning(f"Cache unavailable bumping permission versions: {cache_error}")
+
+def is_current(user_id, version):
+    """
+    Check a token's permission version against the latest one, read from the database
+    only when the cache has no entry for the user or is unavailable
+    """
+    if version is None:
+        return True
+    try:
+        latest = cache.get(version_key(user_id))
+    except CacheUnavailable:
+        latest = None
+    if latest is None:
+        try:
+            latest = models.User.objects.filter(id=user_id).values_list('permissions_version', flat=True).first()
+        except models.User.DoesNotExist:
+            latest = None
+        if latest is None:
+            return False
+        try:
+            # add() rather than set(): a bump that ran since the read has stored a newer version
+            cache.add(version_key(user_id), latest, timeout=None)
+        except CacheUnavailable:
+            pass
+    return int(version) >= latest
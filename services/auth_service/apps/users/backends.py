@@ -0,0 +1,16 @@
+from django.contrib.auth.backends import ModelBackend
+from apps.core import querybudget
+from . import archive
+
+class ArchiveAwareModelBackend(ModelBackend):
+    """
+    Model backend that restores an archived user whose credentials match
+    """
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username=username, password=password, **kwargs)
+        if user is None and username and password is not None:
+            if archive.restore_user(username, password=password) is not None:
+                # Part of the one-off restore, like restore_user() itself
+                with querybudget.exempt():
+                    user = super().authenticate(request, username=username, password=password, **kwargs)
+        return user
@@ -0,0 +1,41 @@
+from . import models
+
+USER_REGISTERED = 'user.registered'
+PROFILE_COMPLETED = 'profile.completed'
+ROLE_CHANGED = 'role.changed'
+USER_DEACTIVATED = 'user.deactivated'
+# Published by migration 0010 when it merges accounts whose emails differ only in case
+USERS_MERGED = 'users.merged'
+
+EVENT_TYPES = (USER_REGISTERED, PROFILE_COMPLETED, ROLE_CHANGED, USER_DEACTIVATED, USERS_MERGED)
+
+def publish(event_type, user, **payload):
+    """
+    Write an event to the outbox of the user's database. Call it inside the transaction
+    that makes the change so the event is committed or rolled back together with it.
+    """
+    return models.OutboxEvent.objects.using(user._state.db).create(
+        event_type=event_type,
+        aggregate_id=user.pk,
+        payload={'user_id': user.pk, **payload},
+    )
+
+def user_registered(user):
+    return publish(
+        USER_REGISTERED,
+        user,
+        email=user.email,
+        username=user.username,
+        role=user.role,
+        date_joined=user.date_joined,
+    )
+
+def profile_completed(user, profile):
+    return publish(
+        PROFILE_COMPLETED,
+        user,
+        first_name=user.first_name,
+        last_name=user.last_name,
+        city=profile.city,
+        country=profile.country,
+    )
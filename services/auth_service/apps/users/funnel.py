@@ -0,0 +1,141 @@
+"""
+Signup funnel counters.
+
+Views count each step with `record()`, which increments an hourly counter in the shared
+cache (`funnel:<step>:<YYYYMMDDHH>`, UTC). `manage.py flush_funnel` moves the counters
+into FunnelRollup rows, one per step and hour, so a report reads at most
+24 * len(STEPS) rows per day of range however many users signed up.
+"""
+import logging
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from apps.core.cache import CacheUnavailable
+from . import models
+
+logger = logging.getLogger('apps.users')
+
+Step = models.FunnelRollup.Step
+STEPS = Step.values
+
+# Counters live long enough for a flusher that was down for a day to catch up
+COUNTER_HOURS = 48
+COUNTER_TIMEOUT = COUNTER_HOURS * 3600
+FLUSH_LOCK_KEY = 'funnel:flush_lock'
+FLUSH_LOCK_TIMEOUT = 300
+
+def hour_bucket(moment):
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+def counter_key(step, bucket):
+    return f"funnel:{step}:{bucket:%Y%m%d%H}"
+
+def record(step, count=1):
+    """
+    Count `step` in the current hour. Losing a count is preferable to failing the
+    request, so cache errors are only logged.
+    """
+    key = counter_key(step, hour_bucket(timezone.now()))
+    try:
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            if not cache.add(key, count, timeout=COUNTER_TIMEOUT):
+                cache.incr(key, count)
+    except CacheUnavailable as cache_error:
+        logger.warning(f"Cache unavailable counting funnel step {step}: {cache_error}")
+
+def flush(hours=COUNTER_HOURS):
+    """
+    Add the counters of the last `hours` hours to their rollup rows and subtract what
+    was added from the counters. Returns the number of rows written, or None if
+    another flush holds the lock.
+    """
+    if not cache.add(FLUSH_LOCK_KEY, 1, timeout=FLUSH_LOCK_TIMEOUT):
+        return None
+    try:
+        current = hour_bucket(timezone.now())
+        keys = {
+            counter_key(step, current - timedelta(hours=offset)): (step, current - timedelta(hours=offset))
+            for offset in range(hours)
+            for step in STEPS
+        }
+        pending = {keys[key]: value for key, value in cache.get_many(list(keys)).items() if value}
+        if not pending:
+            return 0
+
+        with transaction.atomic():
+            existing = {
+                (row.step, row.bucket): row
+                for row in models.FunnelRollup.objects.select_for_update().filter(
+                    bucket__in={bucket for _, bucket in pending},
+                )
+            }
+            created, updated = [], []
+            for (step, bucket), value in pending.items():
+                row = existing.get((step, bucket))
+                if row is None:
+                    created.append(models.FunnelRollup(bucket=bucket, step=step, count=value))
+                else:
+                    row.count += value
+                    updated.append(row)
+            models.FunnelRollup.objects.bulk_create(created)
+            models.FunnelRollup.objects.bulk_update(updated, ['count'])
+            # Subtract only once the rows are committed. A rollback then leaves every counter
+            # whole, and a decrement that fails leaves its counter to be added again by the
+            # next flush rather than losing counts that are already in the database.
+            transaction.on_commit(lambda: _subtract(pending))
+        return len(pending)
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+def _subtract(pending):
+    # Decrement rather than delete so steps counted since get_many() are kept
+    for (step, bucket), value in pending.items():
+        try:
+            cache.incr(counter_key(step, bucket), -value)
+        except (CacheUnavailable, ValueError) as cache_error:
+            logger.error(f"Could not subtract {value} flushed {step} steps for {bucket:%Y-%m-%d %H}:00, the next flush counts them again: {cache_error!r}")
+
+def _empty_steps():
+    return {step: 0 for step in STEPS}
+
+def _rate(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+def report(start, end):
+    """
+    Step totals, step-to-step conversion and daily totals for the UTC dates `start` to `end`, inclusive
+    """
+    since = datetime.combine(start, time.min, tzinfo=dt_timezone.utc)
+    until = datetime.combine(end + timedelta(days=1), time.min, tzinfo=dt_timezone.utc)
+    rows = (
+        models.FunnelRollup.objects
+        .filter(bucket__gte=since, bucket__lt=until)
+        .values_list(TruncDate('bucket', tzinfo=dt_timezone.utc), 'step')
+        .annotate(total=Sum('count'))
+        .order_by()
+    )
+
+    totals = _empty_steps()
+    days = {}
+    for day, step, total in rows:
+        totals[step] += total
+        days.setdefault(day, _empty_steps())[step] += total
+
+    signups = totals[Step.REGISTERED] + totals[Step.GOOGLE_REGISTERED]
+    return {
+        'start': start,
+        'end': end,
+        'totals': totals,
+        'conversion': {
+            'otp_verified': _rate(totals[Step.OTP_VERIFIED], totals[Step.OTP_REQUESTED]),
+            'registered': _rate(totals[Step.REGISTERED], totals[Step.OTP_VERIFIED]),
+            'profile_completed': _rate(totals[Step.PROFILE_COMPLETED], signups),
+            'otp_overall': _rate(totals[Step.REGISTERED], totals[Step.OTP_REQUESTED]),
+        },
+        'days': [{'date': day, 'steps': steps} for day, steps in sorted(days.items())],
+    }
@@ -0,0 +1,69 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from apps.core import metrics
+from apps.users import archive
+
+class Command(BaseCommand):
+    """
+    Move dormant and deactivated users into the compressed archive table in small batches
+    """
+    help = "Archive users not seen for --months months, and deactivated users"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=12)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.1, help="Seconds to sleep between batches to let other writers through")
+        parser.add_argument('--keep-inactive', action='store_true', help="Only archive by last activity, not deactivated users")
+        parser.add_argument('--limit', type=int, help="Stop after archiving this many users per database")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the users that would be archived")
+        parser.add_argument('--sizes-only', action='store_true', help="Only report hot table and index sizes")
+        parser.add_argument('--json', action='store_true', help="Print the size report as JSON")
+
+    def handle(self, *args, **options):
+        for using in archive.databases():
+            before = archive.table_sizes(using)
+            if options['sizes_only']:
+                self.report(using, before, None, options['json'])
+                continue
+
+            queryset = archive.dormant_users(using, options['months'], include_inactive=not options['keep_inactive'])
+            if options['dry_run']:
+                self.stdout.write(f"{using}: {queryset.count()} users would be archived")
+                continue
+
+            archived = 0
+            while options['limit'] is None or archived < options['limit']:
+                batch_size = options['batch_size']
+                if options['limit'] is not None:
+                    batch_size = min(batch_size, options['limit'] - archived)
+                moved = archive.archive_batch(queryset, using, batch_size)
+                archived += moved
+                if moved < batch_size:
+                    break
+                time.sleep(options['pause'])
+
+            self.stdout.write(self.style.SUCCESS(f"{using}: archived {archived} users"))
+            self.report(using, before, archive.table_sizes(using), options['json'])
+
+    def report(self, using, before, after, as_json):
+        if before is None:
+            self.stdout.write(f"{using}: table sizes are only available on PostgreSQL")
+            return
+        metrics.observe_table_sizes(after or before)
+
+        if as_json:
+            self.stdout.write(json.dumps({'database': using, 'before': before, 'after': after}, indent=2))
+            return
+
+        for table, size in sorted(before['tables'].items()):
+            line = f"{using} {table}: heap {size['heap']} B, indexes {size['indexes']} B, ~{size['rows']} rows"
+            if after and table in after['tables']:
+                new = after['tables'][table]
+                line += f" -> heap {new['heap']} B, indexes {new['indexes']} B, ~{new['rows']} rows"
+            self.stdout.write(line)
+        for index, size in sorted(before['indexes'].items()):
+            line = f"  {index}: {size['bytes']} B"
+            if after and index in after['indexes']:
+                line += f" -> {after['indexes'][index]['bytes']} B"
+            self.stdout.write(line)
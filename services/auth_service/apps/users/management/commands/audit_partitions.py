@@ -0,0 +1,35 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.users import audit
+
+class Command(BaseCommand):
+    """
+    Create upcoming daily audit log partitions and drop the ones past retention
+    """
+    help = (
+        "Create the authentication audit log partitions for the next --ahead days and drop "
+        "partitions older than --retention-days. Run it daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=7, help="Days of partitions to create ahead of today")
+        parser.add_argument('--retention-days', type=int, default=settings.AUDIT_RETENTION_DAYS)
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be dropped")
+
+    def handle(self, *args, **options):
+        if options['retention_days'] < 1:
+            raise CommandError("--retention-days must be at least 1")
+
+        if not options['dry_run']:
+            today = timezone.now().date()
+            created = audit.create_partitions([today + timedelta(days=offset) for offset in range(options['ahead'] + 1)])
+            self.stdout.write(f"Created {len(created)} partitions")
+
+        expired = audit.drop_expired(options['retention_days'], dry_run=options['dry_run'])
+        verb = "Would drop" if options['dry_run'] else "Dropped"
+        if audit.is_partitioned():
+            self.stdout.write(f"{verb} {len(expired)} partitions{': ' + ', '.join(expired) if expired else ''}")
+        else:
+            self.stdout.write(f"{verb} {expired} events")
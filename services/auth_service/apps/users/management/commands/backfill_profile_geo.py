@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from apps.geo import index
+from apps.users import models, sharding
+
+class Command(BaseCommand):
+    """
+    Resolve free-text profile countries and cities to the geo reference tables in batches
+    """
+    help = "Backfill Profile.country_ref and city_ref from the city and country text"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true', help="Re-resolve profiles that already have references")
+
+    def handle(self, *args, **options):
+        pending = Q(country__isnull=False) | Q(city__isnull=False)
+        if not options['all']:
+            pending &= Q(country_ref__isnull=True)
+
+        geo_index = index.get_index()
+        if not geo_index.countries:
+            self.stderr.write("The country table is empty, run `manage.py load_geo` first")
+            return
+
+        databases = sharding.shards() if sharding.enabled() else ['default']
+        for using in databases:
+            resolved = scanned = 0
+            last_id = 0
+            while True:
+                batch = list(
+                    models.Profile.objects.using(using)
+                    .filter(pending, id__gt=last_id)
+                    .order_by('id')
+                    .only('id', 'city', 'country', 'country_ref', 'city_ref')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1].id
+                for profile in batch:
+                    fields = index.normalize_profile(profile)
+                    resolved += profile.country_ref_id is not None
+                models.Profile.objects.using(using).bulk_update(batch, fields)
+                scanned += len(batch)
+            self.stdout.write(f"{using}: resolved {resolved} of {scanned} profiles")
@@ -0,0 +1,98 @@
+import heapq
+import os
+import sys
+import tempfile
+from array import array
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.users import password_validation
+
+class Command(BaseCommand):
+    """
+    Build the memory-mapped breached-password index used by BreachedPasswordValidator
+    """
+    help = (
+        "Build a breached password index from a Have I Been Pwned SHA-1 dump (HASH:COUNT lines) "
+        "or a plain-text password list. Input that does not fit in memory is sorted in chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', nargs='+', help="Input files, '-' for stdin")
+        parser.add_argument('--output', default=settings.BREACHED_PASSWORDS_INDEX, help="Index file to write (default BREACHED_PASSWORDS_INDEX)")
+        parser.add_argument('--format', choices=['sha1', 'plaintext'], default='sha1')
+        parser.add_argument('--min-count', type=int, default=1, help="Skip SHA-1 dump entries seen fewer times than this")
+        parser.add_argument('--chunk-size', type=int, default=5_000_000, help="Records sorted in memory at a time")
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError("Pass --output or set BREACHED_PASSWORDS_INDEX")
+
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(options['output']))) as workdir:
+            runs = self.write_runs(self.keys(options), options['chunk_size'], workdir)
+            count = password_validation.write_index(options['output'], self.merge(runs))
+        self.stdout.write(f"Wrote {count} hashes to {options['output']}")
+
+    def keys(self, options):
+        key_for_line = password_validation.sha1_hex_key if options['format'] == 'sha1' else password_validation.password_key
+        for source in options['source']:
+            fh = sys.stdin.buffer if source == '-' else open(source, 'rb')
+            try:
+                for number, line in enumerate(fh, 1):
+                    line = line.rstrip(b'\r\n')
+                    if not line:
+                        continue
+                    try:
+                        text = line.decode()
+                    except UnicodeDecodeError:
+                        if options['format'] == 'sha1':
+                            raise CommandError(f"{source}:{number}: not a HASH:COUNT line")
+                        text = line.decode('latin-1')
+                    if options['format'] == 'sha1':
+                        sha1, _, seen = text.partition(':')
+                        if len(sha1) != 40:
+                            raise CommandError(f"{source}:{number}: not a HASH:COUNT line")
+                        if seen and int(seen) < options['min_count']:
+                            continue
+                        yield key_for_line(sha1)
+                    else:
+                        yield key_for_line(text)
+            finally:
+                if fh is not sys.stdin.buffer:
+                    fh.close()
+
+    def write_runs(self, keys, chunk_size, workdir):
+        """
+        Sort the keys in chunks of `chunk_size` and write each chunk to a run file
+        """
+        runs = []
+        chunk = []
+        for key in keys:
+            chunk.append(int.from_bytes(key, 'big'))
+            if len(chunk) >= chunk_size:
+                runs.append(self.write_run(chunk, workdir, len(runs)))
+                chunk = []
+        if chunk or not runs:
+            runs.append(self.write_run(chunk, workdir, len(runs)))
+        return runs
+
+    def write_run(self, chunk, workdir, number):
+        records = array('Q', sorted(chunk))
+        if sys.byteorder == 'little':
+            records.byteswap()
+        path = os.path.join(workdir, f"run-{number}")
+        with open(path, 'wb') as fh:
+            records.tofile(fh)
+        self.stdout.write(f"Sorted run {number + 1} ({len(records)} hashes)")
+        return path
+
+    def read_run(self, path):
+        size = password_validation.RECORD_SIZE
+        with open(path, 'rb') as fh:
+            while block := fh.read(size * 65536):
+                for start in range(0, len(block), size):
+                    yield block[start:start + size]
+
+    def merge(self, runs):
+        if len(runs) == 1:
+            return self.read_run(runs[0])
+        return heapq.merge(*(self.read_run(path) for path in runs))
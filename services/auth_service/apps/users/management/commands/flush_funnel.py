@@ -0,0 +1,35 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from apps.core.cache import CacheUnavailable
+from apps.users import funnel
+
+class Command(BaseCommand):
+    """
+    Move signup funnel counters from the cache into hourly rollup rows
+    """
+    help = "Flush signup funnel counters into the user_funnel_rollup table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=funnel.COUNTER_HOURS, help="How many past hours of counters to flush")
+        parser.add_argument('--loop', action='store_true', help="Keep flushing instead of exiting after one pass")
+        parser.add_argument('--interval', type=float, default=60.0, help="Seconds to sleep between flushes in --loop mode")
+
+    def handle(self, *args, **options):
+        if not 1 <= options['hours'] <= funnel.COUNTER_HOURS:
+            raise CommandError(f"--hours must be between 1 and {funnel.COUNTER_HOURS}")
+
+        while True:
+            try:
+                flushed = funnel.flush(options['hours'])
+            except CacheUnavailable as cache_error:
+                if not options['loop']:
+                    raise CommandError(f"Cache unavailable: {cache_error}")
+                self.stderr.write(f"Cache unavailable, retrying: {cache_error}")
+            else:
+                if flushed is None:
+                    self.stdout.write("Another flush is running")
+                elif flushed or not options['loop']:
+                    self.stdout.write(f"Flushed {flushed} funnel counters")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,155 @@
+import logging
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, Value, When
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from apps.core.cache import CacheUnavailable
+from apps.users import models, sharding
+
+logger = logging.getLogger('apps.users')
+
+def restore_timestamps(model, using, field, values):
+    """
+    Set `field` from {pk: value} in one UPDATE. bulk_create stamps auto_now_add fields
+    with the current time, so copied rows need their original values put back.
+    """
+    if not values:
+        return
+    model.objects.using(using).filter(pk__in=values).update(**{
+        field: Case(*[When(pk=pk, then=Value(value)) for pk, value in values.items()], output_field=model._meta.get_field(field)),
+    })
+
+class Command(BaseCommand):
+    """
+    Move users, their profiles and archived users to the shard their bucket maps to under the current USER_SHARDS
+    """
+    help = "Rebalance users across USER_SHARDS after the shard list changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--drain', nargs='*', default=[], help="Extra database aliases to move every user off")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many users would move")
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError("USER_SHARDING_ENABLED is off")
+
+        sources = list(sharding.shards()) + [alias for alias in options['drain'] if alias not in sharding.shards()]
+        for source in sources:
+            last_id = sharding.last_serial_id(source)
+            if last_id is not None and not sharding.is_legacy_id(last_id):
+                raise CommandError(f"{source} has issued serial user ids up to {last_id}; set USER_LEGACY_ID_LIMIT above it")
+        total = 0
+        for source in sources:
+            moved = self.rebalance_source(source, models.User, self.move, options['batch_size'], options['dry_run'])
+            archived = self.rebalance_source(source, models.ArchivedUser, self.move_archived, options['batch_size'], options['dry_run'])
+            self.stdout.write(f"{source}: {moved} users and {archived} archived users {'to move' if options['dry_run'] else 'moved'}")
+            total += moved + archived
+        self.stdout.write(self.style.SUCCESS(f"Rebalance finished, {total} users {'to move' if options['dry_run'] else 'moved'}"))
+
+    def rebalance_source(self, source, model, move, batch_size, dry_run):
+        moved = 0
+        last_id = 0
+        while True:
+            batch = list(
+                model.objects.using(source)
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'email')[:batch_size]
+            )
+            if not batch:
+                return moved
+            last_id = batch[-1][0]
+
+            by_target = {}
+            for user_id, email in batch:
+                target = sharding.home_shard(user_id, email)
+                if target != source:
+                    by_target.setdefault(target, []).append(user_id)
+
+            for target, user_ids in by_target.items():
+                if not dry_run:
+                    move(user_ids, source, target)
+                moved += len(user_ids)
+
+    def move(self, user_ids, source, target):
+        """
+        Copy the rows to the target first so a user is never missing from both shards, then
+        delete the source rows. Refresh tokens and their blacklist entries move with the user,
+        since token checks go to the shard its id maps to, and so do its undelivered outbox events.
+        """
+        users = list(models.User.objects.using(source).filter(id__in=user_ids))
+        profiles = list(models.Profile.objects.using(source).filter(user_id__in=user_ids))
+        group_links = list(models.User.groups.through.objects.using(source).filter(user_id__in=user_ids))
+        permission_links = list(models.User.user_permissions.through.objects.using(source).filter(user_id__in=user_ids))
+        tokens = list(OutstandingToken.objects.using(source).filter(user_id__in=user_ids))
+        blacklisted = dict(BlacklistedToken.objects.using(source).filter(token__user_id__in=user_ids).values_list('token__jti', 'blacklisted_at'))
+        date_joined = {user.id: user.date_joined for user in users}
+
+        # Profile, link and token ids are per-shard sequences and only the blacklist references
+        # one, so the copies get new ids and the blacklist is rebuilt by jti
+        for row in profiles + group_links + permission_links + tokens:
+            row.pk = None
+
+        # bulk_create skips save signals, so no welcome profiles or outbox events are produced for copies
+        with transaction.atomic(using=target):
+            models.User.objects.using(target).bulk_create(users)
+            restore_timestamps(models.User, target, 'date_joined', date_joined)
+            models.Profile.objects.using(target).bulk_create(profiles)
+            models.User.groups.through.objects.using(target).bulk_create(group_links)
+            models.User.user_permissions.through.objects.using(target).bulk_create(permission_links)
+            OutstandingToken.objects.using(target).bulk_create(tokens)
+            copies = list(OutstandingToken.objects.using(target).filter(jti__in=blacklisted).values_list('id', 'jti'))
+            entries = BlacklistedToken.objects.using(target).bulk_create([BlacklistedToken(token_id=token_id) for token_id, _ in copies])
+            restore_timestamps(BlacklistedToken, target, 'blacklisted_at', {
+                entry.pk: blacklisted[jti] for entry, (_, jti) in zip(entries, copies)
+            })
+            event_ids = self.copy_events(user_ids, source, target)
+
+        with transaction.atomic(using=source):
+            models.OutboxEvent.objects.using(source).filter(id__in=event_ids).delete()
+            # Outstanding tokens outlive their user (SET_NULL), so delete them explicitly
+            BlacklistedToken.objects.using(source).filter(token__user_id__in=user_ids).delete()
+            OutstandingToken.objects.using(source).filter(user_id__in=user_ids).delete()
+            models.User.objects.using(source).filter(id__in=user_ids).delete()
+
+        try:
+            cache.delete_many([f"user_shard_{user_id}" for user_id in user_ids if sharding.is_legacy_id(user_id)])
+        except CacheUnavailable:
+            pass
+        logger.info(f"Moved {len(user_ids)} users from {source} to {target}")
+
+    def copy_events(self, user_ids, source, target):
+        """
+        Copy the undelivered outbox events of `user_ids` to the target and return their source ids
+        """
+        events = list(models.OutboxEvent.objects.using(source).filter(aggregate_id__in=user_ids, delivered_at__isnull=True))
+        event_ids = [event.id for event in events]
+        created_at = [event.created_at for event in events]
+        # The copies join the target's change feed when they commit there, see outbox.py
+        transaction_id = models.OutboxEvent._meta.get_field('transaction_id')
+        for event in events:
+            event.pk = None
+            event.transaction_id = transaction_id.get_default()
+        models.OutboxEvent.objects.using(target).bulk_create(events)
+        restore_timestamps(models.OutboxEvent, target, 'created_at', {
+            event.pk: created for event, created in zip(events, created_at)
+        })
+        return event_ids
+
+    def move_archived(self, user_ids, source, target):
+        """
+        Move archived users and their undelivered outbox events to the shard they are
+        restored on, copying before deleting
+        """
+        archived = list(models.ArchivedUser.objects.using(source).filter(id__in=user_ids))
+        archived_at = {row.id: row.archived_at for row in archived}
+        with transaction.atomic(using=target):
+            models.ArchivedUser.objects.using(target).bulk_create(archived)
+            restore_timestamps(models.ArchivedUser, target, 'archived_at', archived_at)
+            event_ids = self.copy_events(user_ids, source, target)
+        with transaction.atomic(using=source):
+            models.OutboxEvent.objects.using(source).filter(id__in=event_ids).delete()
+            models.ArchivedUser.objects.using(source).filter(id__in=user_ids).delete()
+        logger.info(f"Moved {len(user_ids)} archived users from {source} to {target}")
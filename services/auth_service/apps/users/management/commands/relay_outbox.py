@@ -0,0 +1,133 @@
+import json
+import logging
+import time
+from datetime import timedelta
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from apps.core import tracing
+from apps.users import archive, models, serializers
+
+logger = logging.getLogger('apps.users')
+
+# Seconds a lease outlasts the webhook timeouts, for serialising the batch and updating it
+LEASE_MARGIN = 30
+
+class Command(BaseCommand):
+    """
+    Deliver pending outbox events to subscriber webhooks in batches
+    """
+    help = "Relay user lifecycle events from the outbox of every user database to OUTBOX_WEBHOOK_URLS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_RELAY_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="Keep polling instead of exiting when the outbox is drained")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep between polls in --loop mode")
+        parser.add_argument('--timeout', type=float, default=5.0, help="Webhook request timeout in seconds")
+        parser.add_argument('--prune-days', type=int, help="Delete delivered events older than this many days")
+
+    def handle(self, *args, **options):
+        if options['prune_days'] is not None:
+            cutoff = timezone.now() - timedelta(days=options['prune_days'])
+            for using in archive.databases():
+                deleted, _ = models.OutboxEvent.objects.using(using).filter(delivered_at__lt=cutoff).delete()
+                self.stdout.write(f"Pruned {deleted} delivered events on {using}")
+
+        if not settings.OUTBOX_WEBHOOK_URLS:
+            # Marking events delivered would let --prune-days delete them before feed readers see them
+            self.stdout.write("OUTBOX_WEBHOOK_URLS is empty, events are left for the change feed")
+            return
+
+        while True:
+            # Each database has its own outbox; a full batch from any of them means more may be waiting
+            drained = True
+            for using in archive.databases():
+                delivered = self.relay_batch(using, options['batch_size'], options['timeout'])
+                if delivered:
+                    self.stdout.write(f"Delivered {delivered} events from {using}")
+                drained = drained and delivered < options['batch_size']
+            if not drained:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def lease(self, using, batch_size, timeout):
+        """
+        Claim up to `batch_size` due events, for long enough to post them to every URL,
+        in a transaction of its own so no row lock is held while posting
+        """
+        now = timezone.now()
+        lease = timedelta(seconds=timeout * len(settings.OUTBOX_WEBHOOK_URLS) + LEASE_MARGIN)
+        with transaction.atomic(using=using):
+            batch = list(
+                models.OutboxEvent.objects.using(using)
+                .select_for_update(skip_locked=True)
+                .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now), delivered_at__isnull=True)
+                .order_by('id')[:batch_size]
+            )
+            if batch:
+                models.OutboxEvent.objects.using(using).filter(id__in=[event.id for event in batch]).update(next_attempt_at=now + lease)
+        return batch
+
+    def relay_batch(self, using, batch_size, timeout):
+        batch = self.lease(using, batch_size, timeout)
+        if not batch:
+            return 0
+
+        ids = [event.id for event in batch]
+        body = json.dumps(
+            {'events': serializers.OutboxEventSerializer(batch, many=True).data},
+            cls=DjangoJSONEncoder,
+        )
+        try:
+            self.deliver(using, body, len(batch), timeout)
+        except requests.RequestException as e:
+            logger.warning(f"Outbox relay failed for events {ids[0]}-{ids[-1]} on {using}: {e}")
+            # Retry each event after 2 ** attempts seconds, so a dead subscriber is polled less and less
+            by_attempts = {}
+            for event in batch:
+                by_attempts.setdefault(event.attempts + 1, []).append(event.id)
+            for attempts, event_ids in by_attempts.items():
+                models.OutboxEvent.objects.using(using).filter(id__in=event_ids).update(
+                    attempts=attempts,
+                    last_error=str(e)[:1000],
+                    next_attempt_at=timezone.now() + timedelta(seconds=min(2 ** attempts, settings.OUTBOX_RELAY_MAX_BACKOFF)),
+                )
+            return 0
+
+        models.OutboxEvent.objects.using(using).filter(id__in=ids).update(
+            delivered_at=timezone.now(),
+            attempts=F('attempts') + 1,
+            last_error='',
+            next_attempt_at=None,
+        )
+        return len(batch)
+
+    def deliver(self, using, body, count, timeout):
+        """
+        Post a batch to every webhook URL, traced as a trace of its own when tracing is enabled
+        """
+        root = token = error = None
+        if settings.TRACING_ENABLED:
+            root, token = tracing.start_span('outbox.relay', kind='producer', **{'db.name': using, 'outbox.events': count})
+        try:
+            for url in settings.OUTBOX_WEBHOOK_URLS:
+                with tracing.span('outbox.webhook', kind='client', **{'http.url': url}):
+                    response = requests.post(
+                        url,
+                        data=body,
+                        headers=tracing.inject_headers({'Content-Type': 'application/json'}),
+                        timeout=timeout,
+                    )
+                    response.raise_for_status()
+        except requests.RequestException as e:
+            error = e
+            raise
+        finally:
+            if root is not None:
+                tracing.end_span(root, token, error)
@@ -0,0 +1,106 @@
+import multiprocessing
+import random
+import time
+from datetime import date, datetime, timezone as dt_timezone
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from apps.users import archive, seeding, sharding
+
+# Set before the worker processes fork, see Command.run
+_seeder = None
+
+def _load_block(block):
+    return _seeder.load(block)
+
+class Command(BaseCommand):
+    """
+    Load deterministic synthetic users, profiles and refresh tokens for scale testing
+    """
+    help = (
+        "Generate COUNT users with realistic emails, names, roles, countries, profile completeness, "
+        "avatars and refresh tokens, loaded with COPY. The same --seed and COUNT always give the same "
+        "data, and a run that was interrupted resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--password', default='seed-password', help="Password of every generated user")
+        parser.add_argument('--until', type=date.fromisoformat, default=date(2026, 1, 1), help="Latest sign-up and activity date")
+        parser.add_argument('--days', type=int, default=730, help="Days of sign-ups before --until")
+        parser.add_argument('--home-country', default='UA', help="Country most users live in, as an ISO code")
+        parser.add_argument('--jobs', type=int, default=1, help="Worker processes generating and loading blocks")
+        parser.add_argument('--no-avatar-files', action='store_true', help="Do not write the placeholder avatar images")
+
+    def handle(self, *args, **options):
+        if options['count'] < 1 or options['days'] < 1 or options['jobs'] < 1:
+            raise CommandError("count, --days and --jobs must be positive")
+        start = datetime.combine(options['until'], datetime.min.time(), tzinfo=dt_timezone.utc).timestamp() - options['days'] * 86400
+        if start < sharding.ID_EPOCH:
+            raise CommandError(f"--days reaches before {datetime.fromtimestamp(sharding.ID_EPOCH, dt_timezone.utc):%Y-%m-%d}, the earliest date a user id can encode")
+
+        databases = archive.databases()
+        seeder = seeding.Seeder(
+            options['seed'], options['count'], options['until'], options['days'],
+            options['password'], options['home_country'].upper(), using=databases[0],
+        )
+        if not seeder.places.world:
+            self.stderr.write("No geo reference data, profiles get no country or city: run load_geo first")
+        if not options['no_avatar_files']:
+            self.write_avatars(options['seed'])
+
+        started = time.perf_counter()
+        totals = self.run(seeder, options['jobs'])
+        elapsed = time.perf_counter() - started
+
+        for using in databases:
+            if connections[using].vendor == 'postgresql':
+                with connections[using].cursor() as cursor:
+                    cursor.execute(f"ANALYZE {', '.join(seeding.TABLES)}")
+        rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {totals['users']} users, {totals['profiles']} profiles, {totals['tokens']} tokens and "
+            f"{totals['blacklisted']} blacklisted tokens in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s). "
+            f"Every user's password is {options['password']!r}"
+        ))
+
+    def run(self, seeder, jobs):
+        global _seeder
+        totals = {'users': 0, 'profiles': 0, 'tokens': 0, 'blacklisted': 0}
+        blocks = seeder.blocks()
+        if jobs == 1:
+            results = map(seeder.load, blocks)
+            pool = None
+        else:
+            # Workers inherit the seeder and open their own connections
+            _seeder = seeder
+            connections.close_all()
+            pool = multiprocessing.get_context('fork').Pool(jobs)
+            results = pool.imap_unordered(_load_block, blocks)
+        try:
+            for done, written in enumerate(results, 1):
+                for table, count in written.items():
+                    totals[table] += count
+                if done % 10 == 0 or done == len(blocks):
+                    self.stdout.write(f"{done}/{len(blocks)} blocks, {totals['users']} users loaded")
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return totals
+
+    def write_avatars(self, seed):
+        from PIL import Image
+
+        rng = random.Random(f"{seed}-avatars")
+        for number in range(seeding.AVATAR_COUNT):
+            color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+            name = seeding.avatar_name(number)
+            if default_storage.exists(name):
+                continue
+            image = BytesIO()
+            Image.new('RGB', (128, 128), color).save(image, 'PNG')
+            default_storage.save(name, ContentFile(image.getvalue()))
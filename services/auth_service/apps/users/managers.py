@@ -1,16 +1,60 @@
 from django.contrib.auth.models import BaseUserManager
+from django.db import models
+from . import sharding
 
-class UserManager(BaseUserManager):
+def canonical_email(email):
+    """
+    The form emails are stored and looked up in: the whole address stripped and lowercased,
+    so Foo@x.com and foo@x.com are one account
+    """
+    return (email or '').strip().lower()
+
+class ShardedQuerySet(models.QuerySet):
+    """
+    Send filter(), get() and create() calls that pin down a single user to that user's shard
+    """
+    id_lookups = sharding.ID_LOOKUPS
+    email_lookups = sharding.EMAIL_LOOKUPS
+
+    def _routed(self, lookups):
+        if self._db is not None or not sharding.enabled():
+            return self
+        alias = sharding.shard_for_lookup(lookups, self.id_lookups, self.email_lookups)
+        return self.using(alias) if alias else self
+
+    def filter(self, *args, **kwargs):
+        return super(ShardedQuerySet, self._routed(kwargs)).filter(*args, **kwargs)
+
+    def get(self, *args, **kwargs):
+        return super(ShardedQuerySet, self._routed(kwargs)).get(*args, **kwargs)
+
+    def create(self, **kwargs):
+        return super(ShardedQuerySet, self._routed(kwargs)).create(**kwargs)
+
+class ProfileQuerySet(ShardedQuerySet):
+    id_lookups = ('user', 'user_id', 'user__id', 'user__pk')
+    email_lookups = ('user__email', 'user__email__lower')
+
+class UserManager(BaseUserManager.from_queryset(ShardedQuerySet)):
     """
     Custom user manager where email is the unique identifiers
     for authentication instead of usernames.
     """
+    @classmethod
+    def normalize_email(cls, email):
+        return canonical_email(email)
+
+    def get_by_natural_key(self, username):
+        # One probe of the unique index on lower(email), with the profile the login response needs
+        return self.select_related('profile').get(email__lower=canonical_email(username))
+
     def create_user(self, email, username, password=None, **extra_fields):
         if not email:
             raise ValueError("The Email field is required")
         email = self.normalize_email(email)
         user = self.model(email=email, username=username, **extra_fields)
         user.set_password(password)
+        # User.save() assigns the sharded id and picks the shard
         user.save(using=self._db)
         return user
 
@@ -19,4 +63,4 @@ class UserManager(BaseUserManager):
         extra_fields.setdefault("is_superuser", True)
         extra_fields.setdefault('role', 'admin')
 
-        return self.create_user(email, username, password, **extra_fields)
\ No newline at end of file
+        return self.create_user(email, username, password, **extra_fields)
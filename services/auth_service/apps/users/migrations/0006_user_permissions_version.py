@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='permissions_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
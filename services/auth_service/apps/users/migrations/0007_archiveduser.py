@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_user_permissions_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedUser',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('username', models.CharField(max_length=150, unique=True)),
+                ('reason', models.CharField(choices=[('dormant', 'Dormant'), ('inactive', 'Inactive')], max_length=10)),
+                ('last_login', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('payload', models.BinaryField()),
+            ],
+            options={
+                'verbose_name': 'archived user',
+                'verbose_name_plural': 'archived users',
+                'db_table': 'user_archive',
+            },
+        ),
+    ]
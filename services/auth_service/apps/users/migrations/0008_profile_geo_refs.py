@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geo', '0001_initial'),
+        ('users', '0007_archiveduser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='city_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='profiles', to='geo.city'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='country_ref',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='profiles', to='geo.country'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['country_ref', 'city_ref'], name='user_profile_country_city_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_profile_geo_refs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FunnelRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('step', models.CharField(choices=[('otp_requested', 'OTP requested'), ('otp_verified', 'OTP verified'), ('registered', 'Registered'), ('google_registered', 'Registered with Google'), ('profile_completed', 'Profile completed')], max_length=20)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'funnel rollup',
+                'verbose_name_plural': 'funnel rollups',
+                'db_table': 'user_funnel_rollup',
+                'ordering': ['bucket', 'step'],
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'step'), name='user_funnel_rollup_bucket_step_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,160 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:07
+
+import json
+import zlib
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest, Lower
+
+PROFILE_FIELDS = ('avatar', 'city', 'country', 'country_ref', 'city_ref', 'date_birth')
+USER_FIELDS = ('first_name', 'last_name')
+
+
+def _load(model, data):
+    values = {}
+    for field in model._meta.concrete_fields:
+        if field.attname in data:
+            value = data[field.attname]
+            values[field.attname] = None if value is None else field.to_python(value)
+    return model(**values)
+
+
+def restore_colliding_archives(apps, using):
+    """
+    Move archived users whose email collides, ignoring case, with another archived or
+    hot user back into the hot tables, so they are merged like any other duplicate
+    """
+    User = apps.get_model('users', 'User')
+    Profile = apps.get_model('users', 'Profile')
+    ArchivedUser = apps.get_model('users', 'ArchivedUser')
+    groups = User._meta.get_field('groups').remote_field.through
+    permissions = User._meta.get_field('user_permissions').remote_field.through
+
+    archived = ArchivedUser.objects.using(using).annotate(canonical=Lower('email'))
+    counts = archived.values('canonical').annotate(count=Count('id')).order_by()
+    colliding = {row['canonical'] for row in counts if row['count'] > 1}
+    colliding.update(
+        User.objects.using(using).annotate(canonical=Lower('email'))
+        .filter(canonical__in=archived.values('canonical')).values_list('canonical', flat=True)
+    )
+    for row in archived.filter(canonical__in=colliding):
+        data = json.loads(zlib.decompress(bytes(row.payload)))
+        user = _load(User, data['user'])
+        User.objects.using(using).bulk_create([user])
+        # date_joined is auto_now_add, so bulk_create stamped it with the current time
+        User.objects.using(using).filter(id=user.id).update(date_joined=data['user']['date_joined'])
+        if data['profile']:
+            profile = _load(Profile, data['profile'])
+            profile.pk = None
+            Profile.objects.using(using).bulk_create([profile])
+        groups.objects.using(using).bulk_create([groups(user_id=user.id, group_id=group_id) for group_id in data['groups']])
+        permissions.objects.using(using).bulk_create([
+            permissions(user_id=user.id, permission_id=permission_id) for permission_id in data['permissions']
+        ])
+        row.delete()
+
+
+def merge(apps, using, canonical, survivor, duplicates):
+    """
+    Fold `duplicates` into `survivor`: fill its empty name and profile fields, take the
+    union of groups and permissions, revoke the duplicates' refresh tokens and delete them
+    """
+    User = apps.get_model('users', 'User')
+    Profile = apps.get_model('users', 'Profile')
+    OutboxEvent = apps.get_model('users', 'OutboxEvent')
+    OutstandingToken = apps.get_model('token_blacklist', 'OutstandingToken')
+    BlacklistedToken = apps.get_model('token_blacklist', 'BlacklistedToken')
+    groups = User._meta.get_field('groups').remote_field.through
+    permissions = User._meta.get_field('user_permissions').remote_field.through
+
+    duplicate_ids = [user.id for user in duplicates]
+    profiles = {profile.user_id: profile for profile in Profile.objects.using(using).filter(user_id__in=[survivor.id, *duplicate_ids])}
+    profile = profiles.get(survivor.id)
+    for user in duplicates:
+        for field in USER_FIELDS:
+            if not getattr(survivor, field) and getattr(user, field):
+                setattr(survivor, field, getattr(user, field))
+        other = profiles.get(user.id)
+        if profile is not None and other is not None:
+            for field in PROFILE_FIELDS:
+                if not getattr(profile, field) and getattr(other, field):
+                    setattr(profile, field, getattr(other, field))
+
+    groups.objects.using(using).bulk_create([
+        groups(user_id=survivor.id, group_id=group_id)
+        for group_id in groups.objects.using(using).filter(user_id__in=duplicate_ids).values_list('group_id', flat=True)
+    ], ignore_conflicts=True)
+    permissions.objects.using(using).bulk_create([
+        permissions(user_id=survivor.id, permission_id=permission_id)
+        for permission_id in permissions.objects.using(using).filter(user_id__in=duplicate_ids).values_list('permission_id', flat=True)
+    ], ignore_conflicts=True)
+
+    # Outstanding tokens outlive their user (SET_NULL), so revoke them before deleting
+    tokens = OutstandingToken.objects.using(using).filter(user_id__in=duplicate_ids, blacklistedtoken__isnull=True)
+    BlacklistedToken.objects.using(using).bulk_create([BlacklistedToken(token=token) for token in tokens], ignore_conflicts=True)
+
+    User.objects.using(using).filter(id__in=duplicate_ids).delete()
+    survivor.email = canonical
+    survivor.permissions_version = F('permissions_version') + 1
+    survivor.save(using=using, update_fields=['email', 'permissions_version', *USER_FIELDS])
+    if profile is not None:
+        profile.save(using=using, update_fields=PROFILE_FIELDS)
+    OutboxEvent.objects.using(using).create(
+        event_type='users.merged',
+        aggregate_id=survivor.id,
+        payload={'user_id': survivor.id, 'email': canonical, 'merged_user_ids': duplicate_ids},
+    )
+
+
+def merge_duplicate_emails(apps, schema_editor):
+    # Runs against the models as they were before this migration: the current ones have
+    # columns that later migrations add
+    using = schema_editor.connection.alias
+    User = apps.get_model('users', 'User')
+    OutstandingToken = apps.get_model('token_blacklist', 'OutstandingToken')
+
+    restore_colliding_archives(apps, using)
+    users = User.objects.using(using).annotate(canonical=Lower('email'))
+    duplicated = users.values('canonical').annotate(count=Count('id')).filter(count__gt=1).values_list('canonical', flat=True)
+    # JWT logins never set last_login, so the newest refresh token is the better record of activity
+    newest_token = Subquery(
+        OutstandingToken.objects.using(using)
+        .filter(user_id=OuterRef('pk'))
+        .order_by('-created_at')
+        .values('created_at')[:1]
+    )
+    for canonical in list(duplicated):
+        group = list(
+            users.filter(canonical=canonical)
+            .annotate(last_active=Coalesce(Greatest(newest_token, 'last_login'), newest_token, 'last_login'))
+            .order_by(F('last_active').desc(nulls_last=True), 'date_joined', 'id')
+        )
+        merge(apps, using, canonical, group[0], group[1:])
+
+    User.objects.using(using).exclude(email=Lower('email')).update(email=Lower('email'))
+    ArchivedUser = apps.get_model('users', 'ArchivedUser')
+    ArchivedUser.objects.using(using).exclude(email=Lower('email')).update(email=Lower('email'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('token_blacklist', '0013_alter_blacklistedtoken_options_and_more'),
+        ('users', '0009_funnelrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_emails, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='user',
+            name='email',
+            field=models.EmailField(max_length=254),
+        ),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='auth_user_email_lower_uniq', violation_error_message='A user with this email already exists.'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:13
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def backfill_last_seen(apps, schema_editor):
+    # JWT logins never set last_login, so the newest refresh token issued to a user is the
+    # best record of its activity before last_seen was tracked. Greatest() is NULL on
+    # SQLite as soon as one side is, hence the Coalesce.
+    using = schema_editor.connection.alias
+    User = apps.get_model('users', 'User')
+    OutstandingToken = apps.get_model('token_blacklist', 'OutstandingToken')
+
+    newest_token = Subquery(
+        OutstandingToken.objects.using(using)
+        .filter(user_id=OuterRef('pk'))
+        .order_by('-created_at')
+        .values('created_at')[:1]
+    )
+    User.objects.using(using).filter(last_seen__isnull=True).update(
+        last_seen=Coalesce(Greatest(newest_token, 'last_login'), newest_token, 'last_login'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('token_blacklist', '0013_alter_blacklistedtoken_options_and_more'),
+        ('users', '0010_user_email_lower_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_last_seen, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:16
+
+from django.db import migrations, models
+
+
+def partition_audit_table(apps, schema_editor):
+    """
+    On PostgreSQL, recreate the (still empty) audit table range-partitioned by day on
+    created_at. The primary key has to include the partition key. Daily partitions are
+    created by `manage.py audit_partitions` and, as a fallback, by the audit flusher.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    model = apps.get_model('users', 'AuthAuditEvent')
+    schema_editor.execute('DROP TABLE "user_auth_audit"')
+    schema_editor.execute(
+        """
+        CREATE TABLE "user_auth_audit" (
+            "id" bigint GENERATED BY DEFAULT AS IDENTITY,
+            "created_at" timestamp with time zone NOT NULL,
+            "event" varchar(20) NOT NULL,
+            "user_id" bigint NULL,
+            "email" varchar(254) NOT NULL,
+            "ip" inet NULL,
+            "user_agent" varchar(255) NOT NULL,
+            "detail" varchar(255) NOT NULL,
+            PRIMARY KEY ("id", "created_at")
+        ) PARTITION BY RANGE ("created_at")
+        """
+    )
+    # Indexes on the parent are created on every partition
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_user_last_seen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthAuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('event', models.CharField(choices=[('login', 'Login'), ('login_failed', 'Failed login'), ('logout', 'Logout'), ('google_login', 'Google sign-in'), ('otp_requested', 'OTP requested'), ('otp_verified', 'OTP verified'), ('otp_failed', 'OTP verification failed'), ('password_changed', 'Password changed')], max_length=20)),
+                ('user_id', models.BigIntegerField(blank=True, null=True)),
+                ('email', models.EmailField(blank=True, max_length=254)),
+                ('ip', models.GenericIPAddressField(blank=True, null=True)),
+                ('user_agent', models.CharField(blank=True, max_length=255)),
+                ('detail', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'verbose_name': 'authentication audit event',
+                'verbose_name_plural': 'authentication audit events',
+                'db_table': 'user_auth_audit',
+                'indexes': [models.Index(fields=['user_id', 'created_at'], name='user_auth_audit_user_idx'), models.Index(fields=['email', 'created_at'], name='user_auth_audit_email_idx'), models.Index(fields=['ip', 'created_at'], name='user_auth_audit_ip_idx'), models.Index(fields=['created_at'], name='user_auth_audit_created_idx')],
+            },
+        ),
+        migrations.RunPython(partition_audit_table, migrations.RunPython.noop),
+    ]
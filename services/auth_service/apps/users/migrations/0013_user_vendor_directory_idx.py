@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:39
+
+import apps.users.models
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0012_authauditevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(apps.users.models.CodePointOrder(django.db.models.functions.text.Lower('username')), models.F('id'), condition=models.Q(('is_active', True), ('role', 'vendor')), include=('username', 'first_name', 'last_name'), name='user_vendor_directory_idx'),
+        ),
+    ]
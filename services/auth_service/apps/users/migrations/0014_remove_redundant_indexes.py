@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:44
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_user_vendor_directory_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='profile',
+            name='user_profil_user_id_4f95f8_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='auth_user_email_ece7f7_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='auth_user_usernam_f2740e_idx',
+        ),
+    ]
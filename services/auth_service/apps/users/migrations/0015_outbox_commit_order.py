@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:03
+
+import apps.users.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_remove_redundant_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='outboxevent',
+            name='transaction_id',
+            field=models.BigIntegerField(db_default=apps.users.models.CurrentTransactionId(), editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='outboxevent',
+            index=models.Index(fields=['transaction_id', 'id'], name='user_outbox_feed_idx'),
+        ),
+    ]
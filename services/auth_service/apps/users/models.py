@@ -1,6 +1,37 @@
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
-from . import managers
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.functions import Lower
+from . import managers, sharding
+
+class CodePointOrder(models.Func):
+    """
+    Compare text by code point, the way Python compares strings: the "C" collation on
+    PostgreSQL and BINARY on SQLite
+    """
+    arity = 1
+    template = '%(expressions)s COLLATE "C"'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='%(expressions)s COLLATE BINARY', **extra_context)
+
+class CurrentTransactionId(models.Func):
+    """
+    The id of the current transaction on PostgreSQL (13+), NULL on other backends
+    """
+    template = 'pg_current_xact_id()::text::bigint'
+    output_field = models.BigIntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return 'NULL', []
+
+class SnapshotXmin(models.Func):
+    """
+    The oldest transaction id still running when the query's snapshot was taken, on
+    PostgreSQL (13+): every transaction with a lower id has committed or rolled back
+    """
+    template = 'pg_snapshot_xmin(pg_current_snapshot())::text::bigint'
+    output_field = models.BigIntegerField()
 
 class User(AbstractBaseUser, PermissionsMixin):
     """
@@ -11,7 +42,8 @@ class User(AbstractBaseUser, PermissionsMixin):
         ADMIN = "admin", "Admin"
         VENDOR = "vendor", "Vendor"
         
-    email = models.EmailField(unique=True)
+    # Stored canonical (lowercased); uniqueness is enforced on lower(email), see Meta
+    email = models.EmailField()
     username = models.CharField(max_length=150, unique=True)
     first_name = models.CharField(max_length=30, blank=True, null=True, db_index=True)
     last_name = models.CharField(max_length=30, blank=True, null=True, db_index=True)
@@ -23,15 +55,63 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     date_joined = models.DateTimeField(auto_now_add=True)
+    # Written in batches by apps/users/activity.py, like last_login
+    last_seen = models.DateTimeField(null=True, blank=True)
+    permissions_version = models.PositiveIntegerField(default=1)
     
     objects = managers.UserManager()
     
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
     
+    TRACKED_FIELDS = ('role', 'is_active', 'is_staff', 'is_superuser')
+
     def __str__(self):
         return f"{self.username} ({self.email})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_state = {
+            field: getattr(instance, field) for field in cls.TRACKED_FIELDS if field in field_names
+        }
+        return instance
     
+    def save(self, *args, **kwargs):
+        """
+        Save in a transaction on the user's database, so the profile and outbox rows written
+        by post_save signals commit or roll back with the user. With sharding enabled every
+        new user, however it is created, gets an id that encodes its email's bucket: a serial
+        id from one shard's sequence could be issued again by another shard.
+        """
+        if sharding.enabled() and self._state.adding:
+            if self.pk is None:
+                return self._insert_sharded(*args, **kwargs)
+            if sharding.is_legacy_id(self.pk):
+                raise ValueError(f"Cannot insert user id {self.pk}: ids without a bucket are not issued while sharding is enabled")
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+    def _insert_sharded(self, *args, **kwargs):
+        using = kwargs.pop('using', None) or sharding.shard_for_email(self.email)
+        kwargs['force_insert'] = True
+        for attempt in range(3):
+            self.pk = sharding.generate_id(self.email)
+            try:
+                with transaction.atomic(using=using):
+                    return super().save(*args, using=using, **kwargs)
+            except IntegrityError:
+                # Retry only if the generated id collided, not the email or username
+                collided = type(self).objects.using(using).filter(id=self.pk).exists()
+                self.pk = None
+                if attempt == 2 or not collided:
+                    raise
+
+    def clean(self):
+        super().clean()
+        self.email = self.__class__.objects.normalize_email(self.email)
+
     def become_vendor(self):
         self.role = self.UserRoleChoice.VENDOR
         self.save()
@@ -40,10 +120,28 @@ class User(AbstractBaseUser, PermissionsMixin):
         db_table = 'auth_user'
         verbose_name = 'user'
         verbose_name_plural = 'users'
+        # No plain email or username index: lookups go through lower(email), and username's
+        # unique constraint has its own. `manage.py audit_indexes` reports any that creep back.
         indexes = [
-            models.Index(fields=['email']),
-            models.Index(fields=['username']),
+            # Vendor directory listing (apps/users/vendors.py): active vendors only, in page order,
+            # carrying the listed columns so the user side of a page is read from the index alone
+            models.Index(
+                CodePointOrder(Lower('username')), 'id',
+                name='user_vendor_directory_idx',
+                condition=models.Q(role='vendor', is_active=True),
+                include=['username', 'first_name', 'last_name'],
+            ),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                Lower('email'),
+                name='auth_user_email_lower_uniq',
+                violation_error_message='A user with this email already exists.',
+            ),
+        ]
+
+# email__lower lookups compile to LOWER("email") = ..., which the constraint's index serves
+User._meta.get_field('email').register_lookup(Lower)
 
 class Profile(models.Model):
     """
@@ -53,8 +151,15 @@ class Profile(models.Model):
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
     city = models.CharField(max_length=100, null=True, blank=True)
     country = models.CharField(max_length=100, null=True, blank=True)
+    # Reference rows resolved from city/country; the (country_ref, city_ref) index below also serves country lookups
+    country_ref = models.ForeignKey(
+        'geo.Country', on_delete=models.SET_NULL, null=True, blank=True, related_name='profiles', db_index=False
+    )
+    city_ref = models.ForeignKey('geo.City', on_delete=models.SET_NULL, null=True, blank=True, related_name='profiles')
     date_birth = models.DateField(null=True, blank=True)
     
+    objects = managers.ProfileQuerySet.as_manager()
+    
     def __str__(self):
         return f"Profile of {self.user.username}"
     
@@ -62,6 +167,127 @@ class Profile(models.Model):
         db_table = 'user_profile'
         verbose_name = 'profile'
         verbose_name_plural = 'profiles'
+        # user needs no index here, the one-to-one field's unique constraint provides it
+        indexes = [
+            models.Index(fields=['country_ref', 'city_ref'], name='user_profile_country_city_idx'),
+        ]
+
+class ArchivedUser(models.Model):
+    """
+    Dormant user moved out of the hot tables, with its rows stored as compressed JSON
+    """
+    class Reason(models.TextChoices):
+        DORMANT = "dormant", "Dormant"
+        INACTIVE = "inactive", "Inactive"
+
+    id = models.BigIntegerField(primary_key=True)
+    email = models.EmailField(unique=True)
+    username = models.CharField(max_length=150, unique=True)
+    reason = models.CharField(max_length=10, choices=Reason)
+    last_login = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    payload = models.BinaryField()
+
+    objects = managers.ShardedQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Archived {self.username} ({self.email})"
+
+    class Meta:
+        db_table = 'user_archive'
+        verbose_name = 'archived user'
+        verbose_name_plural = 'archived users'
+
+class OutboxEvent(models.Model):
+    """
+    User lifecycle event written in the same transaction as the change it describes
+    """
+    event_type = models.CharField(max_length=50, db_index=True)
+    aggregate_id = models.BigIntegerField(db_index=True)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Orders the change feed by commit, see outbox.py
+    transaction_id = models.BigIntegerField(null=True, editable=False, db_default=CurrentTransactionId())
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    # Leased by a relay until then, or backing off after a failed delivery
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"{self.event_type} #{self.pk}"
+
+    class Meta:
+        db_table = 'user_outbox_event'
+        verbose_name = 'outbox event'
+        verbose_name_plural = 'outbox events'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(delivered_at__isnull=True), name='user_outbox_pending_idx'),
+            models.Index(fields=['transaction_id', 'id'], name='user_outbox_feed_idx'),
+        ]
+
+class FunnelRollup(models.Model):
+    """
+    Number of times a signup funnel step happened in one hour, flushed from cache counters
+    """
+    class Step(models.TextChoices):
+        OTP_REQUESTED = "otp_requested", "OTP requested"
+        OTP_VERIFIED = "otp_verified", "OTP verified"
+        REGISTERED = "registered", "Registered"
+        GOOGLE_REGISTERED = "google_registered", "Registered with Google"
+        PROFILE_COMPLETED = "profile_completed", "Profile completed"
+
+    bucket = models.DateTimeField()
+    step = models.CharField(max_length=20, choices=Step)
+    count = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.step} at {self.bucket:%Y-%m-%d %H:00}: {self.count}"
+
+    class Meta:
+        db_table = 'user_funnel_rollup'
+        verbose_name = 'funnel rollup'
+        verbose_name_plural = 'funnel rollups'
+        ordering = ['bucket', 'step']
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'step'], name='user_funnel_rollup_bucket_step_uniq'),
+        ]
+
+class AuthAuditEvent(models.Model):
+    """
+    Append-only record of an authentication event, written in batches by apps/users/audit.py.
+    On PostgreSQL the table is range-partitioned by day on created_at.
+    """
+    class Event(models.TextChoices):
+        LOGIN = "login", "Login"
+        LOGIN_FAILED = "login_failed", "Failed login"
+        LOGOUT = "logout", "Logout"
+        GOOGLE_LOGIN = "google_login", "Google sign-in"
+        OTP_REQUESTED = "otp_requested", "OTP requested"
+        OTP_VERIFIED = "otp_verified", "OTP verified"
+        OTP_FAILED = "otp_failed", "OTP verification failed"
+        PASSWORD_CHANGED = "password_changed", "Password changed"
+
+    created_at = models.DateTimeField()
+    event = models.CharField(max_length=20, choices=Event)
+    # Not a foreign key: audit rows outlive archived, merged and deleted users
+    user_id = models.BigIntegerField(null=True, blank=True)
+    email = models.EmailField(blank=True)
+    ip = models.GenericIPAddressField(null=True, blank=True)
+    user_agent = models.CharField(max_length=255, blank=True)
+    detail = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return f"{self.event} {self.email or self.user_id} at {self.created_at:%Y-%m-%d %H:%M:%S}"
+
+    class Meta:
+        db_table = 'user_auth_audit'
+        verbose_name = 'authentication audit event'
+        verbose_name_plural = 'authentication audit events'
         indexes = [
-            models.Index(fields=['user']),
+            models.Index(fields=['user_id', 'created_at'], name='user_auth_audit_user_idx'),
+            models.Index(fields=['email', 'created_at'], name='user_auth_audit_email_idx'),
+            models.Index(fields=['ip', 'created_at'], name='user_auth_audit_ip_idx'),
+            models.Index(fields=['created_at'], name='user_auth_audit_created_idx'),
         ]
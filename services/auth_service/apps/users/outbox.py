@@ -0,0 +1,77 @@
+"""
+Change feed over the outbox of every database holding users.
+
+An event is written to the database of the user it is about, in the transaction that
+changes the user (see events.publish), so with sharding enabled each shard has its own
+outbox. Ids are taken when a row is inserted, not when its transaction commits, so a feed
+paging by id alone would skip an event whose transaction took a lower id but committed
+after a later one was read. On PostgreSQL every event records the id of the transaction
+that wrote it, and the feed reads in (transaction id, id) order and stops short of the
+oldest transaction still running: no event can commit later with a lower key. SQLite
+serialises writers, so ids follow commit order there.
+
+A feed cursor records a position per database as `alias:transaction id.id` entries
+joined by commas. Positions without a transaction id (`alias:id`, or a bare id for
+`default`, the forms cursors had before) continue from that event.
+"""
+import heapq
+from itertools import islice
+from django.db import connections
+from django.db.models import Q
+from . import archive, models
+
+def parse_cursor(cursor):
+    """
+    {alias: (transaction id or None, last id read)} from a feed cursor, raising ValueError if it is malformed
+    """
+    positions = {}
+    for entry in filter(None, (cursor or '').split(',')):
+        alias, _, position = entry.rpartition(':')
+        transaction_id, _, event_id = position.rpartition('.')
+        positions[alias or 'default'] = (int(transaction_id) if transaction_id else None, int(event_id))
+    return positions
+
+def format_cursor(positions):
+    return ','.join(
+        f"{alias}:{event_id}" if transaction_id is None else f"{alias}:{transaction_id}.{event_id}"
+        for alias, (transaction_id, event_id) in sorted(positions.items())
+    )
+
+def _page(using, position, limit, types):
+    transaction_id, event_id = position
+    queryset = models.OutboxEvent.objects.using(using)
+    if connections[using].vendor == 'postgresql':
+        if transaction_id is None and event_id:
+            transaction_id = queryset.filter(id=event_id).values_list('transaction_id', flat=True).first()
+        transaction_id = transaction_id or 0
+        queryset = queryset.filter(
+            Q(transaction_id__gt=transaction_id) | Q(transaction_id=transaction_id, id__gt=event_id),
+            transaction_id__lt=models.SnapshotXmin(),
+        ).order_by('transaction_id', 'id')
+    else:
+        queryset = queryset.filter(id__gt=event_id).order_by('id')
+    if types:
+        queryset = queryset.filter(event_type__in=types)
+    return list(queryset[:limit])
+
+def read(positions, limit, types=None):
+    """
+    Up to `limit` committed events after `positions`, one query per database (two when
+    resuming from a cursor without transaction ids). Returns (events, next positions,
+    has_more). Events of different databases are interleaved by creation time; each
+    database's events stay in feed order, so its position only ever moves past events
+    that were returned.
+    """
+    pages = {using: _page(using, positions.get(using, (None, 0)), limit, types) for using in archive.databases()}
+    merged = heapq.merge(
+        *([(event.created_at, using, event) for event in page] for using, page in pages.items()),
+        key=lambda item: item[:2],
+    )
+    rows = list(islice(merged, limit))
+
+    next_positions = {using: positions.get(using, (None, 0)) for using in pages}
+    for _, using, event in rows:
+        next_positions[using] = (event.transaction_id, event.id)
+    total = sum(len(page) for page in pages.values())
+    has_more = len(rows) < total or any(len(page) == limit for page in pages.values())
+    return [event for _, _, event in rows], next_positions, has_more
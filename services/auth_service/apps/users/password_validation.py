@@ -0,0 +1,161 @@
+"""
+Offline breached-password check against a memory-mapped, sorted hash index.
+
+The index file, built by `manage.py build_breached_index`, is laid out as:
+
+    header   32 bytes   MAGIC, record size, record count
+    fanout   65537 * 8  big-endian offsets: fanout[i] = records whose first two bytes are < i
+    records  count * 8  sorted, de-duplicated first 8 bytes of each password's SHA-1
+
+A lookup reads one fanout pair and binary-searches the ~count/65536 records under it,
+about 15 probes for a billion hashes. The file is mapped read-only, so every worker
+shares the same page cache pages instead of holding its own copy. Truncating SHA-1 to 64
+bits makes false positives negligible (about count / 2**64 per lookup).
+"""
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+from django.conf import settings
+from django.contrib.auth.password_validation import CommonPasswordValidator
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.utils.translation import gettext as _
+
+logger = logging.getLogger('apps.users')
+
+MAGIC = b'BRPWIDX1'
+HEADER = struct.Struct('>8sIIQ8x')
+RECORD_SIZE = 8
+FANOUT_BITS = 16
+FANOUT = struct.Struct(f'>{(1 << FANOUT_BITS) + 1}Q')
+
+def password_key(password):
+    return hashlib.sha1(password.encode()).digest()[:RECORD_SIZE]
+
+def sha1_hex_key(sha1_hex):
+    return bytes.fromhex(sha1_hex[:RECORD_SIZE * 2])
+
+def write_index(path, records):
+    """
+    Write sorted, de-duplicated RECORD_SIZE-byte keys from the iterable `records` to `path`
+    atomically; processes that already mapped the old file keep reading it. Returns the count.
+    """
+    tmp_path = f"{path}.tmp"
+    fanout = [0] * ((1 << FANOUT_BITS) + 1)
+    count = 0
+    previous = None
+    with open(tmp_path, 'wb') as fh:
+        fh.write(b'\0' * (HEADER.size + FANOUT.size))
+        buffer = bytearray()
+        for record in records:
+            if previous is not None and record <= previous:
+                if record == previous:
+                    continue
+                raise ValueError("Index records must be sorted")
+            buffer += record
+            fanout[(record[0] << 8 | record[1]) + 1] += 1
+            previous = record
+            count += 1
+            if len(buffer) >= 1 << 20:
+                fh.write(buffer)
+                buffer.clear()
+        fh.write(buffer)
+
+        for prefix in range(1, len(fanout)):
+            fanout[prefix] += fanout[prefix - 1]
+        fh.seek(0)
+        fh.write(HEADER.pack(MAGIC, RECORD_SIZE, 0, count))
+        fh.write(FANOUT.pack(*fanout))
+    os.replace(tmp_path, path)
+    return count
+
+class _Records:
+    """
+    Sequence view over the records in a mapping, for bisect
+    """
+    def __init__(self, buffer, offset, count):
+        self.buffer = buffer
+        self.offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        start = self.offset + index * RECORD_SIZE
+        return self.buffer[start:start + RECORD_SIZE]
+
+class BreachedPasswordIndex:
+    def __init__(self, path):
+        with open(path, 'rb') as fh:
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, record_size, _, count = HEADER.unpack_from(self._map, 0)
+        expected_size = HEADER.size + FANOUT.size + count * RECORD_SIZE
+        if magic != MAGIC or record_size != RECORD_SIZE or len(self._map) != expected_size:
+            self._map.close()
+            raise ImproperlyConfigured(f"{path} is not a breached password index")
+        self.path = path
+        self.count = count
+        self._records = _Records(self._map, HEADER.size + FANOUT.size, count)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        prefix = key[0] << 8 | key[1]
+        lo, hi = struct.unpack_from('>QQ', self._map, HEADER.size + prefix * 8)
+        position = bisect_left(self._records, key, lo, hi)
+        return position < hi and self._records[position] == key
+
+    def contains_password(self, password):
+        return password_key(password) in self
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(path):
+    """
+    Map the index at `path` once per process
+    """
+    index = _indexes.get(path)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(path)
+            if index is None:
+                index = _indexes[path] = BreachedPasswordIndex(path)
+    return index
+
+class BreachedPasswordValidator:
+    """
+    Reject passwords found in the breached-password index at `index_path`
+    (default settings.BREACHED_PASSWORDS_INDEX). Without an index it falls back to
+    Django's CommonPasswordValidator.
+    """
+    def __init__(self, index_path=None):
+        self.index_path = index_path if index_path is not None else settings.BREACHED_PASSWORDS_INDEX
+        self.index = None
+        self.fallback = None
+        if self.index_path:
+            try:
+                self.index = get_index(self.index_path)
+            except (OSError, ImproperlyConfigured) as e:
+                logger.error(f"Breached password index unavailable, using the common password list: {e}")
+        if self.index is None:
+            self.fallback = CommonPasswordValidator()
+
+    def validate(self, password, user=None):
+        if self.index is None:
+            return self.fallback.validate(password, user)
+        if self.index.contains_password(password):
+            raise ValidationError(
+                _("This password has appeared in a data breach and cannot be used."),
+                code='password_breached',
+            )
+
+    def get_help_text(self):
+        if self.index is None:
+            return self.fallback.get_help_text()
+        return _("Your password can't be one that has appeared in a data breach.")
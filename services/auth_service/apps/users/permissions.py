@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from rest_framework import permissions
+
+class IsInternalService(permissions.BasePermission):
+    """
+    Allow requests from other e-market services that present a shared X-Service-Token
+    """
+    message = "A valid service token is required."
+
+    def has_permission(self, request, view):
+        token = request.headers.get('X-Service-Token', '')
+        if not token:
+            return False
+        return any(constant_time_compare(token, allowed) for allowed in settings.INTERNAL_SERVICE_TOKENS)
@@ -0,0 +1,339 @@
+"""
+Deterministic synthetic users for scale testing, loaded by `manage.py seed_users`.
+
+Users are generated in blocks of BLOCK_SIZE, each from its own Random(f"{seed}-{block}"),
+so user i of a given seed and total is always the same row whichever process generates
+it and whatever was loaded before. A block holds the users, their profiles and their
+refresh tokens, and is loaded in one transaction per database with PostgreSQL `COPY`
+(batched INSERTs elsewhere). Password hashes come from a small pool computed once,
+and rows go straight to the tables: no save signals, outbox events or funnel counts.
+
+User ids are built like sharded ids from date_joined, the email's bucket and the row
+number, so they route to the right shard and never collide with serial ids.
+"""
+import base64
+import hashlib
+import hmac
+import io
+import json
+import random
+from bisect import bisect
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from itertools import accumulate
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from apps.geo import models as geo_models
+from . import models, sharding
+
+BLOCK_SIZE = 10000
+HASH_POOL_SIZE = 8
+AVATAR_COUNT = 64
+
+FIRST_NAMES = (
+    'Oleksandr', 'Olena', 'Andrii', 'Iryna', 'Dmytro', 'Natalia', 'Serhii', 'Kateryna', 'Mykola', 'Oksana',
+    'Volodymyr', 'Tetiana', 'Yurii', 'Yuliia', 'Maksym', 'Anna', 'Ivan', 'Mariia', 'Taras', 'Sofiia',
+    'Bohdan', 'Viktoriia', 'Artem', 'Alina', 'Denys', 'Daria', 'Pavlo', 'Khrystyna', 'Roman', 'Anastasiia',
+    'John', 'Emma', 'Michael', 'Olivia', 'David', 'Sophia', 'James', 'Mia', 'Daniel', 'Laura',
+    'Piotr', 'Agnieszka', 'Lukas', 'Lena', 'Marco', 'Giulia', 'Carlos', 'Lucia', 'Ahmet', 'Elif',
+)
+LAST_NAMES = (
+    'Melnyk', 'Shevchenko', 'Kovalenko', 'Bondarenko', 'Tkachenko', 'Kravchenko', 'Boiko', 'Kovalchuk',
+    'Oliinyk', 'Shevchuk', 'Polishchuk', 'Lysenko', 'Marchenko', 'Rudenko', 'Savchenko', 'Petrenko',
+    'Moroz', 'Pavlenko', 'Levchenko', 'Kharchenko', 'Ivanenko', 'Hnatiuk', 'Sydorenko', 'Tkachuk',
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Miller', 'Davis', 'Wilson', 'Taylor', 'Clark',
+    'Nowak', 'Kowalski', 'Muller', 'Schmidt', 'Rossi', 'Bianchi', 'Garcia', 'Martinez', 'Yilmaz', 'Kaya',
+)
+EMAIL_DOMAINS = (
+    ('gmail.com', 46), ('ukr.net', 12), ('outlook.com', 8), ('yahoo.com', 6), ('i.ua', 4), ('icloud.com', 4),
+    ('hotmail.com', 4), ('meta.ua', 2), ('proton.me', 2), ('gmx.de', 2), ('example.com', 5), ('example.org', 5),
+)
+EMAIL_PATTERNS = (
+    ('{first}.{last}{n}', 40), ('{first}{last}{n}', 20), ('{f}{last}{n}', 15), ('{first}_{last}{n}', 10),
+    ('{last}.{first}{n}', 8), ('{first}{n}', 7),
+)
+ROLES = (
+    (models.User.UserRoleChoice.CLIENT.value, 965), (models.User.UserRoleChoice.VENDOR.value, 34),
+    (models.User.UserRoleChoice.ADMIN.value, 1),
+)
+# Share of users whose profile is complete, has names only, or was never filled in
+PROFILE_STATES = (('complete', 55), ('names', 20), ('empty', 25))
+INACTIVE_SHARE = 0.03
+NEVER_LOGGED_IN_SHARE = 0.15
+AVATAR_SHARE = 0.35
+HOME_COUNTRY_SHARE = 0.6
+# Mean days since a user was last seen; the exponential tail makes the dormant users
+MEAN_DAYS_SINCE_SEEN = 60
+TOKENS_PER_LOGIN = ((1, 50), (2, 25), (3, 15), (4, 10))
+LOGOUT_SHARE = 0.1
+REVOKED_SHARE = 0.3
+
+USER_COLUMNS = (
+    'id', 'password', 'last_login', 'is_superuser', 'email', 'username', 'first_name', 'last_name',
+    'role', 'is_active', 'is_staff', 'date_joined', 'last_seen', 'permissions_version',
+)
+PROFILE_COLUMNS = ('user_id', 'avatar', 'city', 'country', 'country_ref_id', 'city_ref_id', 'date_birth')
+TOKEN_COLUMNS = ('user_id', 'jti', 'token', 'created_at', 'expires_at')
+BLACKLIST_COLUMNS = ('token_id', 'blacklisted_at')
+TABLES = (
+    models.User._meta.db_table, models.Profile._meta.db_table,
+    OutstandingToken._meta.db_table, BlacklistedToken._meta.db_table,
+)
+
+def _weighted(pairs):
+    values, weights = zip(*pairs)
+    return values, list(accumulate(weights))
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+def avatar_name(number):
+    return f"avatars/seed/{number:02d}.png"
+
+def copy_value(value):
+    """
+    `value` in COPY's text format
+    """
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, str):
+        if '\\' in value or '\t' in value or '\n' in value or '\r' in value:
+            return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+        return value
+    return str(value)
+
+def insert_rows(using, table, columns, rows):
+    """
+    Load `rows` into `table` with COPY on PostgreSQL, or one executemany() elsewhere
+    """
+    if not rows:
+        return
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    column_list = ', '.join(quote(column) for column in columns)
+    with connection.cursor() as cursor:
+        if connection.vendor != 'postgresql':
+            placeholders = ', '.join(['%s'] * len(columns))
+            cursor.executemany(
+                f"INSERT INTO {quote(table)} ({column_list}) VALUES ({placeholders})",
+                [[_adapt(connection, value) for value in row] for row in rows],
+            )
+            return
+
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+        data = ''.join('\t'.join(map(copy_value, row)) + '\n' for row in rows)
+        sql = f"COPY {quote(table)} ({column_list}) FROM STDIN"
+        if is_psycopg3:
+            with cursor.cursor.copy(sql) as copy:
+                copy.write(data)
+        else:
+            cursor.cursor.copy_expert(sql, io.StringIO(data))
+
+def _adapt(connection, value):
+    if isinstance(value, datetime):
+        return connection.ops.adapt_datetimefield_value(value)
+    if hasattr(value, 'isoformat'):
+        return connection.ops.adapt_datefield_value(value)
+    return value
+
+class Places:
+    """
+    Cities from the geo reference tables, weighted by population, with a share of users
+    from the home country. Empty when load_geo has not run.
+    """
+    def __init__(self, using, home_country):
+        countries = dict(geo_models.Country.objects.using(using).values_list('code', 'name'))
+        cities = list(
+            geo_models.City.objects.using(using)
+            .filter(population__gt=0)
+            .order_by('id')
+            .values_list('id', 'name', 'country_id', 'population')
+        )
+        entries = [
+            (countries[country], country, name, city_id, population)
+            for city_id, name, country, population in cities if country in countries
+        ]
+        self.world, self.world_weights = self._weights(entries)
+        self.home, self.home_weights = self._weights([entry for entry in entries if entry[1] == home_country])
+
+    @staticmethod
+    def _weights(entries):
+        if not entries:
+            return [], []
+        return [entry[:4] for entry in entries], list(accumulate(entry[4] for entry in entries))
+
+    def pick(self, rng):
+        if self.home and rng.random() < HOME_COUNTRY_SHARE:
+            entries, weights = self.home, self.home_weights
+        elif self.world:
+            entries, weights = self.world, self.world_weights
+        else:
+            return None
+        return entries[bisect(weights, rng.random() * weights[-1])]
+
+class Seeder:
+    """
+    Generates and loads the users of one seed. `total` is part of the data: it spreads
+    the sign-up dates, so the same seed with another total gives other users.
+    """
+    def __init__(self, seed, total, until, days, password, home_country, using='default'):
+        self.seed = seed
+        self.total = total
+        self.until = datetime.combine(until, time.min, tzinfo=dt_timezone.utc)
+        self.start = self.until - timedelta(days=days)
+        self.span = (self.until - self.start).total_seconds()
+        self.places = Places(using, home_country)
+
+        rng = random.Random(f"{seed}-hashes")
+        self.hashes = [make_password(password, salt=f"{rng.getrandbits(96):024x}") for _ in range(HASH_POOL_SIZE)]
+
+        self.first_names, self.first_weights = _weighted((name, 1 / (rank + 1) ** 0.7) for rank, name in enumerate(FIRST_NAMES))
+        self.last_names, self.last_weights = _weighted((name, 1 / (rank + 1) ** 0.7) for rank, name in enumerate(LAST_NAMES))
+        self.domains, self.domain_weights = _weighted(EMAIL_DOMAINS)
+        self.patterns, self.pattern_weights = _weighted(EMAIL_PATTERNS)
+        self.roles, self.role_weights = _weighted(ROLES)
+        self.profile_states, self.profile_weights = _weighted(PROFILE_STATES)
+        self.token_counts, self.token_weights = _weighted(TOKENS_PER_LOGIN)
+
+        self.lifetime = api_settings.REFRESH_TOKEN_LIFETIME
+        self.token_header = _b64(json.dumps({'alg': api_settings.ALGORITHM, 'typ': 'JWT'}, separators=(',', ':')).encode())
+        # The claims RefreshToken.for_user() writes, formatted directly: json.dumps() per token is the slow part
+        self.token_claims = (
+            '{"token_type":"refresh","exp":%d,"iat":%d,"jti":"%s",'
+            + json.dumps(api_settings.USER_ID_CLAIM)
+            + ':"%d","role":"%s","perms":[],"pv":1}'
+        )
+        self.digest = {'HS256': hashlib.sha256, 'HS384': hashlib.sha384, 'HS512': hashlib.sha512}.get(api_settings.ALGORITHM)
+        self.signing_key = api_settings.SIGNING_KEY.encode() if self.digest else None
+
+    def blocks(self):
+        return range((self.total + BLOCK_SIZE - 1) // BLOCK_SIZE)
+
+    def user_id(self, number, joined, email):
+        elapsed = int(joined.timestamp()) - sharding.ID_EPOCH
+        return (
+            (elapsed << (sharding.BUCKET_BITS + sharding.SEQUENCE_BITS))
+            | (sharding.bucket_for_email(email) << sharding.SEQUENCE_BITS)
+            | (number & sharding.SEQUENCE_MASK)
+        )
+
+    def joined_at(self, number, rng):
+        # Sign-ups grow linearly over the period, so row i joins at sqrt(i / total) of it;
+        # the jitter stays within the row's slot and keeps the dates in row order
+        position = ((number + rng.random()) / self.total) ** 0.5
+        return self.start + timedelta(seconds=int(position * self.span))
+
+    def token(self, user_id, role, jti, issued, expires):
+        payload = _b64((self.token_claims % (expires.timestamp(), issued.timestamp(), jti, user_id, role)).encode())
+        signing_input = self.token_header + b'.' + payload
+        if self.digest is None:
+            # Asymmetric algorithms: a token of the right shape, not verifiable
+            signature = _b64(hashlib.sha256(signing_input).digest() * 8)
+        else:
+            signature = _b64(hmac.new(self.signing_key, signing_input, self.digest).digest())
+        return (signing_input + b'.' + signature).decode()
+
+    def generate(self, block):
+        """
+        The rows of `block` as {database: {'users': [...], 'profiles': [...], 'tokens': [...], 'revoked': [...]}},
+        where revoked holds (jti, blacklisted_at) for tokens to blacklist once their ids are known
+        """
+        rng = random.Random(f"{self.seed}-{block}")
+        uniform = rng.random
+        until = self.until
+        sharded = sharding.enabled()
+
+        def pick(values, cum_weights):
+            # random.choices() for a single draw, without its per-call overhead
+            return values[bisect(cum_weights, uniform() * cum_weights[-1])]
+
+        rows = {}
+        for number in range(block * BLOCK_SIZE, min((block + 1) * BLOCK_SIZE, self.total)):
+            first = pick(self.first_names, self.first_weights)
+            last = pick(self.last_names, self.last_weights)
+            pattern = pick(self.patterns, self.pattern_weights)
+            first_lower, last_lower = first.lower(), last.lower()
+            local = pattern.format(first=first_lower, last=last_lower, f=first_lower[0], n=number)
+            email = f"{local}@{pick(self.domains, self.domain_weights)}"
+            username = f"{first_lower}{last_lower}{number}"
+            role = pick(self.roles, self.role_weights)
+            joined = self.joined_at(number, rng)
+            user_id = self.user_id(number, joined, email)
+            active = uniform() >= INACTIVE_SHARE
+
+            last_login = last_seen = None
+            if uniform() >= NEVER_LOGGED_IN_SHARE:
+                since = timedelta(days=rng.expovariate(1 / MEAN_DAYS_SINCE_SEEN))
+                last_seen = max(joined, until - since)
+                last_login = max(joined, last_seen - timedelta(days=uniform() * 7))
+
+            state = pick(self.profile_states, self.profile_weights)
+            named = state != 'empty'
+            place = self.places.pick(rng) if state == 'complete' else None
+            avatar = avatar_name(rng.randrange(AVATAR_COUNT)) if state == 'complete' and uniform() < AVATAR_SHARE else None
+            birth = None
+            if state == 'complete':
+                age = min(max(rng.gauss(34, 11), 18), 80)
+                birth = (joined - timedelta(days=int(age * 365.25))).date()
+
+            database = rows.setdefault(
+                sharding.shard_for_bucket(sharding.bucket_for_id(user_id)) if sharded else 'default',
+                {'users': [], 'profiles': [], 'tokens': [], 'revoked': []},
+            )
+            database['users'].append((
+                user_id, self.hashes[number % HASH_POOL_SIZE], last_login, False, email, username,
+                first if named else None, last if named else None,
+                role, active, False, joined, last_seen, 1,
+            ))
+            database['profiles'].append((
+                user_id, avatar,
+                place[2] if place else None, place[0] if place else None,
+                place[1] if place else None, place[3] if place else None,
+                birth,
+            ))
+
+            if last_login is not None:
+                count = pick(self.token_counts, self.token_weights)
+                issued = last_login
+                for index in range(count):
+                    jti = f"{rng.getrandbits(128):032x}"
+                    expires = issued + self.lifetime
+                    database['tokens'].append((user_id, jti, self.token(user_id, role, jti, issued, expires), issued, expires))
+                    if uniform() < (LOGOUT_SHARE if index == 0 else REVOKED_SHARE):
+                        database['revoked'].append((jti, min(issued + self.lifetime * uniform(), until)))
+                    issued = max(joined, issued - timedelta(days=uniform() * 30))
+        return rows
+
+    def load(self, block):
+        """
+        Generate and load `block`, skipping databases that already hold it. Returns the
+        number of rows written per table.
+        """
+        written = {'users': 0, 'profiles': 0, 'tokens': 0, 'blacklisted': 0}
+        for using, rows in self.generate(block).items():
+            if models.User.objects.using(using).filter(id=rows['users'][0][0]).exists():
+                continue
+            with transaction.atomic(using=using):
+                insert_rows(using, models.User._meta.db_table, USER_COLUMNS, rows['users'])
+                insert_rows(using, models.Profile._meta.db_table, PROFILE_COLUMNS, rows['profiles'])
+                insert_rows(using, OutstandingToken._meta.db_table, TOKEN_COLUMNS, rows['tokens'])
+                blacklisted = self.blacklist(using, rows['revoked'])
+            written['users'] += len(rows['users'])
+            written['profiles'] += len(rows['profiles'])
+            written['tokens'] += len(rows['tokens'])
+            written['blacklisted'] += blacklisted
+        return written
+
+    def blacklist(self, using, revoked):
+        token_ids = {}
+        jtis = [jti for jti, _ in revoked]
+        for start in range(0, len(jtis), 5000):
+            token_ids.update(OutstandingToken.objects.using(using).filter(jti__in=jtis[start:start + 5000]).values_list('jti', 'id'))
+        rows = [(token_ids[jti], blacklisted_at) for jti, blacklisted_at in revoked]
+        insert_rows(using, BlacklistedToken._meta.db_table, BLACKLIST_COLUMNS, rows)
+        return len(rows)
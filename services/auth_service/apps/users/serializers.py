@@ -1,19 +1,53 @@
+import datetime
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 from django.core.validators import validate_email
 from django.contrib.auth.password_validation import validate_password
-from . import models
+from apps.geo import index as geo_index
+from . import archive, managers, models
+
+class CanonicalEmailField(serializers.EmailField):
+    """
+    Email field that returns the canonical, lowercased address
+    """
+    def to_internal_value(self, data):
+        return managers.canonical_email(super().to_internal_value(data))
+
+def validate_email_available(email, instance=None):
+    queryset = models.User.objects.filter(email__lower=email)
+    if instance is not None:
+        queryset = queryset.exclude(pk=instance.pk)
+    if queryset.exists():
+        raise serializers.ValidationError("user with this email already exists.")
+    return email
+
+def validate_username_available(username, instance=None):
+    """
+    Usernames are unique across every shard, archived users included, while the unique
+    index only covers one shard, so each shard is asked
+    """
+    for using in archive.databases():
+        queryset = models.User.objects.using(using).filter(username=username)
+        if instance is not None:
+            queryset = queryset.exclude(pk=instance.pk)
+        if queryset.exists():
+            raise serializers.ValidationError("user with this username already exists.")
+    if archive.is_archived_username(username):
+        raise serializers.ValidationError("user with this username already exists.")
+    return username
 
 class EmailSerializer(serializers.Serializer):
     """
     Email serializer for email validation
     """
-    email = serializers.EmailField(validators=[validate_email])
+    email = CanonicalEmailField(validators=[validate_email])
     
 class OTPVerifySerializer(serializers.Serializer):
     """
     Serializer for otp verify
     """
-    email = serializers.EmailField(validators=[validate_email])
+    email = CanonicalEmailField(validators=[validate_email])
     otp_code = serializers.CharField(max_length=6, min_length=6)
 
     def validate_otp_code(self, value):
@@ -32,11 +66,20 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         help_text="Password must be at least 8 characters long"
     )    
     password_confirm = serializers.CharField(write_only=True)
+    email = CanonicalEmailField(max_length=254)
     
     class Meta:
         model = models.User
         fields = ['email', 'username', 'password', 'password_confirm']
+        # The model's UniqueValidator only queries the default database, see validate_username_available
+        extra_kwargs = {'username': {'validators': []}}
+
+    def validate_email(self, value):
+        return validate_email_available(value)
         
+    def validate_username(self, value):
+        return validate_username_available(value)
+
     def validate(self, attrs):
         if attrs['password'] != attrs['password_confirm']:
             raise serializers.ValidationError({"password": "Passwords must match"})
@@ -64,11 +107,19 @@ class UserSerializer(serializers.ModelSerializer):
     Serializer for the User model
     """
     profile = ProfileSerializer(required=False)
+    email = CanonicalEmailField(max_length=254)
 
     class Meta:
         model = models.User
         fields = ['id', 'email', 'username', 'first_name', 'last_name', 'is_active', 'is_staff', 'date_joined', 'profile']
         read_only_fields = ['id', 'date_joined']
+        extra_kwargs = {'username': {'validators': []}}
+
+    def validate_email(self, value):
+        return validate_email_available(value, self.instance)
+
+    def validate_username(self, value):
+        return validate_username_available(value, self.instance)
 
     def update(self, instance, validated_data):
         profile_data = validated_data.pop('profile', None)
@@ -79,12 +130,79 @@ class UserSerializer(serializers.ModelSerializer):
 
         if profile_data:
             profile, _ = models.Profile.objects.get_or_create(user=instance)
+            update_fields = set(profile_data)
             for attr, value in profile_data.items():
                 setattr(profile, attr, value)
-            profile.save(update_fields=profile_data.keys())
+            if {'city', 'country'} & update_fields:
+                update_fields.update(geo_index.normalize_profile(profile))
+            profile.save(update_fields=update_fields)
 
         return instance
 
+def _datetime_representation(value):
+    """
+    Same output as DRF's DateTimeField with the default ISO 8601 format
+    """
+    if value is None:
+        return None
+    if settings.USE_TZ:
+        value = timezone.localtime(value) if timezone.is_aware(value) else timezone.make_aware(value)
+    elif timezone.is_aware(value):
+        value = timezone.make_naive(value, datetime.timezone.utc)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+def _file_representation(value, request=None):
+    if not value:
+        return None
+    url = value.url
+    return request.build_absolute_uri(url) if request is not None else url
+
+def profile_representation(profile, request=None):
+    """
+    Flat equivalent of ProfileSerializer(profile).data for hot read paths
+    """
+    return {
+        'avatar': _file_representation(profile.avatar, request),
+        'city': profile.city,
+        'country': profile.country,
+        'date_birth': profile.date_birth.isoformat() if profile.date_birth is not None else None,
+    }
+
+def user_representation(user, request=None):
+    """
+    Flat equivalent of UserSerializer(user).data for hot read paths. Pass the request
+    where the serializer would get one in its context, so avatar URLs are absolute.
+    """
+    data = {
+        'id': user.id,
+        'email': user.email,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'is_active': user.is_active,
+        'is_staff': user.is_staff,
+        'date_joined': _datetime_representation(user.date_joined),
+    }
+    try:
+        data['profile'] = profile_representation(user.profile, request)
+    except models.Profile.DoesNotExist:
+        data['profile'] = None
+    return data
+
+def with_absolute_urls(data, request):
+    """
+    Copy of a cached user_representation(user) with the avatar URL made absolute, as
+    user_representation(user, request) would return it. The cache holds the request-free
+    form so every reader of the `user_{id}` key gets the same shape.
+    """
+    profile = data.get('profile')
+    if not profile or not profile['avatar']:
+        return data
+    return {**data, 'profile': {**profile, 'avatar': request.build_absolute_uri(profile['avatar'])}}
+
 class ChangePasswordSerializer(serializers.Serializer):
     """
     Serializer for changing user password
@@ -146,4 +264,92 @@ class CompleteProfileSerializer(serializers.Serializer):
         from datetime import date
         if value and value >= date.today():
             raise serializers.ValidationError("Date of birth must be in the past")
-        return value
\ No newline at end of file
+        return value
+
+class OutboxEventSerializer(serializers.ModelSerializer):
+    """
+    Serializer for change feed events
+    """
+    class Meta:
+        model = models.OutboxEvent
+        fields = ['id', 'event_type', 'aggregate_id', 'payload', 'created_at']
+
+class BulkUserLookupSerializer(serializers.Serializer):
+    """
+    Serializer for service-to-service bulk user lookups
+    """
+    FIELD_CHOICES = ['id', 'email', 'username', 'first_name', 'last_name', 'is_active', 'date_joined', 'avatar', 'city', 'country']
+    DEFAULT_FIELDS = ['id', 'username', 'first_name', 'last_name', 'avatar']
+    MAX_ITEMS = 500
+
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list)
+    emails = serializers.ListField(child=CanonicalEmailField(), required=False, default=list)
+    fields = serializers.ListField(
+        child=serializers.ChoiceField(choices=FIELD_CHOICES),
+        required=False,
+        default=DEFAULT_FIELDS,
+    )
+
+    def validate(self, attrs):
+        total = len(attrs['ids']) + len(attrs['emails'])
+        if not total:
+            raise serializers.ValidationError("Provide at least one id or email")
+        if total > self.MAX_ITEMS:
+            raise serializers.ValidationError(f"At most {self.MAX_ITEMS} ids and emails per request")
+        attrs['ids'] = list(dict.fromkeys(attrs['ids']))
+        attrs['emails'] = list(dict.fromkeys(attrs['emails']))
+        return attrs
+
+class FunnelStepsSerializer(serializers.Serializer):
+    otp_requested = serializers.IntegerField()
+    otp_verified = serializers.IntegerField()
+    registered = serializers.IntegerField()
+    google_registered = serializers.IntegerField()
+    profile_completed = serializers.IntegerField()
+
+class FunnelConversionSerializer(serializers.Serializer):
+    otp_verified = serializers.FloatField(allow_null=True, help_text="Verified OTPs per OTP requested")
+    registered = serializers.FloatField(allow_null=True, help_text="OTP registrations per verified OTP")
+    profile_completed = serializers.FloatField(allow_null=True, help_text="Completed profiles per registration, OTP and Google")
+    otp_overall = serializers.FloatField(allow_null=True, help_text="OTP registrations per OTP requested")
+
+class FunnelDaySerializer(serializers.Serializer):
+    date = serializers.DateField()
+    steps = FunnelStepsSerializer()
+
+class FunnelReportSerializer(serializers.Serializer):
+    """
+    Serializer for signup funnel reports
+    """
+    start = serializers.DateField()
+    end = serializers.DateField()
+    totals = FunnelStepsSerializer()
+    conversion = FunnelConversionSerializer()
+    days = FunnelDaySerializer(many=True)
+
+class AuthAuditEventSerializer(serializers.ModelSerializer):
+    """
+    Serializer for authentication audit events
+    """
+    class Meta:
+        model = models.AuthAuditEvent
+        fields = ['id', 'created_at', 'event', 'user_id', 'email', 'ip', 'user_agent', 'detail']
+
+class AuthAuditPageSerializer(serializers.Serializer):
+    events = AuthAuditEventSerializer(many=True)
+    next_cursor = serializers.CharField(allow_null=True, help_text="Pass as `cursor` to get the next, older page")
+    has_more = serializers.BooleanField()
+
+class VendorSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    username = serializers.CharField()
+    first_name = serializers.CharField(allow_null=True)
+    last_name = serializers.CharField(allow_null=True)
+    country = serializers.CharField(allow_null=True, help_text="ISO 3166-1 alpha-2 country code")
+    city = serializers.CharField(allow_null=True)
+    avatar = serializers.CharField(allow_null=True, help_text="Avatar image URL")
+
+class VendorDirectoryPageSerializer(serializers.Serializer):
+    vendors = VendorSerializer(many=True)
+    next_cursor = serializers.CharField(allow_null=True, help_text="Pass as `cursor` to get the next page")
+    has_more = serializers.BooleanField()
@@ -0,0 +1,215 @@
+"""
+Optional sharding of users, profiles and archived users across several databases.
+
+Every user belongs to one of BUCKET_COUNT virtual buckets chosen by a hash of the
+normalised email, and buckets are spread over the aliases in settings.USER_SHARDS in
+contiguous ranges. Ids issued while sharding is enabled embed the bucket:
+
+    | 30 bits: seconds since ID_EPOCH | 10 bits: bucket | 13 bits: sequence |
+
+which keeps them within the 53 bits JavaScript clients can represent, and a lookup by id goes straight to the right shard. Ids issued before sharding was
+enabled carry no bucket and are located once by probing the shards, then remembered in
+the cache. settings.USER_LEGACY_ID_LIMIT marks where those serial ids end and must be
+set above the highest of them before sharding is enabled, or ids past it are decoded as
+buckets; `rebalance_user_shards` refuses to run while a serial sequence has passed it.
+A user keeps the bucket of the email it was registered with. After changing USER_SHARDS
+run `manage.py rebalance_user_shards`.
+"""
+import contextvars
+import hashlib
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from apps.core.cache import CacheUnavailable
+
+logger = logging.getLogger('apps.users')
+
+BUCKET_BITS = 10
+BUCKET_COUNT = 1 << BUCKET_BITS
+SEQUENCE_BITS = 13
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+ID_EPOCH = 1704067200
+
+_sequence = random.getrandbits(SEQUENCE_BITS)
+_sequence_lock = threading.Lock()
+_pinned_user = contextvars.ContextVar('pinned_user', default=None)
+
+def enabled():
+    return settings.USER_SHARDING_ENABLED
+
+def shards():
+    return settings.USER_SHARDS
+
+def normalize_email(email):
+    return email.strip().lower()
+
+def bucket_for_email(email):
+    digest = hashlib.blake2b(normalize_email(email).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % BUCKET_COUNT
+
+def bucket_for_id(user_id):
+    return (int(user_id) >> SEQUENCE_BITS) & (BUCKET_COUNT - 1)
+
+def is_legacy_id(user_id):
+    return int(user_id) < settings.USER_LEGACY_ID_LIMIT
+
+def last_serial_id(using):
+    """
+    The last id the user table's serial sequence issued on `using`, or None where it cannot be read
+    """
+    from .models import User
+
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_sequence_last_value(pg_get_serial_sequence(%s, 'id'))", [User._meta.db_table])
+        return cursor.fetchone()[0]
+
+def shard_for_bucket(bucket):
+    aliases = shards()
+    return aliases[bucket * len(aliases) // BUCKET_COUNT]
+
+def shard_for_email(email):
+    return shard_for_bucket(bucket_for_email(email))
+
+def generate_id(email):
+    """
+    Issue an id that encodes the email's bucket. Processes pick their sequence start at
+    random, so a collision is unlikely but possible and callers retry on one.
+    """
+    global _sequence
+    with _sequence_lock:
+        _sequence = (_sequence + 1) & SEQUENCE_MASK
+        sequence = _sequence
+    elapsed = int(time.time()) - ID_EPOCH
+    return (elapsed << (BUCKET_BITS + SEQUENCE_BITS)) | (bucket_for_email(email) << SEQUENCE_BITS) | sequence
+
+def shard_for_id(user_id):
+    """
+    Return the alias holding a user id, probing the shards once for legacy ids. Raises
+    User.DoesNotExist for a legacy id found on more than one shard: those rows are different
+    users, and guessing one would hand a token for one of them to the other.
+    """
+    if not is_legacy_id(user_id):
+        return shard_for_bucket(bucket_for_id(user_id))
+
+    key = f"user_shard_{user_id}"
+    try:
+        alias = cache.get(key)
+    except CacheUnavailable:
+        alias = None
+    if alias in shards():
+        return alias
+
+    from .models import User
+    found = [alias for alias in shards() if User.objects.using(alias).filter(id=user_id).exists()]
+    if len(found) > 1:
+        logger.error(f"User id {user_id} exists on shards {', '.join(found)}; renumber all but one before it can be used")
+        raise User.DoesNotExist(f"User id {user_id} is ambiguous across shards")
+    if not found:
+        return shards()[0]
+    try:
+        cache.set(key, found[0], timeout=3600)
+    except CacheUnavailable:
+        pass
+    return found[0]
+
+def home_shard(user_id, email):
+    """
+    The shard a user should live on: the bucket in its id, or its email's bucket for legacy ids
+    """
+    if is_legacy_id(user_id):
+        return shard_for_email(email)
+    return shard_for_bucket(bucket_for_id(user_id))
+
+@contextmanager
+def pin_user(user_id):
+    """
+    Route rows that belong to a user but carry no routable lookup, such as simplejwt's
+    token blacklist tables, to that user's shard for the duration of the block
+    """
+    token = _pinned_user.set(user_id)
+    try:
+        yield
+    finally:
+        _pinned_user.reset(token)
+
+ID_LOOKUPS = ('id', 'id__exact', 'pk', 'pk__exact')
+EMAIL_LOOKUPS = ('email', 'email__exact', 'email__iexact', 'email__lower')
+
+def shard_for_lookup(lookups, id_lookups=ID_LOOKUPS, email_lookups=EMAIL_LOOKUPS):
+    """
+    Pick the shard for a filter(), get() or create() call from its keyword lookups, or None if it cannot be routed
+    """
+    for lookup in id_lookups:
+        value = lookups.get(lookup)
+        if value is None:
+            continue
+        if hasattr(value, '_state'):
+            return value._state.db or shard_for_id(value.pk)
+        return shard_for_id(value)
+    for lookup in email_lookups:
+        value = lookups.get(lookup)
+        if value:
+            return shard_for_email(value)
+    return None
+
+def shard_for_instance(instance):
+    from .models import ArchivedUser, Profile, User
+
+    if instance._state.db:
+        return instance._state.db
+    if isinstance(instance, ArchivedUser):
+        return home_shard(instance.id, instance.email)
+    if isinstance(instance, User):
+        if instance.pk:
+            return shard_for_id(instance.pk)
+        if instance.email:
+            return shard_for_email(instance.email)
+    if isinstance(instance, Profile) and instance.user_id:
+        user = instance._state.fields_cache.get('user')
+        if user is not None and user._state.db:
+            return user._state.db
+        return shard_for_id(instance.user_id)
+    return None
+
+class UserShardRouter:
+    """
+    Route users and profiles to their shard when USER_SHARDING_ENABLED is set
+    """
+    sharded_models = {'users.user', 'users.profile', 'users.archiveduser'}
+    pinned_models = {'token_blacklist.outstandingtoken', 'token_blacklist.blacklistedtoken'}
+
+    def _sharded(self, model):
+        return enabled() and model._meta.label_lower in self.sharded_models
+
+    def db_for_read(self, model, **hints):
+        if not enabled():
+            return None
+        instance = hints.get('instance')
+        if model._meta.label_lower in self.pinned_models:
+            if instance is not None and instance._state.db:
+                return instance._state.db
+            user_id = _pinned_user.get()
+            return shard_for_id(user_id) if user_id is not None else None
+        if not self._sharded(model):
+            return None
+        return shard_for_instance(instance) if instance is not None else None
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_read(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        models = self.sharded_models | self.pinned_models
+        if enabled() and {obj1._meta.label_lower, obj2._meta.label_lower} <= models:
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -1,6 +1,15 @@
-from django.db.models.signals import post_save
+import logging
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
-from . import models
+from apps.core.cache import CacheUnavailable
+from . import authorization, events, models, vendors
+
+logger = logging.getLogger('apps.users')
+
+# ModelBackend's per-instance permission caches
+PERMISSION_CACHES = ('_perm_cache', '_user_perm_cache', '_group_perm_cache')
 
 @receiver(post_save, sender=models.User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -9,3 +18,107 @@ def create_user_profile(sender, instance, created, **kwargs):
     """
     if created:
         models.Profile.objects.create(user=instance)
+
+@receiver(post_save, sender=models.User)
+def bump_permissions_version(sender, instance, created, raw=False, **kwargs):
+    """
+    Signal to invalidate compiled permissions when the role or staff flags change
+    """
+    if created and not raw:
+        # A new user has no groups or permissions yet: prime ModelBackend's caches so
+        # issuing its first token does not query for them
+        for cache_attr in PERMISSION_CACHES:
+            setattr(instance, cache_attr, set())
+    loaded = getattr(instance, '_loaded_state', {})
+    if created or raw or not loaded:
+        return
+    if any(field in loaded and loaded[field] != getattr(instance, field) for field in models.User.TRACKED_FIELDS):
+        authorization.bump_version([instance.pk])
+        instance.permissions_version += 1
+
+@receiver(post_save, sender=models.User)
+def invalidate_vendor_directory(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Signal to drop the cached vendor directory when a vendor changes or a user becomes or stops being one.
+    Connected before publish_user_events, which resets the loaded state it compares against.
+    """
+    if not raw and vendors.is_listed_change(instance, created, update_fields):
+        vendors.publish_new_version()
+
+@receiver(post_delete, sender=models.User)
+def remove_deleted_vendor(sender, instance, **kwargs):
+    """
+    Signal to drop the cached vendor directory when a vendor is deleted or archived
+    """
+    if instance.role == models.User.UserRoleChoice.VENDOR:
+        vendors.publish_new_version()
+
+@receiver(post_save, sender=models.User)
+def publish_user_events(sender, instance, created, raw=False, **kwargs):
+    """
+    Signal to record user lifecycle events in the outbox
+    """
+    if raw:
+        return
+
+    if created:
+        events.user_registered(instance)
+    else:
+        loaded = getattr(instance, '_loaded_state', {})
+        if 'role' in loaded and loaded['role'] != instance.role:
+            events.publish(events.ROLE_CHANGED, instance, old_role=loaded['role'], new_role=instance.role)
+        if loaded.get('is_active') and not instance.is_active:
+            events.publish(events.USER_DEACTIVATED, instance, email=instance.email)
+
+    instance._loaded_state = {field: getattr(instance, field) for field in models.User.TRACKED_FIELDS}
+
+INVALIDATING_ACTIONS = ('post_add', 'post_remove', 'post_clear')
+
+@receiver(m2m_changed, sender=models.User.groups.through)
+@receiver(m2m_changed, sender=models.User.user_permissions.through)
+def user_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Signal to invalidate compiled permissions when a user's groups or direct permissions change
+    """
+    if not reverse:
+        if action in INVALIDATING_ACTIONS:
+            authorization.bump_version([instance.pk])
+            for cache_attr in PERMISSION_CACHES:
+                instance.__dict__.pop(cache_attr, None)
+    elif action == 'pre_clear':
+        # The group or permission is being detached from every user, collect them before they are gone
+        authorization.bump_version(list(instance.user_set.values_list('id', flat=True)))
+    elif action in ('post_add', 'post_remove'):
+        authorization.bump_version(pk_set or [])
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Signal to invalidate compiled permissions for every member of a group whose permissions change
+    """
+    if not reverse:
+        if action in INVALIDATING_ACTIONS:
+            authorization.bump_version(list(instance.user_set.values_list('id', flat=True)))
+        return
+
+    if action == 'pre_clear':
+        groups = instance.group_set.all()
+    elif action in ('post_add', 'post_remove'):
+        groups = Group.objects.filter(pk__in=pk_set or [])
+    else:
+        return
+    authorization.bump_version(list(models.User.objects.filter(groups__in=groups).values_list('id', flat=True).distinct()))
+
+@receiver(post_save, sender=models.User)
+@receiver(post_save, sender=models.Profile)
+def invalidate_user_cache(sender, instance, created, **kwargs):
+    """
+    Signal to drop the cached user representation after the user or profile changes
+    """
+    if created:
+        return
+    user_id = instance.user_id if sender is models.Profile else instance.pk
+    try:
+        cache.delete(f"user_{user_id}")
+    except CacheUnavailable as cache_error:
+        logger.warning(f"Cache unavailable invalidating user {user_id}: {cache_error}")
@@ -0,0 +1,112 @@
+from io import StringIO
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from apps.authentication.tokens import RefreshToken
+from apps.core import querybudget
+from . import archive, models, sharding
+
+PASSWORD = 'Zx9!kq2Lmn'
+PROFILE = {'first_name': 'Olena', 'last_name': 'Koval', 'city': 'Kyiv', 'country': 'Ukraine', 'date_birth': '1990-01-01'}
+
+@override_settings(
+    CACHES={**settings.CACHES, 'redis': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+@mock.patch('apps.users.utils.gmail_utils._send', return_value=True)
+class QueryBudgetTests(APITestCase):
+    """
+    Each hot view stays within its query budget. The budgets are repeated here so that
+    raising one is a visible change to this file as well as to the view.
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = models.User.objects.create_user('budget@example.com', 'budget', PASSWORD)
+        self.refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.refresh.access_token}")
+
+    def assertWithinBudget(self, budget, method, url, data=None):
+        with querybudget.max_queries(budget):
+            if method == 'get':
+                response = self.client.get(url, data)
+            else:
+                response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 400, response.content)
+        return response
+
+    def test_register(self, send):
+        self.client.credentials()
+        cache.set('verified_new@example.com', True)
+        response = self.assertWithinBudget(7, 'post', '/api/users/register/', {
+            'email': 'new@example.com', 'username': 'newuser', 'password': PASSWORD, 'password_confirm': PASSWORD,
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_login(self, send):
+        self.client.credentials()
+        self.assertWithinBudget(5, 'post', '/api/authentication/login/', {'email': 'budget@example.com', 'password': PASSWORD})
+
+    def test_me(self, send):
+        self.assertWithinBudget(2, 'get', '/api/users/users/me/')
+
+    def test_complete_profile(self, send):
+        self.assertWithinBudget(5, 'post', '/api/users/complete-profile/', PROFILE)
+        self.assertWithinBudget(5, 'post', '/api/users/complete-profile/', {**PROFILE, 'last_name': 'Kovalenko'})
+        self.assertWithinBudget(2, 'get', '/api/users/complete-profile/')
+
+    def test_profile_status(self, send):
+        self.assertWithinBudget(2, 'get', '/api/users/profile-status/')
+
+    def test_change_password(self, send):
+        self.assertWithinBudget(2, 'post', '/api/users/change-password/', {
+            'old_password': PASSWORD, 'new_password': 'Qw8!zr5Tpv', 'confirm_new_password': 'Qw8!zr5Tpv',
+        })
+
+    def test_logout(self, send):
+        self.assertWithinBudget(5, 'post', '/api/authentication/logout/', {'refresh': str(self.refresh)})
+
+class ArchiveTests(TestCase):
+    """
+    Archiving moves a user out of the hot tables, refresh tokens included
+    """
+    def test_archive_deletes_tokens(self):
+        user = models.User.objects.create_user('dormant@example.com', 'dormant', PASSWORD)
+        RefreshToken.for_user(user)
+        RefreshToken.for_user(user).blacklist()
+
+        moved = archive.archive_batch(models.User.objects.filter(id=user.id), 'default', 10)
+
+        self.assertEqual(moved, 1)
+        self.assertTrue(models.ArchivedUser.objects.filter(id=user.id).exists())
+        self.assertFalse(OutstandingToken.objects.exists())
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+OTHER_DATABASE = next((alias for alias in settings.DATABASES if alias != 'default'), None)
+
+@skipUnless(OTHER_DATABASE, "needs a second database to shard across")
+class RebalanceTests(TestCase):
+    """
+    Rebalancing moves everything token checks read along with the user
+    """
+    databases = '__all__'
+
+    def test_blacklisted_token_stays_revoked(self):
+        # Buckets in the upper half map to the second shard once there are two
+        email = next(f"moved{n}@example.com" for n in range(100) if sharding.bucket_for_email(f"moved{n}@example.com") >= sharding.BUCKET_COUNT // 2)
+        with override_settings(USER_SHARDING_ENABLED=True, USER_SHARDS=['default']):
+            user = models.User.objects.create_user(email, 'moved', PASSWORD)
+            refresh = RefreshToken.for_user(user)
+            refresh.blacklist()
+
+        with override_settings(USER_SHARDING_ENABLED=True, USER_SHARDS=['default', OTHER_DATABASE]):
+            call_command('rebalance_user_shards', stdout=StringIO())
+            self.assertTrue(models.User.objects.using(OTHER_DATABASE).filter(id=user.id).exists())
+            self.assertFalse(OutstandingToken.objects.using('default').exists())
+            with self.assertRaises(TokenError):
+                RefreshToken(str(refresh))
@@ -1,4 +1,28 @@
-from rest_framework.throttling import UserRateThrottle
+import logging
+from rest_framework import throttling
+from rest_framework.exceptions import Throttled
+from apps.core.cache import CacheUnavailable
+
+logger = logging.getLogger('apps.users')
+
+class UserRateThrottle(throttling.UserRateThrottle):
+    """
+    Request histories are strong cache keys, shared by every process: an in-process copy
+    would let each worker grant the full rate. While the cache is down the request is let
+    through, so an outage of Redis does not take the API down with it.
+    """
+    fail_open = True
+
+    def allow_request(self, request, view):
+        try:
+            return super().allow_request(request, view)
+        except CacheUnavailable as cache_error:
+            if self.fail_open:
+                logger.warning(f"Cache unavailable, {self.scope} throttle not applied: {cache_error}")
+                return True
+            raise Throttled(wait=cache_error.retry_after)
 
 class OTPThrottle(UserRateThrottle):
+    # Refuse rather than send unthrottled OTP emails while the cache is down
+    fail_open = False
     rate = '3/minute'
@@ -13,6 +13,11 @@ urlpatterns = [
     path('register/', views.UserRegisterView.as_view(), name='register'),
     path('complete-profile/', views.CompleteProfileView.as_view(), name='complete-profile'),
     path('profile-status/', views.CheckProfileStatusView.as_view(), name='profile-status'),
+    path('events/', views.ChangeFeedView.as_view(), name='events'),
+    path('bulk-lookup/', views.BulkUserLookupView.as_view(), name='bulk-lookup'),
+    path('funnel/', views.SignupFunnelView.as_view(), name='signup-funnel'),
+    path('audit/', views.AuthAuditView.as_view(), name='auth-audit'),
+    path('vendors/', views.VendorDirectoryView.as_view(), name='vendor-directory'),
     path('change-password/', views.ChangePasswordViewSet.as_view({'post': 'change_password'})),
     path('', include(router.urls)),
 ]
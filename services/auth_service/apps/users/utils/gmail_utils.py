@@ -2,71 +2,71 @@ from django.core.mail import send_mail
 from django.conf import settings
 from django.core.mail import EmailMessage
 from django.utils import timezone
+from apps.core.admission import Overloaded
+from apps.core.mail import email_limiter
+import contextvars
 import logging
 import threading
 from typing import Optional
 
 logger = logging.getLogger('apps.users')
 
+def _send(subject: str, message: str, recipient_list: list, from_email: Optional[str] = None) -> bool:
+    if not settings.EMAIL_HOST_USER or not settings.EMAIL_HOST_PASSWORD:
+        logger.error("Email credentials not configured")
+        return False
+
+    send_mail(
+        subject=subject,
+        message=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipient_list=recipient_list,
+        fail_silently=False,
+    )
+    return True
+
 def _send_email_async(subject: str, message: str, recipient_list: list, from_email: Optional[str] = None):
     def send():
         try:
-            if not from_email:
-                from_email = settings.DEFAULT_FROM_EMAIL
-            
-            if not settings.EMAIL_HOST_USER or not settings.EMAIL_HOST_PASSWORD:
-                logger.error("Email credentials not configured")
-                return False
-                
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=from_email,
-                recipient_list=recipient_list,
-                fail_silently=False,
-            )
-            logger.info(f"Email sent successfully to {recipient_list}")
-            return True
+            with email_limiter.slot():
+                sent = _send(subject, message, recipient_list, from_email)
+            if sent:
+                logger.info(f"Email sent successfully to {recipient_list}")
+            return sent
         except Exception as e:
             logger.error(f"Failed to send email to {recipient_list}: {str(e)}")
             return False
-    
-    thread = threading.Thread(target=send)
+
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(send,))
     thread.daemon = True
     thread.start()
     return thread
 
 def send_otp_email(email: str, otp: str, async_send: bool = True) -> bool:
-
+    """
+    Send an OTP code. The synchronous path does not take an email_limiter slot itself:
+    OTPRequestView holds one around the whole issuance.
+    """
     try:
         subject = "Your OTP Code"
         message = f"Your OTP code is: {otp}\n\nThis code will expire in 5 minutes.\n\nIf you didn't request this code, please ignore this email."
-        
+
         if async_send:
             _send_email_async(subject, message, [email])
             logger.info(f"OTP email queued for sending to {email}")
             return True
         else:
-            if not settings.EMAIL_HOST_USER or not settings.EMAIL_HOST_PASSWORD:
-                logger.error("Email credentials not configured")
+            if not _send(subject, message, [email]):
                 return False
-                
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[email],
-                fail_silently=False,
-            )
             logger.info(f"OTP email sent successfully to {email}")
             return True
-            
+
     except Exception as e:
         logger.error(f"Failed to send OTP email to {email}: {str(e)}")
         return False
 
 def send_welcome_email(email: str, username: str, async_send: bool = True) -> bool:
-   
+
     try:
         subject = "Welcome to our platform! 🎉"
         message = f"""Hello {username}!
@@ -84,27 +84,22 @@ def send_welcome_email(email: str, username: str, async_send: bool = True) -> bo
         Best regards,
         The Team
         """
-        
+
         if async_send:
             _send_email_async(subject, message, [email])
             logger.info(f"Welcome email queued for sending to {email}")
             return True
         else:
-            if not getattr(settings, 'EMAIL_HOST_USER', None) or not getattr(settings, 'EMAIL_HOST_PASSWORD', None):
-                logger.error("Email credentials not configured")
-                return False
-                
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com'),
-                recipient_list=[email],
-                fail_silently=False,
-                timeout=getattr(settings, 'EMAIL_TIMEOUT', 30)
-            )
+            # Welcome emails are not worth a wait: skip them while sends are backed up
+            with email_limiter.slot(wait=0):
+                if not _send(subject, message, [email]):
+                    return False
             logger.info(f"Welcome email sent successfully to {email}")
             return True
-            
+
+    except Overloaded as e:
+        logger.warning(f"Skipped welcome email to {email}: {e}")
+        return False
     except Exception as e:
         logger.error(f"Failed to send welcome email to {email}: {str(e)}")
         return False
@@ -0,0 +1,139 @@
+"""
+Public vendor directory.
+
+Pages list active vendors by lower(username), then id, with keyset pagination on that
+pair, optionally narrowed to a country and a name prefix. Every query walks the partial
+user_vendor_directory_idx, which holds active vendors only, so its cost depends on the
+number of vendors rather than on the size of auth_user. The key is compared by code point
+(see models.CodePointOrder) so that pages from several shards merge in Python in the same
+order the databases sorted them.
+
+First pages, without a cursor or a name prefix, are cached under a directory version,
+so the cache holds at most one page per country and limit: anonymous callers cannot
+fill it with arbitrary cursors and prefixes, and those pages are single index range
+scans anyway. Saving a vendor, or a user becoming or ceasing to be one, publishes a new
+version (see signals.py), which orphans every cached page at once. Profile edits such as
+a new country or avatar are not tracked and show up within
+VENDOR_DIRECTORY_CACHE_TIMEOUT seconds.
+"""
+import heapq
+import logging
+import sys
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.db.models.functions import Lower
+from apps.core.cache import CacheUnavailable
+from . import models, sharding
+
+logger = logging.getLogger('apps.users')
+
+VERSION_KEY = 'vendor_directory:version'
+# Saves of any of these change what a vendor's directory entry shows
+LISTED_FIELDS = frozenset(('username', 'first_name', 'last_name', 'role', 'is_active'))
+
+def publish_new_version():
+    try:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+    except CacheUnavailable as cache_error:
+        logger.warning(f"Cache unavailable invalidating the vendor directory: {cache_error}")
+
+def is_listed_change(user, created, update_fields):
+    """
+    Whether saving `user` may change the directory
+    """
+    Role = models.User.UserRoleChoice
+    loaded = getattr(user, '_loaded_state', {})
+    if user.role != Role.VENDOR and loaded.get('role') != Role.VENDOR:
+        return False
+    return created or update_fields is None or not LISTED_FIELDS.isdisjoint(update_fields)
+
+def parse_cursor(cursor):
+    """
+    Split a next_cursor into (name key, id), raising ValueError if it is malformed
+    """
+    name_key, _, user_id = cursor.rpartition(',')
+    if not name_key:
+        raise ValueError(cursor)
+    return name_key, int(user_id)
+
+def prefix_range(prefix):
+    """
+    The [start, end) range of keys starting with `prefix` in code point order. Unlike
+    LIKE 'prefix%', a range is served by the index under any database collation.
+    """
+    last = ord(prefix[-1])
+    if last == sys.maxunicode:
+        return prefix, None
+    return prefix, prefix[:-1] + chr(last + 1)
+
+def _page(using, country, prefix, after, limit):
+    name_key = models.CodePointOrder(Lower('username'))
+    queryset = models.User.objects.using(using).filter(
+        role=models.User.UserRoleChoice.VENDOR, is_active=True,
+    ).annotate(name_key=name_key)
+    if country:
+        queryset = queryset.filter(profile__country_ref=country)
+    if prefix:
+        start, end = prefix_range(prefix)
+        queryset = queryset.filter(name_key__gte=start)
+        if end is not None:
+            queryset = queryset.filter(name_key__lt=end)
+    if after is not None:
+        queryset = queryset.filter(Q(name_key__gt=after[0]) | Q(name_key=after[0], id__gt=after[1]))
+    return list(queryset.order_by('name_key', 'id').values(
+        'name_key', 'id', 'username', 'first_name', 'last_name',
+        'profile__country_ref', 'profile__city', 'profile__avatar',
+    )[:limit])
+
+def _entry(row):
+    return {
+        'id': row['id'],
+        'username': row['username'],
+        'first_name': row['first_name'],
+        'last_name': row['last_name'],
+        'country': row['profile__country_ref'],
+        'city': row['profile__city'],
+        'avatar': default_storage.url(row['profile__avatar']) if row['profile__avatar'] else None,
+    }
+
+def load_page(country=None, prefix='', after=None, limit=20):
+    """
+    One directory page straight from the databases, after the (name key, id) pair
+    `after`: one query per shard
+    """
+    databases = sharding.shards() if sharding.enabled() else ['default']
+    pages = [_page(using, country, prefix, after, limit) for using in databases]
+    rows = list(heapq.merge(*pages, key=lambda row: (row['name_key'], row['id'])))[:limit]
+    has_more = len(rows) == limit
+    return {
+        'vendors': [_entry(row) for row in rows],
+        'next_cursor': f"{rows[-1]['name_key']},{rows[-1]['id']}" if has_more else None,
+        'has_more': has_more,
+    }
+
+def get_page(country=None, prefix='', cursor=None, limit=20):
+    """
+    A directory page, first pages from the cache when the directory has not changed since
+    they were stored. `country` must be a known country code; `prefix` is matched against
+    the lowercased username. Raises ValueError for a malformed cursor.
+    """
+    prefix = prefix.lower()
+    after = parse_cursor(cursor) if cursor else None
+    if after is not None or prefix:
+        return load_page(country, prefix, after, limit)
+    try:
+        version = cache.get_or_set(VERSION_KEY, time.time_ns, timeout=None)
+        key = f"vendor_directory:{version}:{country or ''}:{limit}"
+        page = cache.get(key)
+    except CacheUnavailable:
+        return load_page(country, prefix, after, limit)
+    if page is None:
+        page = load_page(country, prefix, after, limit)
+        try:
+            cache.set(key, page, timeout=settings.VENDOR_DIRECTORY_CACHE_TIMEOUT)
+        except CacheUnavailable as cache_error:
+            logger.warning(f"Cache unavailable storing a vendor directory page: {cache_error}")
+    return page
@@ -3,16 +3,63 @@ from rest_framework.viewsets import GenericViewSet
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework import permissions
-from rest_framework_simplejwt.tokens import RefreshToken
+from apps.authentication.permissions import IsAdminRole
+from apps.authentication.tokens import RefreshToken
 from rest_framework.views import APIView
-from django.db import transaction
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.core.cache import cache
-from . import models, serializers, throttling
+from apps.core.admission import Overloaded
+from apps.core.cache import CacheUnavailable
+from apps.core.idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
+from apps.core import querybudget
+from apps.core.mail import email_limiter
+from apps.geo import index as geo_index
+from . import archive, audit, events, funnel, managers, models, outbox, permissions as user_permissions, serializers, sharding, throttling, vendors
 from .utils import otp_utils, gmail_utils
+import ipaddress
 import logging
+from datetime import timedelta
 
 logger = logging.getLogger('apps.users')
 
+def cache_unavailable_response(error):
+    return Response(
+        {"error": "Service temporarily unavailable, please try again"},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': str(error.retry_after)},
+    )
+
+def fresh_tokens(data, request):
+    """
+    New tokens for an idempotent replay of a registration, whose stored response holds none.
+    Only issued while the replayed password is still the user's, so an old request body
+    stops granting access once the password changes.
+    """
+    user = models.User.objects.filter(id=data['user']['id'], is_active=True).first()
+    if user is None or not user.check_password(request.data.get('password')):
+        return None
+    refresh = RefreshToken.for_user(user)
+    return {'refresh': str(refresh), 'access': str(refresh.access_token)}
+
+def replayed_next_step(data, request):
+    # A replay without tokens has to log in first
+    return 'complete_profile' if 'tokens' in data else 'login'
+
+def profile_is_complete(user, profile):
+    return all([
+        user.first_name,
+        user.last_name,
+        profile.city,
+        profile.country,
+        profile.date_birth
+    ])
+
 class OTPRequestView(APIView):
     """
     Request OTP code
@@ -20,6 +67,7 @@ class OTPRequestView(APIView):
     permission_classes = [permissions.AllowAny]
     throttle_classes = [throttling.OTPThrottle]  
     
+    @querybudget.query_budget(1)
     def post(self, request):
         try:
             serializer = serializers.EmailSerializer(data=request.data)
@@ -29,20 +77,40 @@ class OTPRequestView(APIView):
             otp = otp_utils.generate_otp()
 
             try:
-                cache_key = f"otp_attempts:{email.lower()}"
+                cache_key = f"otp_attempts:{email}"
                 attempts = cache.get(cache_key, 0)
                 if attempts >= 3:
                     return Response({"error": "Too many attempts"}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+            except CacheUnavailable as cache_error:
+                logger.warning(f"Cache unavailable during OTP request: {cache_error}")
+                return cache_unavailable_response(cache_error)
+
+            archive.restore_user(email)
+
+            # Admit before issuing, so a shed request does not use up an attempt
+            try:
+                with email_limiter.slot():
+                    try:
+                        cache.set(cache_key, attempts + 1, timeout=300)
+                        cache.set(f"otp_{email}", otp, timeout=300)
+                    except CacheUnavailable as cache_error:
+                        logger.warning(f"Cache unavailable during OTP request: {cache_error}")
+                        return cache_unavailable_response(cache_error)
+
+                    email_sent = gmail_utils.send_otp_email(email, otp, async_send=False)
+            except Overloaded as overload:
+                logger.warning(f"OTP request shed: {overload}")
+                return Response(
+                    {"error": "Email service is busy, please try again"},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': str(overload.retry_after)},
+                )
 
-                cache.set(cache_key, attempts + 1, timeout=300)
-                cache.set(f"otp_{email}", otp, timeout=300)
-            except Exception as cache_error:
-                logger.warning(f"Cache error: {cache_error}")
-            
-            email_sent = gmail_utils.send_otp_email(email, otp, async_send=False)
             if not email_sent:
                 return Response({"error": "Failed to send OTP email"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
+
+            funnel.record(funnel.Step.OTP_REQUESTED)
+            audit.record(audit.Event.OTP_REQUESTED, request, email=email)
             return Response({"message": "OTP sent"}, status=status.HTTP_200_OK)
         
         except serializers.ValidationError as e:
@@ -57,6 +125,7 @@ class OTPVerifyView(APIView):
     """
     permission_classes = [permissions.AllowAny]
     
+    @querybudget.query_budget(0)
     def post(self, request):
         try:
             serializer = serializers.OTPVerifySerializer(data=request.data)
@@ -69,17 +138,21 @@ class OTPVerifyView(APIView):
                 cached_otp = cache.get(f"otp_{email}")
                 
                 if not cached_otp:
+                    audit.record(audit.Event.OTP_FAILED, request, email=email, detail="expired")
                     return Response({"error": "OTP expired or not found"}, status=status.HTTP_404_NOT_FOUND)
 
                 if cached_otp != otp_code:
+                    audit.record(audit.Event.OTP_FAILED, request, email=email, detail="incorrect")
                     return Response({"error": "Incorrect OTP"}, status=status.HTTP_400_BAD_REQUEST)
                 
                 cache.set(f"verified_{email}", True, timeout=600)
                 cache.delete(f"otp_{email}")
-            except Exception as cache_error:
-                logger.warning(f"Cache error during OTP verification: {cache_error}")
-                return Response({"error": "Cache error, please try again"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            except CacheUnavailable as cache_error:
+                logger.warning(f"Cache unavailable during OTP verification: {cache_error}")
+                return cache_unavailable_response(cache_error)
 
+            funnel.record(funnel.Step.OTP_VERIFIED)
+            audit.record(audit.Event.OTP_VERIFIED, request, email=email)
             return Response({"message": "Email verified successfully"}, status=status.HTTP_200_OK)
             
         except serializers.ValidationError as e:
@@ -94,43 +167,49 @@ class UserRegisterView(APIView):
     """
     permission_classes = [permissions.AllowAny]
     
+    @querybudget.query_budget(7)
+    @extend_schema(parameters=[IDEMPOTENCY_KEY_PARAMETER])
+    @idempotent('register', reissue={'tokens': fresh_tokens, 'next_step': replayed_next_step})
     @transaction.atomic
     def post(self, request):
         serializer = serializers.UserRegistrationSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        email = request.data.get('email')
-        username = request.data.get('username')
-        password = request.data.get('password')
+        email = serializer.validated_data['email']
+        username = serializer.validated_data['username']
+        password = serializer.validated_data['password']
         
         try:
             verified = cache.get(f"verified_{email}")
             if not verified:
                 return Response({"error": "Please verify your email first"}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as cache_error:
-            logger.warning(f"Cache error during registration: {cache_error}")
-            return Response({"error": "Cache error, please try again"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except CacheUnavailable as cache_error:
+            logger.warning(f"Cache unavailable during registration: {cache_error}")
+            return cache_unavailable_response(cache_error)
         
-        if models.User.objects.filter(email=email).exists():
+        # The serializer already checked the email; the unique index catches concurrent sign-ups
+        try:
+            with transaction.atomic():
+                user = models.User.objects.create_user(
+                    email=email,
+                    username=username,  
+                    password=password
+                )
+        except IntegrityError:
             return Response({"error": "Email already exists"}, status=status.HTTP_400_BAD_REQUEST)
         
-        user = models.User.objects.create_user(
-            email=email,
-            username=username,  
-            password=password
-        )
-        
         try:
             cache.delete(f"verified_{email}")
-        except Exception as cache_error:
-            logger.warning(f"Cache error clearing verification: {cache_error}")
+        except CacheUnavailable as cache_error:
+            logger.warning(f"Cache unavailable clearing verification: {cache_error}")
         
-        gmail_utils.send_welcome_email(email, username, async_send=False)
+        transaction.on_commit(lambda: gmail_utils.send_welcome_email(email, username, async_send=False))
+        transaction.on_commit(lambda: funnel.record(funnel.Step.REGISTERED))
         
         refresh = RefreshToken.for_user(user)
         return Response({
             'message': 'User registered successfully',
-            'user': serializers.UserSerializer(user).data,
+            'user': serializers.user_representation(user),
             'tokens': {
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -146,29 +225,40 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = models.User.objects.all()
     serializer_class = serializers.UserSerializer
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 3
 
     def get_queryset(self):
         return models.User.objects.select_related('profile').filter(id=self.request.user.id)
         
+    # The email and username checks, then the user and profile updates
+    @querybudget.query_budget(8)
     def update(self, request, *args, **kwargs):
         if request.user.id != int(kwargs['pk']):
             return Response({"error": "You can only update your own account"}, status=status.HTTP_403_FORBIDDEN)
         return super().update(request, *args, **kwargs)
 
+    @querybudget.query_budget(8)
+    def partial_update(self, request, *args, **kwargs):
+        return super().partial_update(request, *args, **kwargs)
+
+    @querybudget.query_budget(9)
+    def destroy(self, request, *args, **kwargs):
+        # One statement per table referencing auth_user
+        return super().destroy(request, *args, **kwargs)
+
+    @querybudget.query_budget(2)
     @action(detail=False, methods=['get'], url_path='me')
     def me(self, request):
         try:
             key = f"user_{request.user.id}"
             data = cache.get(key)
             if not data:
-                serializer = self.get_serializer(request.user)
-                data = serializer.data
+                data = serializers.user_representation(request.user)
                 cache.set(key, data, timeout=60)
-            return Response(data)
+            return Response(serializers.with_absolute_urls(data, request))
         except Exception as cache_error:
             logger.warning(f"Cache error in me view: {cache_error}")
-            serializer = self.get_serializer(request.user)
-            return Response(serializer.data)
+            return Response(serializers.user_representation(request.user, request))
 
 class CompleteProfileView(APIView):
     """
@@ -176,43 +266,52 @@ class CompleteProfileView(APIView):
     """
     permission_classes = [permissions.IsAuthenticated]
 
+    @querybudget.query_budget(5)
+    @extend_schema(parameters=[IDEMPOTENCY_KEY_PARAMETER])
+    @idempotent('complete_profile')
     def post(self, request):
-        user = models.User.objects.select_related('profile').get(id=request.user.id)
-        profile = user.profile
+        # Profile, user and outbox event are on the user's database, which is a shard when sharding is enabled
+        with transaction.atomic(using=request.user._state.db):
+            return self.complete(request)
+
+    def complete(self, request):
+        # request.user was loaded by authentication, only the profile is still needed
+        user = request.user
+        profile = models.Profile.objects.get(user=user)
+        user.profile = profile
 
         serializer = serializers.CompleteProfileSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        was_complete = profile_is_complete(user, profile)
 
         user.first_name = serializer.validated_data['first_name']
         user.last_name = serializer.validated_data['last_name']
-        user.save()
+        user.save(update_fields=['first_name', 'last_name'])
 
-        for field in ['city', 'country', 'date_birth', 'avatar']:
-            if field in serializer.validated_data:
-                setattr(profile, field, serializer.validated_data[field])
-        profile.save()
+        fields = [field for field in ['city', 'country', 'date_birth', 'avatar'] if field in serializer.validated_data]
+        for field in fields:
+            setattr(profile, field, serializer.validated_data[field])
+        fields += geo_index.normalize_profile(profile)
+        profile.save(update_fields=set(fields))
+        events.profile_completed(user, profile)
+        if not was_complete and profile_is_complete(user, profile):
+            transaction.on_commit(lambda: funnel.record(funnel.Step.PROFILE_COMPLETED), using=user._state.db)
 
-        user.refresh_from_db()
         return Response({
             'message': 'Profile completed successfully',
-            'user': serializers.UserSerializer(user).data,
+            'user': serializers.user_representation(user),
             'profile_complete': True
         }, status=status.HTTP_200_OK)
     
+    @querybudget.query_budget(2)
     def get(self, request):
         user = models.User.objects.select_related('profile').get(id=request.user.id)
         profile = user.profile
-        is_complete = all([
-            user.first_name,
-            user.last_name,
-            profile.city,
-            profile.country,
-            profile.date_birth
-        ])
+        is_complete = profile_is_complete(user, profile)
         return Response({
             'profile_complete': is_complete,
-            'user': serializers.UserSerializer(user).data,
-            'profile': serializers.ProfileSerializer(profile).data if is_complete else None
+            'user': serializers.user_representation(user),
+            'profile': serializers.profile_representation(profile) if is_complete else None
         })
         
 class CheckProfileStatusView(APIView):
@@ -221,27 +320,22 @@ class CheckProfileStatusView(APIView):
     """
     permission_classes = [permissions.IsAuthenticated]
     
+    @querybudget.query_budget(2)
     def get(self, request):
         try:
             user = models.User.objects.select_related('profile').get(id=request.user.id)
             profile = user.profile
-            is_complete = all([
-                user.first_name,
-                user.last_name,
-                profile.city,
-                profile.country,
-                profile.date_birth
-            ])
+            is_complete = profile_is_complete(user, profile)
             
             return Response({
                 'profile_complete': is_complete,
-                'user': serializers.UserSerializer(request.user).data,
-                'profile': serializers.ProfileSerializer(profile).data if is_complete else None
+                'user': serializers.user_representation(user),
+                'profile': serializers.profile_representation(profile) if is_complete else None
             })
         except models.Profile.DoesNotExist:
             return Response({
                 'profile_complete': False,
-                'user': serializers.UserSerializer(request.user).data
+                'user': serializers.user_representation(user)
             })
 
 class ChangePasswordViewSet(GenericViewSet):
@@ -251,10 +345,244 @@ class ChangePasswordViewSet(GenericViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = serializers.ChangePasswordSerializer
     
+    @querybudget.query_budget(2)
+    @extend_schema(parameters=[IDEMPOTENCY_KEY_PARAMETER])
     @action(detail=False, methods=['post'], url_path='change-password')
+    @idempotent('change_password')
     def change_password(self, request):
         serializer = self.get_serializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        audit.record(audit.Event.PASSWORD_CHANGED, request, user=request.user)
         return Response({"detail": "Password changed successfully"}, status=status.HTTP_200_OK)
     
+
+class ChangeFeedView(APIView):
+    """
+    Cursor-based feed of user lifecycle events for other services
+    """
+    permission_classes = [user_permissions.IsInternalService]
+    throttle_classes = []
+
+    # Not budgeted: one query per shard
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('after', str, description="next_cursor of the previous page; omit to start from the beginning"),
+            OpenApiParameter('limit', int, description="Maximum number of events to return"),
+            OpenApiParameter('types', str, description="Comma-separated event types to include"),
+        ],
+        responses=serializers.OutboxEventSerializer(many=True),
+    )
+    def get(self, request):
+        try:
+            positions = outbox.parse_cursor(request.query_params.get('after'))
+            limit = max(1, min(int(request.query_params.get('limit', 100)), settings.OUTBOX_FEED_MAX_LIMIT))
+        except ValueError:
+            return Response({"error": "Invalid after cursor or limit"}, status=status.HTTP_400_BAD_REQUEST)
+
+        types = request.query_params.get('types')
+        feed, positions, has_more = outbox.read(positions, limit, types.split(',') if types else None)
+        return Response({
+            'events': serializers.OutboxEventSerializer(feed, many=True).data,
+            'next_cursor': outbox.format_cursor(positions),
+            'has_more': has_more,
+        })
+
+class SignupFunnelView(APIView):
+    """
+    Signup funnel totals and conversion for a range of UTC dates, read from hourly rollups
+    """
+    permission_classes = [IsAdminRole]
+    DEFAULT_DAYS = 30
+    MAX_DAYS = 366
+
+    @querybudget.query_budget(2)
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('start', OpenApiTypes.DATE, description=f"First day, defaults to {DEFAULT_DAYS - 1} days before end"),
+            OpenApiParameter('end', OpenApiTypes.DATE, description="Last day, inclusive, defaults to today"),
+        ],
+        responses=serializers.FunnelReportSerializer,
+    )
+    def get(self, request):
+        try:
+            end = parse_date(request.query_params.get('end', '')) or timezone.now().date()
+            start = parse_date(request.query_params.get('start', '')) or end - timedelta(days=self.DEFAULT_DAYS - 1)
+        except ValueError:
+            return Response({"error": "start and end must be valid dates"}, status=status.HTTP_400_BAD_REQUEST)
+        if start > end:
+            return Response({"error": "start must not be after end"}, status=status.HTTP_400_BAD_REQUEST)
+        if (end - start).days >= self.MAX_DAYS:
+            return Response({"error": f"The range can span at most {self.MAX_DAYS} days"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(serializers.FunnelReportSerializer(funnel.report(start, end)).data)
+
+class AuthAuditView(APIView):
+    """
+    Authentication audit events, newest first, filtered by user, email, IP and time range
+    """
+    permission_classes = [IsAdminRole]
+    DEFAULT_RANGE = timedelta(days=1)
+
+    @querybudget.query_budget(2)
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('user_id', int, description="Only events of this user"),
+            OpenApiParameter('email', str, description="Only events for this email, including failed logins"),
+            OpenApiParameter('ip', str, description="Only events from this client IP"),
+            OpenApiParameter('events', str, description="Comma-separated event types to include"),
+            OpenApiParameter('start', OpenApiTypes.DATETIME, description="Earliest event time, defaults to a day before end"),
+            OpenApiParameter('end', OpenApiTypes.DATETIME, description="Latest event time, exclusive, defaults to now"),
+            OpenApiParameter('cursor', str, description="next_cursor of the previous page"),
+            OpenApiParameter('limit', int, description="Maximum number of events to return"),
+        ],
+        responses=serializers.AuthAuditPageSerializer,
+    )
+    def get(self, request):
+        params = request.query_params
+        try:
+            end = parse_datetime(params['end']) if params.get('end') else timezone.now()
+            start = parse_datetime(params['start']) if params.get('start') else end - self.DEFAULT_RANGE
+            limit = max(1, min(int(params.get('limit', 100)), settings.AUDIT_QUERY_MAX_LIMIT))
+            user_id = int(params['user_id']) if params.get('user_id') else None
+            ip = str(ipaddress.ip_address(params['ip'])) if params.get('ip') else None
+            cursor = None
+            if params.get('cursor'):
+                cursor_time, cursor_id = params['cursor'].rsplit(',', 1)
+                cursor = (parse_datetime(cursor_time), int(cursor_id))
+            if start is None or end is None or (cursor is not None and cursor[0] is None):
+                raise ValueError
+        except ValueError:
+            return Response({"error": "Invalid start, end, cursor, limit, user_id or ip"}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(start) or timezone.is_naive(end):
+            return Response({"error": "start and end must include a UTC offset"}, status=status.HTTP_400_BAD_REQUEST)
+        if start >= end:
+            return Response({"error": "start must be before end"}, status=status.HTTP_400_BAD_REQUEST)
+        if end - start > timedelta(days=settings.AUDIT_QUERY_MAX_DAYS):
+            return Response({"error": f"The range can span at most {settings.AUDIT_QUERY_MAX_DAYS} days"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The bounded created_at range lets PostgreSQL skip partitions outside it
+        queryset = models.AuthAuditEvent.objects.filter(created_at__gte=start, created_at__lt=end)
+        if user_id is not None:
+            queryset = queryset.filter(user_id=user_id)
+        if params.get('email'):
+            queryset = queryset.filter(email=managers.canonical_email(params['email']))
+        if ip is not None:
+            queryset = queryset.filter(ip=ip)
+        if params.get('events'):
+            queryset = queryset.filter(event__in=params['events'].split(','))
+        if cursor is not None:
+            queryset = queryset.filter(Q(created_at__lt=cursor[0]) | Q(created_at=cursor[0], id__lt=cursor[1]))
+
+        page = list(queryset.order_by('-created_at', '-id')[:limit])
+        has_more = len(page) == limit
+        return Response(serializers.AuthAuditPageSerializer({
+            'events': page,
+            'next_cursor': f"{page[-1].created_at.isoformat()},{page[-1].id}" if has_more else None,
+            'has_more': has_more,
+        }).data)
+
+class VendorDirectoryView(APIView):
+    """
+    Active vendors ordered by username, optionally in one country or matching a name prefix
+    """
+    permission_classes = [permissions.AllowAny]
+
+    # Not budgeted: a cache miss runs one query per shard
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('country', str, description="ISO 3166-1 alpha-2 country code"),
+            OpenApiParameter('q', str, description="Username prefix, case-insensitive"),
+            OpenApiParameter('cursor', str, description="next_cursor of the previous page"),
+            OpenApiParameter('limit', int, description=f"Maximum number of vendors to return, at most {settings.VENDOR_DIRECTORY_MAX_LIMIT}"),
+        ],
+        responses=serializers.VendorDirectoryPageSerializer,
+    )
+    def get(self, request):
+        params = request.query_params
+        prefix = params.get('q', '').strip()
+        if len(prefix) > models.User._meta.get_field('username').max_length:
+            return Response({"error": "q is longer than any username"}, status=status.HTTP_400_BAD_REQUEST)
+        country = params.get('country', '').upper() or None
+        if country is not None and country not in geo_index.get_index().countries:
+            return Response({"error": "Unknown country code"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = max(1, min(int(params.get('limit', 20)), settings.VENDOR_DIRECTORY_MAX_LIMIT))
+            page = vendors.get_page(country, prefix, params.get('cursor') or None, limit)
+        except ValueError:
+            return Response({"error": "Invalid cursor or limit"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serializers.VendorDirectoryPageSerializer(page).data)
+
+class BulkUserLookupView(APIView):
+    """
+    Look up many users at once for other services
+    """
+    permission_classes = [user_permissions.IsInternalService]
+    throttle_classes = []
+
+    # Not budgeted: one query per shard holding a requested user
+    @extend_schema(request=serializers.BulkUserLookupSerializer)
+    def post(self, request):
+        serializer = serializers.BulkUserLookupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        emails = serializer.validated_data['emails']
+        fields = serializer.validated_data['fields']
+
+        found = {}
+        try:
+            cached = cache.get_many([f"user_{user_id}" for user_id in ids])
+        except CacheUnavailable as cache_error:
+            logger.warning(f"Cache unavailable during bulk lookup: {cache_error}")
+            cached = {}
+        for data in cached.values():
+            found[data['id']] = data
+
+        missing_ids = [user_id for user_id in ids if user_id not in found]
+        if missing_ids or emails:
+            fetched = {}
+            for using, (shard_ids, shard_emails) in self.by_database(missing_ids, emails).items():
+                users = models.User.objects.using(using).select_related('profile').filter(
+                    Q(id__in=shard_ids) | Q(email__lower__in=shard_emails)
+                )
+                for user in users:
+                    data = serializers.user_representation(user)
+                    found[user.id] = data
+                    fetched[f"user_{user.id}"] = data
+            if fetched:
+                try:
+                    cache.set_many(fetched, timeout=60)
+                except CacheUnavailable as cache_error:
+                    logger.warning(f"Cache unavailable storing bulk lookup: {cache_error}")
+
+        by_email = {data['email']: data for data in found.values()}
+        records = [self.compact(data, fields) for data in found.values()]
+        return Response({
+            'users': records,
+            'not_found': {
+                'ids': [user_id for user_id in ids if user_id not in found],
+                'emails': [email for email in emails if email not in by_email],
+            },
+        })
+
+    @staticmethod
+    def by_database(ids, emails):
+        """
+        {alias: (ids, emails) stored there}. A legacy id on several shards names different users and is left out.
+        """
+        if not sharding.enabled():
+            return {'default': (ids, emails)}
+        databases = {}
+        for user_id in ids:
+            try:
+                databases.setdefault(sharding.shard_for_id(user_id), ([], []))[0].append(user_id)
+            except models.User.DoesNotExist:
+                pass
+        for email in emails:
+            databases.setdefault(sharding.shard_for_email(email), ([], []))[1].append(email)
+        return databases
+
+    @staticmethod
+    def compact(data, fields):
+        profile = data.get('profile') or {}
+        return {field: data[field] if field in data else profile.get(field) for field in fields}
@@ -5,3 +5,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'conf.settings')
 
 application = get_asgi_application()
+
+from conf.preload import maybe_preload  # noqa: E402
+
+maybe_preload()
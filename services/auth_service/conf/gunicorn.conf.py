@@ -0,0 +1,19 @@
+# Gunicorn configuration for the preload-and-freeze startup mode:
+#   PRELOAD_ENABLED=True gunicorn -c conf/gunicorn.conf.py conf.wsgi
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+def when_ready(server):
+    server.log.info(f"Master {os.getpid()} ready, run `manage.py memory_report --master {os.getpid()}` for per-worker USS")
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges when metrics aggregate across processes
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
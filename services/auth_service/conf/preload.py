@@ -0,0 +1,121 @@
+"""
+Preload-and-freeze startup mode.
+
+With a pre-forking server (see conf/gunicorn.conf.py) the master process imports and warms
+the whole application once, then moves every object created so far into the GC's permanent
+generation. Forked workers inherit those pages and, because the collector no longer touches
+them, they stay shared copy-on-write instead of being duplicated in every worker.
+"""
+import gc
+import importlib
+import inspect
+import json
+import logging
+import os
+import time
+from django.conf import settings
+
+logger = logging.getLogger('apps.core')
+
+_done = False
+
+def _timed(report, name, func):
+    started = time.perf_counter()
+    try:
+        func()
+    except Exception as e:
+        logger.warning(f"Preload step {name} failed: {e}")
+        report['steps'][name] = {'error': str(e)}
+        return
+    report['steps'][name] = {'ms': round((time.perf_counter() - started) * 1000, 2)}
+
+def import_modules(report):
+    for module in settings.PRELOAD_MODULES:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logger.warning(f"Preload could not import {module}: {e}")
+            continue
+        report['imports'][module] = round((time.perf_counter() - started) * 1000, 2)
+
+def warm_urls():
+    from django.urls import get_resolver
+
+    resolver = get_resolver()
+    resolver.reverse_dict
+    for namespace in resolver.namespace_dict:
+        resolver.namespace_dict[namespace][1].reverse_dict
+
+def warm_serializers():
+    from rest_framework import serializers
+
+    for module_name in settings.PRELOAD_SERIALIZER_MODULES:
+        module = importlib.import_module(module_name)
+        for _, cls in inspect.getmembers(module, inspect.isclass):
+            if issubclass(cls, serializers.Serializer) and cls.__module__ == module.__name__:
+                try:
+                    cls().fields
+                except Exception as e:
+                    logger.debug(f"Could not warm serializer {cls.__name__}: {e}")
+
+def warm_password_validators():
+    from django.contrib.auth.password_validation import get_default_password_validators
+
+    # Loads validator data such as the common password list into the shared heap and maps
+    # the breached password index, whose pages the page cache shares anyway
+    get_default_password_validators()
+
+def warm_schema():
+    from apps.core import schema
+    schema.get_artifact()
+
+def warm_geo_index():
+    from django.db import connections
+    from apps.geo import index
+
+    try:
+        index.get_index()
+    finally:
+        # Workers must not inherit the master's database connections
+        connections.close_all()
+
+def preload():
+    """
+    Import and warm the application, then freeze the heap. Safe to call more than once.
+    """
+    global _done
+    if _done:
+        return None
+    _done = True
+
+    started = time.perf_counter()
+    # No collections while the shared heap is being built, so its pages are never rewritten
+    gc.disable()
+    report = {'pid': os.getpid(), 'imports': {}, 'steps': {}}
+    _timed(report, 'imports', lambda: import_modules(report))
+    _timed(report, 'urls', warm_urls)
+    _timed(report, 'serializers', warm_serializers)
+    _timed(report, 'password_validators', warm_password_validators)
+    _timed(report, 'schema', warm_schema)
+    _timed(report, 'geo_index', warm_geo_index)
+
+    gc.collect()
+    gc.freeze()
+    gc.enable()
+    report['frozen_objects'] = gc.get_freeze_count()
+    report['total_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    try:
+        with open(settings.PRELOAD_REPORT_PATH, 'w') as fh:
+            json.dump(report, fh, indent=2)
+    except OSError as e:
+        logger.warning(f"Could not write preload report: {e}")
+
+    logger.info(f"Preloaded application in {report['total_ms']} ms, froze {report['frozen_objects']} objects")
+    return report
+
+def maybe_preload():
+    if settings.PRELOAD_ENABLED:
+        return preload()
+    return None
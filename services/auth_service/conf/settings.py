@@ -32,19 +32,25 @@ THIRD_PARTY_APPS = [
 ]
 
 LOCAL_APPS = [
+    'apps.core',
     'apps.users',
-    'apps.authentication'
+    'apps.authentication',
+    'apps.geo',
 ]
 
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    'apps.core.middleware.MetricsMiddleware',
+    'apps.core.middleware.TracingMiddleware',
+    'apps.core.middleware.QueryBudgetMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.core.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -83,6 +89,22 @@ DATABASES = {
     }
 }
 
+PASSWORD_HASHERS = [
+    'apps.core.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+AUTHENTICATION_BACKENDS = [
+    'apps.users.backends.ArchiveAwareModelBackend',
+]
+
+# Sorted SHA-1 index of breached passwords, built with `manage.py build_breached_index`.
+# Without it BreachedPasswordValidator falls back to Django's common password list.
+BREACHED_PASSWORDS_INDEX = config('BREACHED_PASSWORDS_INDEX', default='')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -91,7 +113,7 @@ AUTH_PASSWORD_VALIDATORS = [
         'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
     },
     {
-        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+        'NAME': 'apps.users.password_validation.BreachedPasswordValidator',
     },
     {
         'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
@@ -100,23 +122,38 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.authentication.authentication.JWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',  
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'apps.core.renderers.FastJSONRenderer',
     ],
     'EXCEPTION_HANDLER': 'rest_framework.views.exception_handler',
+    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.UserRateThrottle',
+        'apps.users.throttling.UserRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'user': '1000/day', 
-    }
+    },
+    # Reverse proxies in front of the service. With 0 the client address (throttling, audit log)
+    # is REMOTE_ADDR and X-Forwarded-For, which clients can forge, is ignored. Behind N proxies it
+    # is the address the outermost proxy appended to X-Forwarded-For.
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
+}
+
+SPECTACULAR_SETTINGS = {
+    'TITLE': 'E-market Auth Service API',
+    'VERSION': '1.0.0',
+    'SERVE_INCLUDE_SCHEMA': False,
 }
 
+# Prebuilt OpenAPI schema served at api/schema/, regenerate with `manage.py build_schema`
+OPENAPI_SCHEMA_PATH = BASE_DIR / 'openapi' / 'schema.json'
+OPENAPI_SCHEMA_MAX_AGE = 3600
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -124,6 +161,8 @@ SIMPLE_JWT = {
 }
 
 AUTH_USER_MODEL = 'users.User'
+# Emails are unique through a constraint on lower(email), which auth.W004 does not recognise
+SILENCED_SYSTEM_CHECKS = ['auth.W004']
 
 CORS_ALLOW_ALL_ORIGINS = True 
 CORS_ALLOW_CREDENTIALS = True
@@ -139,6 +178,7 @@ CORS_ALLOW_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'idempotency-key',
     'origin',
     'user-agent',
     'x-csrftoken',
@@ -181,6 +221,14 @@ LOGGING = {
             'handlers': ['console'],
             'level': 'DEBUG',
         },
+        'apps.core': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'apps.geo': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
     },
     'root': {
         'handlers': ['console'],
@@ -188,7 +236,7 @@ LOGGING = {
     },
 }
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = 'apps.core.mail.SMTPEmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -201,31 +249,157 @@ EMAIL_TIMEOUT = 30
 EMAIL_CONNECTION_TIMEOUT = 10  
 EMAIL_READ_TIMEOUT = 30  
 
+# Adaptive limit on concurrent email sends across all workers (see apps/core/admission.py).
+# Sends slower than EMAIL_LATENCY_TARGET seconds shrink the limit; OTP requests that wait longer
+# than EMAIL_QUEUE_TIMEOUT for a slot get a 503 so a slow provider cannot tie up every worker.
+EMAIL_CONCURRENCY_MIN = config('EMAIL_CONCURRENCY_MIN', default=1, cast=int)
+EMAIL_CONCURRENCY_MAX = config('EMAIL_CONCURRENCY_MAX', default=16, cast=int)
+EMAIL_CONCURRENCY_INITIAL = config('EMAIL_CONCURRENCY_INITIAL', default=4, cast=int)
+EMAIL_LATENCY_TARGET = config('EMAIL_LATENCY_TARGET', default=2.0, cast=float)
+EMAIL_QUEUE_TIMEOUT = config('EMAIL_QUEUE_TIMEOUT', default=0.5, cast=float)
+
 # Fallback email backend for development
 if DEBUG and not EMAIL_HOST_USER:
     EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
     logger.warning("Email credentials not configured, using console backend")
 
-# Cache configuration with fallback
-try:
-    CACHES = {
-        'default': {
-            'BACKEND': 'django_redis.cache.RedisCache',
-            'LOCATION': 'redis://127.0.0.1:6379/1',
-        }
-    }
-except ImportError:
-    # Fallback to local memory cache if Redis is not available
-    CACHES = {
-        'default': {
-            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-            'LOCATION': 'unique-snowflake',
-        }
-    }
+# Two-tier cache: a bounded in-process LRU in front of Redis, with a circuit breaker so an
+# unhealthy Redis fails fast. OTP and verification keys must be consistent across workers and
+# are never served from the local tier.
+CACHES = {
+    'default': {
+        'BACKEND': 'apps.core.cache.TwoTierCache',
+        'OPTIONS': {
+            'L2': 'redis',
+            'L1_MAX_ENTRIES': config('CACHE_L1_MAX_ENTRIES', default=10000, cast=int),
+            'L1_TIMEOUT': config('CACHE_L1_TIMEOUT', default=5, cast=int),
+            'BREAKER_FAILURES': 3,
+            'BREAKER_RESET_TIMEOUT': 10,
+            'DEFAULT_POLICY': 'cached',
+            'KEY_POLICIES': {
+                'otp_': 'strong',
+                'otp_attempts:': 'strong',
+                'verified_': 'strong',
+                'funnel:': 'strong',
+                'admission:': 'strong',
+                'idempotency:': 'strong',
+                'user_': 'cached',
+                # Revocation must reach every worker at once, so no copies in L1
+                'perms_version_': 'strong',
+                'throttle_': 'strong',
+            },
+        },
+    },
+    'redis': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': config('REDIS_URL', default='redis://127.0.0.1:6379/1'),
+        'OPTIONS': {
+            'SOCKET_CONNECT_TIMEOUT': 0.5,
+            'SOCKET_TIMEOUT': 0.5,
+        },
+    },
+}
 
 CELERY_BROKER_URL = config('CELERY_BROKER_URL')
 CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND')
 
+# Prometheus metrics, set PROMETHEUS_MULTIPROC_DIR in the environment to aggregate across workers.
+# /metrics answers only with METRICS_AUTH_TOKEN as a bearer token, or to anyone when DEBUG is on.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_AUTH_TOKEN = config('METRICS_AUTH_TOKEN', default='')
+
+# Request tracing with W3C traceparent propagation, TRACING_EXPORTER is one of none/file/otlp
+TRACING_ENABLED = config('TRACING_ENABLED', default=False, cast=bool)
+TRACING_SAMPLE_RATE = config('TRACING_SAMPLE_RATE', default=0.1, cast=float)
+TRACING_EXPORTER = config('TRACING_EXPORTER', default='none')
+TRACING_FILE_PATH = config('TRACING_FILE_PATH', default=str(BASE_DIR / 'traces.jsonl'))
+TRACING_OTLP_ENDPOINT = config('TRACING_OTLP_ENDPOINT', default='http://localhost:4318/v1/traces')
+TRACING_SERVICE_NAME = config('TRACING_SERVICE_NAME', default='auth_service')
+
+# Per-view SQL query budgets, see apps/core/querybudget.py: off, warn (log the SQL, for staging) or raise.
+# The test runner always raises.
+QUERY_BUDGET_MODE = config('QUERY_BUDGET_MODE', default='off')
+TEST_RUNNER = 'apps.core.querybudget.QueryBudgetTestRunner'
+
+# On-demand request profiling, triggered by a signed X-Profile-Token header (see `manage.py profiling_token`)
+# or ?_profile=1 for staff sessions, plus automatic sampling that keeps the slowest requests per view
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=True, cast=bool)
+PROFILING_INTERVAL = config('PROFILING_INTERVAL', default=0.002, cast=float)
+PROFILING_MAX_SAMPLES = config('PROFILING_MAX_SAMPLES', default=20000, cast=int)
+PROFILING_TOKEN_MAX_AGE = config('PROFILING_TOKEN_MAX_AGE', default=3600, cast=int)
+PROFILING_KEEP = config('PROFILING_KEEP', default=200, cast=int)
+PROFILING_AUTO_SAMPLE_RATE = config('PROFILING_AUTO_SAMPLE_RATE', default=0.0, cast=float)
+PROFILING_AUTO_MIN_MS = config('PROFILING_AUTO_MIN_MS', default=500, cast=float)
+PROFILING_AUTO_KEEP_PER_VIEW = config('PROFILING_AUTO_KEEP_PER_VIEW', default=5, cast=int)
+
+# Preload-and-freeze startup mode for pre-forking servers (see conf/preload.py and conf/gunicorn.conf.py)
+PRELOAD_ENABLED = config('PRELOAD_ENABLED', default=False, cast=bool)
+PRELOAD_MODULES = [
+    'rest_framework.serializers',
+    'rest_framework_simplejwt.authentication',
+    'rest_framework_simplejwt.tokens',
+    'drf_spectacular.views',
+    'django_redis.cache',
+    'requests',
+    'PIL.Image',
+    'prometheus_client',
+    'orjson',
+]
+PRELOAD_SERIALIZER_MODULES = [
+    'apps.users.serializers',
+    'apps.authentication.serializers',
+]
+PRELOAD_REPORT_PATH = config('PRELOAD_REPORT_PATH', default='/tmp/auth_service_preload.json')
+
+# last_seen/last_login are rounded down to ACTIVITY_GRANULARITY seconds, buffered per worker and written
+# in one batched UPDATE per database every ACTIVITY_FLUSH_INTERVAL seconds, see apps/users/activity.py
+ACTIVITY_GRANULARITY = config('ACTIVITY_GRANULARITY', default=300, cast=int)
+ACTIVITY_FLUSH_INTERVAL = config('ACTIVITY_FLUSH_INTERVAL', default=30.0, cast=float)
+ACTIVITY_BUFFER_SIZE = config('ACTIVITY_BUFFER_SIZE', default=10000, cast=int)
+
+# Authentication audit log, buffered per worker and inserted in batches, see apps/users/audit.py.
+# Run `manage.py audit_partitions` daily to create upcoming partitions and drop expired ones.
+AUDIT_FLUSH_INTERVAL = config('AUDIT_FLUSH_INTERVAL', default=1.0, cast=float)
+AUDIT_BATCH_SIZE = config('AUDIT_BATCH_SIZE', default=1000, cast=int)
+AUDIT_BUFFER_SIZE = config('AUDIT_BUFFER_SIZE', default=100000, cast=int)
+AUDIT_RETENTION_DAYS = config('AUDIT_RETENTION_DAYS', default=180, cast=int)
+AUDIT_QUERY_MAX_DAYS = 31
+AUDIT_QUERY_MAX_LIMIT = 500
+
+# How long responses to requests with an Idempotency-Key header are replayed, see apps/core/idempotency.py
+IDEMPOTENCY_TTL = config('IDEMPOTENCY_TTL', default=24 * 3600, cast=int)
+
+# Shared secrets other e-market services send in the X-Service-Token header
+INTERNAL_SERVICE_TOKENS = [token for token in config('INTERNAL_SERVICE_TOKENS', default='').split(',') if token]
+
+# Transactional outbox for user lifecycle events, delivered by `manage.py relay_outbox`
+OUTBOX_WEBHOOK_URLS = [url for url in config('OUTBOX_WEBHOOK_URLS', default='').split(',') if url]
+OUTBOX_RELAY_BATCH_SIZE = config('OUTBOX_RELAY_BATCH_SIZE', default=100, cast=int)
+# Failed deliveries are retried after 2 ** attempts seconds, at most OUTBOX_RELAY_MAX_BACKOFF
+OUTBOX_RELAY_MAX_BACKOFF = config('OUTBOX_RELAY_MAX_BACKOFF', default=3600, cast=int)
+OUTBOX_FEED_MAX_LIMIT = 500
+
+# Public vendor directory, see apps/users/vendors.py. Vendor changes invalidate cached pages at once;
+# profile edits (country, avatar) show up after VENDOR_DIRECTORY_CACHE_TIMEOUT seconds.
+VENDOR_DIRECTORY_CACHE_TIMEOUT = config('VENDOR_DIRECTORY_CACHE_TIMEOUT', default=60, cast=int)
+VENDOR_DIRECTORY_MAX_LIMIT = 100
+
+# Optional sharding of users across databases by email hash, see apps/users/sharding.py.
+# Each alias other than `default` gets its own database, configured by DB_NAME_<ALIAS> / DB_HOST_<ALIAS>.
+USER_SHARDING_ENABLED = config('USER_SHARDING_ENABLED', default=False, cast=bool)
+USER_SHARDS = [alias for alias in config('USER_SHARDS', default='default').split(',') if alias]
+# One above the highest user id issued before sharding was enabled; ids below it are located by probing the shards
+USER_LEGACY_ID_LIMIT = config('USER_LEGACY_ID_LIMIT', default=1 << 23, cast=int)
+for _alias in USER_SHARDS:
+    if _alias not in DATABASES:
+        DATABASES[_alias] = {
+            **DATABASES['default'],
+            'NAME': config(f'DB_NAME_{_alias.upper()}'),
+            'HOST': config(f'DB_HOST_{_alias.upper()}', default=DATABASES['default']['HOST']),
+            'PORT': config(f'DB_PORT_{_alias.upper()}', default=DATABASES['default']['PORT']),
+        }
+DATABASE_ROUTERS = ['apps.users.sharding.UserShardRouter']
+
 GOOGLE_CLIENT_ID = config('GOOGLE_CLIENT_ID')
 GOOGLE_CLIENT_SECRET = config('GOOGLE_CLIENT_SECRET')
 GOOGLE_REDIRECT_URL = config('GOOGLE_REDIRECT_URI')
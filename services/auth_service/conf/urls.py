@@ -2,21 +2,24 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from drf_spectacular.views import (
-    SpectacularAPIView,
     SpectacularSwaggerView,
     SpectacularRedocView,
 )
 from django.conf.urls.static import static
+from apps.core.views import metrics_view, schema_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     
     path('api/users/', include('apps.users.urls')),
     path('api/authentication/', include('apps.authentication.urls')),
+    path('api/geo/', include('apps.geo.urls')),
     
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
+    path('api/schema/', schema_view, name='schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),  
+
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG: